@@ -0,0 +1,654 @@
+"""
+Benchmark da API sobre um banco sintetico.
+
+Popula o banco com usuarios, salas, reservas e series, sobe a aplicacao no
+proprio processo e dispara requisicoes concorrentes em cada rota via
+httpx.ASGITransport. O resultado, com vazao e latencias p50/p95/p99 por
+rota, e gravado em JSON para comparar versoes.
+
+    python -m benchmarks.benchmark --reservas 1000000 --saida atual.json
+
+Sem --uri usa um SQLite em --banco, recriado a cada execucao a menos que
+--manter-banco seja passado.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from datetime import UTC, datetime, timedelta
+from itertools import batched, count
+from pathlib import Path
+from typing import Any
+
+INICIO = datetime(2026, 1, 1)
+# Cada sala recebe uma reserva a cada PASSO, entao elas nunca se sobrepoem
+PASSO = timedelta(hours=2)
+SENHA = "benchmark"
+LOTE = 10_000
+
+Requisicao = tuple[str, dict[str, Any]]
+
+
+class Cenario:
+    """Uma rota e como montar cada requisicao para ela."""
+
+    def __init__(
+        self,
+        metodo: str,
+        rota: str,
+        montar: Callable[[random.Random], Requisicao],
+        nome: str | None = None,
+    ) -> None:
+        self.metodo = metodo
+        self.rota = rota
+        self.montar = montar
+        self.nome = nome or f"{metodo} {rota}"
+
+
+class Dados:
+    """Tamanho do banco e as faixas de datas usadas pelos cenarios."""
+
+    def __init__(self, usuarios: int, salas: int, reservas: int) -> None:
+        self.usuarios = usuarios
+        self.salas = salas
+        self.reservas = reservas
+        self.por_sala = -(-reservas // salas) if salas else 0
+        self.fim_reservas = INICIO + self.por_sala * PASSO
+        # Series e novas reservas ficam depois das reservas geradas
+        self.inicio_series = self.fim_reservas + timedelta(days=1)
+        self.inicio_escritas = self.inicio_series + timedelta(days=400)
+        self.series = 0
+
+
+def argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark da API sobre um banco sintetico."
+    )
+    parser.add_argument("--uri", help="DATABASE_URI, no lugar do SQLite")
+    parser.add_argument("--banco", default="benchmark.db")
+    parser.add_argument("--manter-banco", action="store_true")
+    parser.add_argument("--usuarios", type=int, default=100)
+    parser.add_argument("--salas", type=int, default=200)
+    parser.add_argument("--reservas", type=int, default=100_000)
+    parser.add_argument("--series", type=int, default=50)
+    parser.add_argument("--requisicoes", type=int, default=500)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--aquecimento", type=int, default=20)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument(
+        "--rotas", nargs="*", help="So os cenarios com algum desses trechos"
+    )
+    parser.add_argument("--saida", default="benchmark.json")
+    return parser.parse_args()
+
+
+def configurar_ambiente(args: argparse.Namespace) -> None:
+    # Precisa rodar antes de importar src, que le o ambiente na importacao
+    if args.uri is None:
+        banco = Path(args.banco)
+        if not args.manter_banco:
+            for arquivo in banco.parent.glob(f"{banco.name}*"):
+                arquivo.unlink()
+        os.environ["DATABASE_URI"] = f"sqlite:///{banco}"
+    else:
+        os.environ["DATABASE_URI"] = args.uri
+
+    os.environ.pop("ASYNC_DATABASE_URI", None)
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+
+
+def contar() -> tuple[int, int, int]:
+    from sqlalchemy import func
+    from sqlmodel import Session, select
+
+    from src.database import engine
+    from src.models import Reserva, Sala, Usuario
+
+    with Session(engine) as session:
+        return (
+            session.exec(select(func.count()).select_from(Usuario)).one(),
+            session.exec(select(func.count()).select_from(Sala)).one(),
+            session.exec(select(func.count()).select_from(Reserva)).one(),
+        )
+
+
+def popular(args: argparse.Namespace, aleatorio: random.Random) -> Dados:
+    from sqlalchemy import insert
+
+    from src.auth import password_context
+    from src.database import SQLModel, engine
+    from src.models import Reserva, Sala, SerieReserva, Usuario
+
+    SQLModel.metadata.create_all(engine)
+
+    existentes = contar()
+    if any(existentes):
+        if not args.manter_banco:
+            sys.exit("O banco ja tem dados, use --manter-banco para reusar")
+        dados = Dados(*existentes)
+        dados.series = min(args.series, 10 * dados.salas)
+        return dados
+
+    dados = Dados(args.usuarios, args.salas, args.reservas)
+    dados.series = min(args.series, 10 * dados.salas)
+    senha = password_context.hash(SENHA)
+    capacidades = [aleatorio.randint(5, 100) for _ in range(dados.salas)]
+
+    with engine.begin() as conexao:
+        conexao.execute(
+            insert(Usuario),
+            [
+                {
+                    "usuario": f"usuario{i}",
+                    "email": f"usuario{i}@benchmark.local",
+                    "senha": senha,
+                }
+                for i in range(dados.usuarios)
+            ],
+        )
+        conexao.execute(
+            insert(Sala),
+            [
+                {"nome": f"Sala {i}", "capacidade": capacidade}
+                for i, capacidade in enumerate(capacidades)
+            ],
+        )
+
+    def reservas() -> Iterator[dict[str, Any]]:
+        for i in range(dados.reservas):
+            sala = i % dados.salas
+            inicio = (
+                INICIO
+                + i // dados.salas * PASSO
+                + timedelta(minutes=15 * aleatorio.randrange(4))
+            )
+            yield {
+                "sala_reservada": sala + 1,
+                "data_inicial": inicio,
+                "data_final": inicio
+                + timedelta(minutes=30 * aleatorio.randint(1, 2)),
+                "descricao": f"Reuniao {i}",
+                "tipo_evento": aleatorio.choice(["reuniao", "aula", "evento"]),
+                "quantidade_pessoas": aleatorio.randint(1, capacidades[sala]),
+                "items": "projetor",
+                "reservado_por": aleatorio.randint(1, dados.usuarios),
+            }
+
+    for lote in batched(reservas(), LOTE):
+        with engine.begin() as conexao:
+            conexao.execute(insert(Reserva), list(lote))
+
+    # Ate dez series semanais por sala, cada uma num horario diferente
+    with engine.begin() as conexao:
+        conexao.execute(
+            insert(SerieReserva),
+            [
+                {
+                    "sala_reservada": i % dados.salas + 1,
+                    "data_inicial": (
+                        inicio := dados.inicio_series
+                        + timedelta(hours=8 + i // dados.salas)
+                    ),
+                    "data_final": inicio + timedelta(hours=1),
+                    "descricao": f"Serie {i}",
+                    "tipo_evento": "aula",
+                    "quantidade_pessoas": 1,
+                    "items": "",
+                    "intervalo_dias": 7,
+                    "repetir_ate": inicio + timedelta(weeks=52),
+                    "reservado_por": 1,
+                }
+                for i in range(dados.series)
+            ],
+        )
+
+    return dados
+
+
+def cenarios(dados: Dados) -> list[Cenario]:
+    emails = count()
+    reserva = {
+        "descricao": "Benchmark",
+        "tipo_evento": "reuniao",
+        "quantidade_pessoas": 1,
+        "items": "",
+    }
+
+    def sala(aleatorio: random.Random) -> int:
+        return aleatorio.randint(1, dados.salas)
+
+    def email(aleatorio: random.Random) -> str:
+        return f"usuario{aleatorio.randrange(dados.usuarios)}@benchmark.local"
+
+    def janela(aleatorio: random.Random, duracao: timedelta) -> dict[str, str]:
+        # Alinhada em 15 minutos, dentro do periodo das reservas geradas
+        limite = max(1, (dados.fim_reservas - INICIO - duracao) // PASSO)
+        inicio = (
+            INICIO
+            + aleatorio.randrange(limite) * PASSO
+            + timedelta(minutes=15 * aleatorio.randrange(4))
+        )
+        return {
+            "data_inicial": inicio.isoformat(),
+            "data_final": (inicio + duracao).isoformat(),
+        }
+
+    def nova_reserva(aleatorio: random.Random) -> dict[str, Any]:
+        inicio = dados.inicio_escritas + timedelta(
+            minutes=15 * aleatorio.randrange(4 * 24 * 3650)
+        )
+        return {
+            **reserva,
+            "sala_reservada": sala(aleatorio),
+            "data_inicial": inicio.isoformat(),
+            "data_final": (inicio + timedelta(minutes=30)).isoformat(),
+        }
+
+    def ocorrencia(aleatorio: random.Random) -> Requisicao:
+        indice = aleatorio.randrange(max(1, dados.series))
+        comeco = (
+            dados.inicio_series
+            + timedelta(hours=8 + indice // dados.salas)
+            + timedelta(weeks=aleatorio.randrange(52))
+        )
+        return (
+            f"/api/v1/series/{indice + 1}/excecoes",
+            {"params": {"data_inicial": comeco.isoformat()}},
+        )
+
+    def importacao(aleatorio: random.Random) -> Requisicao:
+        linhas = "".join(
+            json.dumps(nova_reserva(aleatorio)) + "\n" for _ in range(10)
+        )
+        return (
+            "/api/v1/reservas/importar",
+            {
+                "content": linhas,
+                "headers": {"Content-Type": "application/x-ndjson"},
+            },
+        )
+
+    def registro(_aleatorio: random.Random) -> Requisicao:
+        numero = next(emails)
+        return (
+            "/api/v1/usuarios/registrar",
+            {
+                "json": {
+                    "usuario": f"novo{numero}",
+                    "email": f"novo{numero}@benchmark.local",
+                    "senha": SENHA,
+                }
+            },
+        )
+
+    semana = timedelta(weeks=1)
+
+    return [
+        Cenario("GET", "/api/v1/salas/", lambda _a: ("/api/v1/salas/", {})),
+        Cenario(
+            "GET",
+            "/api/v1/salas/{id_sala}",
+            lambda a: (f"/api/v1/salas/{sala(a)}", {}),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/salas/disponiveis",
+            lambda a: (
+                "/api/v1/salas/disponiveis",
+                {"params": janela(a, timedelta(hours=1))},
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/salas/horarios-livres",
+            lambda a: (
+                "/api/v1/salas/horarios-livres",
+                {
+                    "params": {
+                        **janela(a, timedelta(days=2)),
+                        "duracao_minutos": 90,
+                        "hora_inicio": "08:00",
+                        "hora_fim": "18:00",
+                    }
+                },
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/salas/ocupacao",
+            lambda a: (
+                "/api/v1/salas/ocupacao",
+                {"params": {**janela(a, semana), "granularidade": "dia"}},
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/salas/cache",
+            lambda _a: ("/api/v1/salas/cache", {}),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/reservas/",
+            lambda _a: ("/api/v1/reservas/", {"params": {"count": 50}}),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/reservas/",
+            lambda a: (
+                "/api/v1/reservas/",
+                {"params": {**janela(a, timedelta(days=1)), "count": 50}},
+            ),
+            "GET /api/v1/reservas/ (periodo)",
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/reservas/{id_reserva}",
+            lambda a: (
+                f"/api/v1/reservas/{a.randint(1, dados.reservas)}",
+                {},
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/reservas/exportar",
+            lambda a: (
+                "/api/v1/reservas/exportar",
+                {"params": janela(a, timedelta(days=1))},
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/series/",
+            lambda _a: ("/api/v1/series/", {"params": {"count": 50}}),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/series/ocorrencias",
+            lambda a: (
+                "/api/v1/series/ocorrencias",
+                {
+                    "params": {
+                        "data_inicial": (
+                            dados.inicio_series
+                            + timedelta(weeks=a.randrange(52))
+                        ).isoformat(),
+                        "data_final": (
+                            dados.inicio_series + timedelta(weeks=53)
+                        ).isoformat(),
+                    }
+                },
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/series/{id_serie}",
+            lambda a: (
+                f"/api/v1/series/{a.randint(1, max(1, dados.series))}",
+                {},
+            ),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/usuarios/",
+            lambda _a: ("/api/v1/usuarios/", {"params": {"count": 50}}),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/usuarios/reservas",
+            lambda _a: ("/api/v1/usuarios/reservas", {"params": {"count": 50}}),
+        ),
+        Cenario(
+            "GET",
+            "/api/v1/usuarios/{username}",
+            lambda a: (
+                f"/api/v1/usuarios/{email(a)}",
+                {},
+            ),
+        ),
+        Cenario(
+            "POST",
+            "/api/v1/usuarios/login",
+            lambda a: (
+                "/api/v1/usuarios/login",
+                {
+                    "json": {
+                        "email": email(a),
+                        "senha": SENHA,
+                    }
+                },
+            ),
+        ),
+        Cenario("POST", "/api/v1/usuarios/registrar", registro),
+        Cenario(
+            "POST",
+            "/api/v1/reservas/",
+            lambda a: ("/api/v1/reservas/", {"json": nova_reserva(a)}),
+        ),
+        Cenario(
+            "PATCH",
+            "/api/v1/reservas/{id_reserva}",
+            lambda a: (
+                f"/api/v1/reservas/{a.randint(1, dados.reservas)}",
+                {"json": {"descricao": f"Editada {a.random()}"}},
+            ),
+        ),
+        Cenario("POST", "/api/v1/reservas/importar", importacao),
+        Cenario(
+            "POST",
+            "/api/v1/salas/",
+            lambda a: (
+                "/api/v1/salas/",
+                {"json": {"nome": "Nova sala", "capacidade": a.randint(5, 50)}},
+            ),
+        ),
+        Cenario(
+            "PATCH",
+            "/api/v1/salas/{id_sala}",
+            lambda a: (
+                f"/api/v1/salas/{sala(a)}",
+                {"json": {"capacidade": a.randint(5, 100)}},
+            ),
+        ),
+        Cenario(
+            "POST",
+            "/api/v1/series/",
+            lambda a: (
+                "/api/v1/series/",
+                {
+                    "json": {
+                        **nova_reserva(a),
+                        "intervalo_dias": 7,
+                        "repetir_ate": (
+                            dados.inicio_escritas + timedelta(days=3700)
+                        ).isoformat(),
+                    }
+                },
+            ),
+        ),
+        Cenario("POST", "/api/v1/series/{id_serie}/excecoes", ocorrencia),
+    ]
+
+
+def resumir(
+    cenario: Cenario,
+    latencias: list[float],
+    status: Counter[int],
+    duracao: float,
+) -> dict[str, Any]:
+    milissegundos = sorted(latencia * 1000 for latencia in latencias)
+    percentis = (
+        statistics.quantiles(milissegundos, n=100, method="inclusive")
+        if len(milissegundos) > 1
+        else milissegundos * 99
+    )
+
+    return {
+        "nome": cenario.nome,
+        "metodo": cenario.metodo,
+        "rota": cenario.rota,
+        "requisicoes": len(latencias),
+        "erros": sum(n for codigo, n in status.items() if codigo >= 500),
+        "status": {str(codigo): n for codigo, n in sorted(status.items())},
+        "duracao_s": round(duracao, 4),
+        "requisicoes_por_s": round(len(latencias) / duracao, 2),
+        "latencia_ms": {
+            "p50": round(percentis[49], 3),
+            "p95": round(percentis[94], 3),
+            "p99": round(percentis[98], 3),
+            "media": round(statistics.fmean(milissegundos), 3),
+            "max": round(milissegundos[-1], 3),
+        },
+    }
+
+
+async def medir(
+    cliente: Any,
+    cenario: Cenario,
+    requisicoes: int,
+    concorrencia: int,
+    aleatorio: random.Random,
+) -> tuple[list[float], Counter[int], float]:
+    latencias: list[float] = []
+    status: Counter[int] = Counter()
+    restantes = requisicoes
+
+    async def trabalhador() -> None:
+        nonlocal restantes
+        while restantes > 0:
+            restantes -= 1
+            url, opcoes = cenario.montar(aleatorio)
+            comeco = time.perf_counter()
+            resposta = await cliente.request(cenario.metodo, url, **opcoes)
+            latencias.append(time.perf_counter() - comeco)
+            status[resposta.status_code] += 1
+
+    comeco = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+
+    return latencias, status, time.perf_counter() - comeco
+
+
+async def executar(
+    args: argparse.Namespace, dados: Dados, aleatorio: random.Random
+) -> dict[str, Any]:
+    import httpx
+    from fastapi.routing import APIRoute
+
+    from src.app import app, lifespan
+    from src.auth import auth
+    from src.database import async_engine
+
+    todos = cenarios(dados)
+    rotas = {
+        (metodo, rota.path)
+        for rota in app.routes
+        if isinstance(rota, APIRoute) and rota.path.startswith("/api/")
+        for metodo in rota.methods
+    }
+    desconhecidos = [
+        cenario.nome
+        for cenario in todos
+        if (cenario.metodo, cenario.rota) not in rotas
+    ]
+    if desconhecidos:
+        sys.exit(f"Cenarios para rotas inexistentes: {desconhecidos}")
+
+    cobertas = {(cenario.metodo, cenario.rota) for cenario in todos}
+    selecionados = [
+        cenario
+        for cenario in todos
+        if not args.rotas
+        or any(trecho in cenario.nome for trecho in args.rotas)
+    ]
+
+    token = auth.create_access_token(uid="1")
+    # Excecoes da aplicacao viram 500, como num servidor de verdade
+    transporte = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    resultados = []
+
+    comeco = time.perf_counter()
+    async with lifespan(app):
+        inicializacao = time.perf_counter() - comeco
+
+        async with httpx.AsyncClient(
+            transport=transporte,
+            base_url="http://benchmark",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=None,
+        ) as cliente:
+            for cenario in selecionados:
+                await medir(cliente, cenario, args.aquecimento, 1, aleatorio)
+                latencias, status, duracao = await medir(
+                    cliente,
+                    cenario,
+                    args.requisicoes,
+                    args.concorrencia,
+                    aleatorio,
+                )
+                resultado = resumir(cenario, latencias, status, duracao)
+                resultados.append(resultado)
+                print(
+                    f"{resultado['nome']:<45} "
+                    f"{resultado['requisicoes_por_s']:>9.1f} req/s  "
+                    f"p50 {resultado['latencia_ms']['p50']:>8.2f} ms  "
+                    f"p99 {resultado['latencia_ms']['p99']:>8.2f} ms",
+                    file=sys.stderr,
+                )
+
+    await async_engine.dispose()
+
+    return {
+        "inicializacao_s": round(inicializacao, 4),
+        "rotas": resultados,
+        "sem_cenario": sorted(
+            f"{metodo} {rota}" for metodo, rota in rotas - cobertas
+        ),
+    }
+
+
+def main() -> None:
+    args = argumentos()
+    configurar_ambiente(args)
+    aleatorio = random.Random(args.semente)
+
+    comeco = time.perf_counter()
+    dados = popular(args, aleatorio)
+    populacao = time.perf_counter() - comeco
+
+    from src.database import engine
+
+    resultado = {
+        "gerado_em": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "banco": {
+            "dialeto": engine.dialect.name,
+            "usuarios": dados.usuarios,
+            "salas": dados.salas,
+            "reservas": dados.reservas,
+            "series": dados.series,
+            "populacao_s": round(populacao, 4),
+        },
+        "parametros": {
+            "requisicoes": args.requisicoes,
+            "concorrencia": args.concorrencia,
+            "aquecimento": args.aquecimento,
+            "semente": args.semente,
+        },
+        **asyncio.run(executar(args, dados, aleatorio)),
+    }
+
+    Path(args.saida).write_text(json.dumps(resultado, indent=2) + "\n")
+    print(f"Resultado gravado em {args.saida}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Impedindo reservas sobrepostas da mesma sala no Postgres.
+
+Revision ID: c7a1f4e9b2d8
+Revises: b3e9d2a41c57
+Create Date: 2026-10-18 10:03:17.244918
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c7a1f4e9b2d8"
+down_revision: str | None = "b3e9d2a41c57"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # No SQLite a verificacao e serializada com BEGIN IMMEDIATE pela API
+    if op.get_context().dialect.name != "postgresql":
+        return
+
+    # As colunas sao "timestamp without time zone", por isso tsrange
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        "ALTER TABLE reserva ADD CONSTRAINT ex_reserva_sala_periodo "
+        "EXCLUDE USING gist ("
+        "sala_reservada WITH =, "
+        "tsrange(data_inicial, data_final) WITH &&"
+        ")"
+    )
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != "postgresql":
+        return
+
+    op.execute(
+        "ALTER TABLE reserva DROP CONSTRAINT IF EXISTS ex_reserva_sala_periodo"
+    )
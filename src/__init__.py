@@ -0,0 +1,4 @@
+from src import inicializacao
+
+# Antes de qualquer outro modulo do projeto, para medir as importacoes
+inicializacao.instalar()
@@ -1,10 +1,347 @@
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Any
+
+import anyio
+from environs import env
+from pydantic import ValidationError
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    func,
+    or_,
+    text,
+    true,
+    tuple_,
+)
+from sqlalchemy.orm import Session
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette_admin.contrib.sqla.helpers import OPERATORS, build_query
 from starlette_admin.contrib.sqlmodel import Admin, ModelView
+from starlette_admin.exceptions import FormValidationError
+from starlette_admin.fields import IntegerField
 
-from src.database import engine
+from src.cache import cache_salas
+from src.database import async_engine, bloquear_escrita, engine
+from src.disponibilidade import indice
 from src.models import Reserva, Sala, Usuario
+from src.routes.reservas import salvar_sem_conflito
+
+env.read_env(".env")
+
+ADMIN_JANELA_DIAS = env.int("ADMIN_JANELA_DIAS", 30)
+ADMIN_CONTAGEM_MAXIMA = env.int("ADMIN_CONTAGEM_MAXIMA", 10_000)
+ADMIN_LIMITE = env.int("ADMIN_LIMITE", 100)
+
+
+def prefixo(coluna: Any, termo: str) -> ColumnElement[bool]:
+    # Equivale a LIKE 'termo%', mas como intervalo usa o indice da coluna
+    return (col(coluna) >= termo) & (col(coluna) < termo + "\U0010ffff")
+
+
+def campos_filtro(where: dict[str, Any]) -> set[str]:
+    campos = set()
+    for chave, valor in where.items():
+        if chave in {"and", "or"}:
+            for condicao in valor:
+                campos |= campos_filtro(condicao)
+        elif chave not in OPERATORS:
+            campos.add(chave)
+    return campos
+
+
+class ModelViewIndexada(ModelView):
+    """
+    ModelView para tabelas grandes, que so consulta o banco pelos indices.
+
+    O starlette_admin pede as paginas por skip e limit. Na ordem de
+    chave_paginacao, cada pedido acha primeiro a chave do registro anterior
+    a pagina, com um OFFSET que so le o indice, e busca a pagina a partir
+    dela. A chave vem do banco a cada pedido, entao insercoes e remocoes
+    nao deixam a pagina apontar para um registro que mudou. Sem filtro a
+    listagem mostra so os registros de coluna_janela dos ultimos
+    ADMIN_JANELA_DIAS em diante, e o total e estimado.
+    """
+
+    chave_paginacao: tuple[str, ...] = ("id",)
+    coluna_janela: str | None = None
+    # Busca, filtros e ordenacao ficam restritos as colunas indexadas
+    searchable_fields: Sequence[str] = ("id",)
+    sortable_fields: Sequence[str] = ("id",)
+    fields_default_sort: Sequence[tuple[str, bool]] = (("id", True),)
+
+    async def executar(self, request: Request, consulta: Select) -> Any:
+        session: Session = request.state.session
+        return await anyio.to_thread.run_sync(session.execute, consulta)
+
+    def filtro(self, where: dict[str, Any] | None) -> ColumnElement[bool]:
+        if where is not None:
+            if campos_filtro(where) - set(self.searchable_fields):
+                raise HTTPException(
+                    400,
+                    "Filtros so podem usar os campos indexados: "
+                    + ", ".join(self.searchable_fields),
+                )
+            return build_query(where, self.model)
+
+        if self.coluna_janela is None:
+            return true()
+
+        inicio = datetime.now() - timedelta(days=ADMIN_JANELA_DIAS)
+        return col(getattr(self.model, self.coluna_janela)) >= inicio
+
+    async def condicao(
+        self, request: Request, where: dict[str, Any] | str | None
+    ) -> ColumnElement[bool]:
+        if where is None or isinstance(where, dict):
+            return self.filtro(where)
+        # O starlette_admin passa a busca por json.loads, entao "7" vira 7
+        return self.get_search_query(request, str(where))
+
+    async def count(
+        self,
+        request: Request,
+        where: dict[str, Any] | str | None = None,
+    ) -> int:
+        if where is None and self.coluna_janela is None:
+            return await self.estimar_total(request)
+
+        # Para de contar no limite, a paginacao so precisa de uma ordem de
+        # grandeza
+        amostra = (
+            select(col(getattr(self.model, self.chave_paginacao[-1])))
+            .where(await self.condicao(request, where))
+            .limit(ADMIN_CONTAGEM_MAXIMA)
+            .subquery()
+        )
+        return (
+            await self.executar(
+                request, select(func.count()).select_from(amostra)
+            )
+        ).scalar_one()
+
+    async def estimar_total(self, request: Request) -> int:
+        tabela = self.model.__table__
+        if engine.dialect.name == "postgresql":
+            estimativa = (
+                await self.executar(
+                    request,
+                    select(text("reltuples::bigint"))
+                    .select_from(text("pg_class"))
+                    .where(text("oid = to_regclass(:tabela)"))
+                    .params(tabela=tabela.name),
+                )
+            ).scalar()
+            if estimativa is not None and estimativa >= 0:
+                return int(estimativa)
+
+        # O maior id so superestima quando ha registros apagados
+        return (
+            await self.executar(
+                request, select(func.coalesce(func.max(tabela.c.id), 0))
+            )
+        ).scalar_one()
+
+    async def find_all(
+        self,
+        request: Request,
+        skip: int = 0,
+        limit: int = 100,
+        where: dict[str, Any] | str | None = None,
+        order_by: list[str] | None = None,
+    ) -> Sequence[Any]:
+        limit = min(limit, ADMIN_LIMITE) if limit > 0 else ADMIN_LIMITE
+        pedidos = [item.split() for item in order_by or []]
+        ordem = [
+            (campo, direcao.lower())
+            for campo, direcao in (
+                pedido for pedido in pedidos if len(pedido) == 2
+            )
+            if campo in self.sortable_fields
+            and direcao.lower() in {"asc", "desc"}
+        ] or [(campo, "desc") for campo in self.chave_paginacao]
+
+        condicao = await self.condicao(request, where)
+        consulta = self.get_list_query().where(condicao)
+
+        campos = tuple(campo for campo, _ in ordem)
+        direcoes = {direcao for _, direcao in ordem}
+        if skip > 0 and campos == self.chave_paginacao and len(direcoes) == 1:
+            colunas = [col(getattr(self.model, campo)) for campo in campos]
+            decrescente = "desc" in direcoes
+            anterior = (
+                await self.executar(
+                    request,
+                    select(*colunas)
+                    .where(condicao)
+                    .order_by(
+                        *(
+                            coluna.desc() if decrescente else coluna.asc()
+                            for coluna in colunas
+                        )
+                    )
+                    .offset(skip - 1)
+                    .limit(1),
+                )
+            ).first()
+            if anterior is None:
+                return []
+            chave = tuple_(*colunas)
+            consulta = consulta.where(
+                chave < tuple(anterior)
+                if decrescente
+                else chave > tuple(anterior)
+            )
+        else:
+            consulta = consulta.offset(skip)
+
+        consulta = self.build_order_clauses(
+            request,
+            [f"{campo} {direcao}" for campo, direcao in ordem],
+            consulta,
+        )
+        return (
+            (await self.executar(request, consulta.limit(limit)))
+            .scalars()
+            .all()
+        )
+
+
+class UsuarioView(ModelViewIndexada):
+    searchable_fields = ("id", "email")
+    sortable_fields = ("id", "email")
+
+    def get_search_query(self, request: Request, term: str) -> Any:
+        if term.isdigit():
+            return col(Usuario.id) == int(term)
+        return prefixo(Usuario.email, term)
+
+
+class SalaView(ModelViewIndexada):
+    searchable_fields = ("id", "nome")
+    exclude_fields_from_create = ("versao",)
+    exclude_fields_from_edit = ("versao",)
+
+    def get_search_query(self, request: Request, term: str) -> Any:
+        if term.isdigit():
+            return col(Sala.id) == int(term)
+        # A tabela de salas e pequena, entao o nome pode ser buscado sem indice
+        return col(Sala.nome).contains(term)
+
+    async def after_create(self, request: Request, obj: Any) -> None:
+        cache_salas.invalidar(obj.id)
+
+    async def after_edit(self, request: Request, obj: Any) -> None:
+        cache_salas.invalidar(obj.id)
+
+    async def after_delete(self, request: Request, obj: Any) -> None:
+        cache_salas.invalidar(obj.id)
+
+
+class ReservaView(ModelViewIndexada):
+    """
+    Busca por numero (id, sala ou usuario) ou pelo inicio do email de quem
+    reservou, sempre por indices.
+    """
+
+    chave_paginacao = ("data_inicial", "id")
+    coluna_janela = "data_inicial"
+    searchable_fields = (
+        "id",
+        "data_inicial",
+        "sala_reservada",
+        "reservado_por",
+    )
+    sortable_fields = ("id", "data_inicial")
+    fields_default_sort = (("data_inicial", True), ("id", True))
+    # O starlette_admin omite as chaves estrangeiras sem relacionamento, e
+    # sem a sala o formulario nunca validava
+    fields: Sequence[Any] = (
+        "id",
+        IntegerField("sala_reservada", required=True),
+        "data_inicial",
+        "data_final",
+        "descricao",
+        "tipo_evento",
+        "quantidade_pessoas",
+        "items",
+        IntegerField("reservado_por"),
+        "versao",
+    )
+    exclude_fields_from_create = ("versao",)
+    exclude_fields_from_edit = ("versao",)
+
+    def get_search_query(self, request: Request, term: str) -> Any:
+        if term.isdigit():
+            numero = int(term)
+            return or_(
+                col(Reserva.id) == numero,
+                col(Reserva.sala_reservada) == numero,
+                col(Reserva.reservado_por) == numero,
+            )
+        return col(Reserva.reservado_por).in_(
+            select(Usuario.id).where(prefixo(Usuario.email, term))
+        )
+
+    async def salvar(
+        self, request: Request, pk: Any, data: dict[str, Any]
+    ) -> Reserva:
+        """
+        Grava pelo mesmo caminho das rotas, com a escrita travada e a
+        verificacao de conflitos, que no SQLite nao tem restricao no banco.
+        """
+        async with AsyncSession(
+            async_engine, expire_on_commit=False
+        ) as session:
+            await bloquear_escrita(session)
+            reserva = (
+                Reserva() if pk is None else await session.get(Reserva, pk)
+            )
+            if reserva is None:
+                raise HTTPException(404, "Reserva não encontrada")
+
+            await self._populate_obj(request, reserva, data, pk is not None)
+            try:
+                await salvar_sem_conflito(session, reserva)
+            except HTTPException as erro:
+                campo = (
+                    "sala_reservada"
+                    if erro.status_code == 409
+                    else "data_final"
+                )
+                raise FormValidationError({campo: erro.detail}) from erro
+
+        return reserva
+
+    async def create(self, request: Request, data: dict[str, Any]) -> Any:
+        data = await self._arrange_data(request, data)
+        try:
+            await self.validate(request, data)
+        except ValidationError as erro:
+            # Vira um FormValidationError, mostrado no formulario
+            self.handle_exception(erro)
+        return await self.salvar(request, None, data)
+
+    async def edit(
+        self, request: Request, pk: Any, data: dict[str, Any]
+    ) -> Any:
+        data = await self._arrange_data(request, data, True)
+        try:
+            await self.validate(request, data)
+        except ValidationError as erro:
+            # Vira um FormValidationError, mostrado no formulario
+            self.handle_exception(erro)
+        return await self.salvar(request, int(pk), data)
+
+    async def after_delete(self, request: Request, obj: Any) -> None:
+        indice.remover(obj.id)
+
 
 admin = Admin(engine, title="Reserva de Salas")
 
-admin.add_view(ModelView(Usuario))
-admin.add_view(ModelView(Sala))
-admin.add_view(ModelView(Reserva))
+admin.add_view(UsuarioView(Usuario))
+admin.add_view(SalaView(Sala))
+admin.add_view(ReservaView(Reserva))
@@ -1,22 +1,96 @@
-from fastapi import FastAPI
+import asyncio
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
 
-from src.admin import admin
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.pool import QueuePool
+
+from src import inicializacao, metricas
+from src.arquivamento import arquivar_periodicamente
 from src.auth import auth
+from src.cache import cache_salas
+from src.database import async_engine
+from src.diagnostico import DIAGNOSTICO_SQL, MiddlewareDiagnostico
+from src.disponibilidade import (
+    indice,
+    iniciar_indice,
+    verificar_periodicamente,
+)
+from src.eventos import difusor
+from src.idempotencia import MiddlewareIdempotencia
 from src.routes.reservas import router as router_reservas
 from src.routes.salas import router as router_salas
+from src.routes.series import router as router_series
 from src.routes.usuarios import router as router_usuarios
 from src.schemas import Resposta, mensagem
 
-app = FastAPI()
+inicializacao.marcar("importacoes")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None]:
+    await iniciar_indice()
+    inicializacao.relatar_inicializacao()
+    verificacao = asyncio.create_task(verificar_periodicamente())
+    arquivamento = asyncio.create_task(arquivar_periodicamente())
+    eventos = asyncio.create_task(difusor.escutar())
+    yield
+    verificacao.cancel()
+    arquivamento.cancel()
+    eventos.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router_reservas)
 app.include_router(router_salas)
+app.include_router(router_series)
 app.include_router(router_usuarios)
 
 auth.handle_errors(app)
 
-admin.mount_to(app)
+app.add_middleware(MiddlewareIdempotencia)
+
+if DIAGNOSTICO_SQL:
+    app.add_middleware(MiddlewareDiagnostico)
+
+if metricas.METRICAS_HABILITADAS:
+    app.add_middleware(metricas.MiddlewareMetricas)
+
+if inicializacao.RELATORIO_INICIALIZACAO:
+    app.add_middleware(inicializacao.MiddlewarePrimeiraRequisicao)
+
+if inicializacao.ADMIN_HABILITADO:
+    app.mount("/admin", inicializacao.AdminSobDemanda(), name="admin")
 
 
 @app.get("/")
 async def root() -> Resposta:
     return mensagem("Servidor Rodando")
+
+
+def coletar_estado() -> None:
+    pool = async_engine.pool
+    if isinstance(pool, QueuePool):
+        metricas.conexoes_pool.definir(("em_uso",), pool.checkedout())
+        metricas.conexoes_pool.definir(("livres",), pool.checkedin())
+
+    for nome, valores in cache_salas.estatisticas().items():
+        metricas.consultas_cache.definir((nome, "acerto"), valores["acertos"])
+        metricas.consultas_cache.definir((nome, "falha"), valores["falhas"])
+        metricas.entradas_cache.definir((nome,), valores["entradas"])
+
+    metricas.reservas_indice.definir((), len(indice.reservas))
+    metricas.assinaturas_eventos.definir((), difusor.total)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def obter_metricas() -> PlainTextResponse:
+    if not metricas.METRICAS_HABILITADAS:
+        raise HTTPException(404, "Metricas desabilitadas")
+
+    coletar_estado()
+
+    return PlainTextResponse(
+        metricas.exportar(), media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import logging
+from datetime import UTC, datetime, timedelta
+
+import sqlalchemy
+from environs import env
+from sqlalchemy import delete, func, insert, inspect, literal
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.database import async_engine, bloquear_escrita
+from src.disponibilidade import indice
+from src.models import Reserva, ReservaHistorico
+
+env.read_env(".env")
+
+# Reservas que terminaram ha mais que isso vao para ReservaHistorico
+ARQUIVAMENTO_HORIZONTE_DIAS = env.int("ARQUIVAMENTO_HORIZONTE_DIAS", 365)
+ARQUIVAMENTO_LOTE = env.int("ARQUIVAMENTO_LOTE", 1000)
+# Segundos entre as execucoes em segundo plano, 0 deixa so a linha de comando
+ARQUIVAMENTO_INTERVALO = env.int("ARQUIVAMENTO_INTERVALO", 0)
+
+logger = logging.getLogger(__name__)
+
+
+def agora() -> datetime:
+    # As datas ficam no banco em UTC sem fuso
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def limite_arquivamento() -> datetime:
+    return agora() - timedelta(days=ARQUIVAMENTO_HORIZONTE_DIAS)
+
+
+def periodo_arquivado(data_final: datetime) -> bool:
+    """
+    Se o periodo ja pode ter sido arquivado.
+
+    As verificacoes de conflito so olham as reservas ativas, entao esses
+    periodos nao aceitam reservas novas nem alteracoes.
+    """
+    return data_final < limite_arquivamento()
+
+
+async def arquivar_lote(
+    session: AsyncSession, limite: datetime, lote: int
+) -> list[int]:
+    """
+    Move para o historico ate lote reservas que terminaram antes do limite.
+
+    A busca vai pelo indice de data_inicial, ja que uma reserva que termina
+    antes do limite tambem comeca antes dele. A reserva de maior id nunca e
+    movida, porque o SQLite reaproveitaria o id dela na proxima reserva.
+    """
+    await bloquear_escrita(session)
+
+    ids = [
+        id_reserva
+        for id_reserva in (
+            await session.exec(
+                select(Reserva.id)
+                .where(
+                    col(Reserva.data_inicial) < limite,
+                    col(Reserva.data_final) < limite,
+                    col(Reserva.id)
+                    < select(func.max(Reserva.id)).scalar_subquery(),
+                )
+                .order_by(col(Reserva.data_inicial), col(Reserva.id))
+                .limit(lote)
+            )
+        ).all()
+        if id_reserva is not None
+    ]
+
+    if not ids:
+        return []
+
+    colunas = list(inspect(Reserva).columns)
+    conexao = await session.connection()
+    await conexao.execute(
+        insert(ReservaHistorico).from_select(
+            [*(coluna.key for coluna in colunas), "arquivada_em"],
+            sqlalchemy.select(*colunas, literal(agora())).where(
+                col(Reserva.id).in_(ids)
+            ),
+        )
+    )
+    await conexao.execute(delete(Reserva).where(col(Reserva.id).in_(ids)))
+    await session.commit()
+
+    for id_reserva in ids:
+        indice.remover(id_reserva)
+
+    return ids
+
+
+async def arquivar(
+    limite: datetime | None = None, lote: int = ARQUIVAMENTO_LOTE
+) -> int:
+    """Arquiva tudo antes do limite, um lote por transacao."""
+    limite = limite or limite_arquivamento()
+    total = 0
+
+    while True:
+        async with AsyncSession(async_engine) as session:
+            arquivadas = len(await arquivar_lote(session, limite, lote))
+
+        total += arquivadas
+        if arquivadas < lote:
+            return total
+
+        # Entre um lote e outro as requisicoes voltam a ter o banco
+        await asyncio.sleep(0)
+
+
+async def arquivar_periodicamente() -> None:
+    while ARQUIVAMENTO_INTERVALO > 0:
+        await asyncio.sleep(ARQUIVAMENTO_INTERVALO)
+        try:
+            arquivadas = await arquivar()
+        except Exception:
+            logger.exception("Falha ao arquivar reservas antigas")
+            continue
+
+        if arquivadas:
+            logger.info("%d reservas movidas para o historico", arquivadas)
+
+
+async def main() -> None:
+    # O horizonte vem so do ambiente, o mesmo que a API usa para recusar
+    # reservas em periodos arquivados
+    parser = argparse.ArgumentParser(
+        description="Move para o historico as reservas que terminaram ha mais"
+        " de ARQUIVAMENTO_HORIZONTE_DIAS dias."
+    )
+    parser.add_argument("--lote", type=int, default=ARQUIVAMENTO_LOTE)
+    args = parser.parse_args()
+
+    try:
+        arquivadas = await arquivar(lote=args.lote)
+    finally:
+        await async_engine.dispose()
+
+    print(f"{arquivadas} reservas movidas para o historico")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
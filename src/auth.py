@@ -1,9 +1,20 @@
+import asyncio
+import hashlib
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 from authx import AuthX, AuthXConfig
 from authx import AuthXDependency as AuthXDependency
 from authx import TokenPayload as TokenPayload
+from authx.exceptions import RevokedTokenError
 from environs import env
+from fastapi import HTTPException, Request, status
 from passlib.context import CryptContext
 
+from src.cache import CacheTTL
+
 env.read_env(".env")
 
 config = AuthXConfig(
@@ -14,12 +25,101 @@ config = AuthXConfig(
 
 auth: AuthX[object] = AuthX(config)
 
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+TOKEN_CACHE_TAMANHO = env.int("TOKEN_CACHE_TAMANHO", 10_000)
+TOKEN_CACHE_TTL = env.float("TOKEN_CACHE_TTL", 300)
+
+token_cache: CacheTTL[bytes, TokenPayload] = CacheTTL(
+    TOKEN_CACHE_TAMANHO, TOKEN_CACHE_TTL
+)
+
+
+async def access_token_required(request: Request) -> TokenPayload:
+    """
+    Equivalente a auth.access_token_required, com cache dos tokens validos.
+
+    A chave e o sha256 do token e cada entrada expira junto com o claim exp,
+    entao so a decodificacao e a verificacao da assinatura sao evitadas. A
+    blocklist continua sendo consultada em toda requisicao.
+    """
+    request_token = await auth.get_access_token_from_request(request)
+
+    if auth.is_token_in_blocklist(request_token.token):
+        raise RevokedTokenError("Token has been revoked")
+
+    # Tokens em cookies dependem do CSRF da requisicao, entao nao sao cacheados
+    if request_token.location != "headers":
+        return await auth.access_token_required(request)
+
+    chave = hashlib.sha256(request_token.token.encode()).digest()
+    payload = token_cache.obter(chave)
+
+    if payload is None:
+        payload = auth.verify_token(
+            request_token, verify_type=True, verify_csrf=False
+        )
+
+        expira_em: float | None = None
+        if isinstance(payload.exp, datetime):
+            expira_em = payload.exp.timestamp()
+        elif isinstance(payload.exp, int | float):
+            expira_em = payload.exp
+
+        token_cache.guardar(chave, payload, expira_em)
+
+    return payload
+
+
+BCRYPT_ROUNDS = env.int("BCRYPT_ROUNDS", 12)
+HASH_WORKERS = env.int("HASH_WORKERS", os.cpu_count() or 1)
+HASH_FILA_MAXIMA = env.int("HASH_FILA_MAXIMA", 4 * HASH_WORKERS)
+
+password_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+# O bcrypt libera o GIL, entao threads bastam para tirar o hash do event loop
+hash_executor = ThreadPoolExecutor(
+    max_workers=HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+hash_vagas = asyncio.Semaphore(HASH_FILA_MAXIMA)
+
+
+async def executar_hash[T](funcao: Callable[..., T], *args: str) -> T:
+    """
+    Executa uma operacao de hash no pool de threads.
+
+    Quando ja existem HASH_FILA_MAXIMA operacoes na fila, recusa com 503 em
+    vez de acumular requisicoes esperando CPU.
+    """
+    if hash_vagas.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, tente novamente em instantes",
+            headers={"Retry-After": "1"},
+        )
+
+    async with hash_vagas:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_executor, funcao, *args)
+
+
+async def get_hashed_password(password: str) -> str:
+    return await executar_hash(password_context.hash, password)
+
 
+async def verify_password(password: str, hashed_pass: str) -> bool:
+    return await executar_hash(password_context.verify, password, hashed_pass)
 
-def get_hashed_password(password: str) -> str:
-    return password_context.hash(password)
 
+async def verify_and_update_password(
+    password: str, hashed_pass: str
+) -> tuple[bool, str | None]:
+    """
+    Verifica a senha e, se o hash usa parametros antigos, gera um novo.
 
-def verify_password(password: str, hashed_pass: str) -> bool:
-    return password_context.verify(password, hashed_pass)
+    O novo hash so e retornado quando needs_update indica que o custo ou o
+    esquema mudaram desde que ele foi criado.
+    """
+    return await executar_hash(
+        password_context.verify_and_update, password, hashed_pass
+    )
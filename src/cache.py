@@ -0,0 +1,176 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+
+from environs import env
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.models import Sala
+from src.schemas import Pagina
+
+env.read_env(".env")
+
+SALA_CACHE_TAMANHO = env.int("SALA_CACHE_TAMANHO", 10_000)
+SALA_CACHE_TTL = env.float("SALA_CACHE_TTL", 60)
+
+
+class CacheTTL[K: Hashable, V]:
+    """
+    Cache LRU limitado em tamanho, com expiracao por entrada.
+
+    Conta acertos e falhas para que a taxa de acerto possa ser exportada.
+    """
+
+    def __init__(self, tamanho_maximo: int, ttl: float) -> None:
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self._entradas: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obter(self, chave: K) -> V | None:
+        entrada = self._entradas.get(chave)
+
+        if entrada is None or entrada[0] <= time.monotonic():
+            if entrada is not None:
+                del self._entradas[chave]
+            self.falhas += 1
+            return None
+
+        self._entradas.move_to_end(chave)
+        self.acertos += 1
+        return entrada[1]
+
+    def guardar(
+        self, chave: K, valor: V, expira_em: float | None = None
+    ) -> None:
+        """
+        Guarda o valor ate expira_em (epoch) ou, no maximo, pelo ttl.
+
+        Valores que ja expiraram nao sao guardados.
+        """
+        agora = time.monotonic()
+        validade = agora + self.ttl
+
+        if expira_em is not None:
+            validade = min(validade, agora + expira_em - time.time())
+            if validade <= agora:
+                return
+
+        self._entradas[chave] = (validade, valor)
+        self._entradas.move_to_end(chave)
+
+        while len(self._entradas) > self.tamanho_maximo:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, chave: K) -> None:
+        self._entradas.pop(chave, None)
+
+    def limpar(self) -> None:
+        self._entradas.clear()
+
+    def estatisticas(self) -> dict[str, float]:
+        consultas = self.acertos + self.falhas
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            "entradas": len(self._entradas),
+        }
+
+
+class CacheSalas:
+    """
+    Cache de leitura do catalogo de salas, por id e por pagina da listagem.
+
+    As rotas e o admin invalidam as entradas ao escrever. O ttl cobre as
+    escritas feitas por outros workers ou direto no banco.
+
+    Cada invalidacao muda a geracao. Quem carrega do banco anota a geracao
+    antes da consulta e so guarda o resultado se ela nao mudou, senao uma
+    leitura feita antes da escrita voltaria para o cache depois dela.
+    """
+
+    def __init__(self, tamanho_maximo: int, ttl: float) -> None:
+        self.por_id: CacheTTL[int, Sala] = CacheTTL(tamanho_maximo, ttl)
+        self.paginas: CacheTTL[Hashable, Pagina[Sala]] = CacheTTL(
+            tamanho_maximo, ttl
+        )
+        self.geracao = 0
+
+    async def obter(self, session: AsyncSession, id_sala: int) -> Sala | None:
+        salas = await self.obter_varias(session, [id_sala])
+        return salas.get(id_sala)
+
+    async def obter_varias(
+        self, session: AsyncSession, ids_salas: Iterable[int]
+    ) -> dict[int, Sala]:
+        encontradas = {}
+        faltando = []
+
+        for id_sala in set(ids_salas):
+            sala = self.por_id.obter(id_sala)
+            if sala is None:
+                faltando.append(id_sala)
+            else:
+                encontradas[id_sala] = sala
+
+        if faltando:
+            geracao = self.geracao
+            for sala in (
+                await session.exec(
+                    select(Sala).where(col(Sala.id).in_(faltando))
+                )
+            ).all():
+                encontradas[sala.id or 0] = self.guardar(sala, geracao)
+
+        return encontradas
+
+    async def obter_todas(self, session: AsyncSession) -> list[Sala]:
+        pagina = self.paginas.obter("todas")
+
+        if pagina is None:
+            geracao = self.geracao
+            salas = (
+                await session.exec(select(Sala).order_by(col(Sala.id)))
+            ).all()
+            pagina = Pagina(items=list(salas))
+            self.guardar_pagina("todas", pagina, geracao)
+
+        return pagina.items
+
+    def guardar(self, sala: Sala, geracao: int) -> Sala:
+        """Guarda uma copia desanexada da sessao, que e a que deve ser usada."""
+        copia = Sala.model_validate(sala)
+        if copia.id is not None and geracao == self.geracao:
+            self.por_id.guardar(copia.id, copia)
+        return copia
+
+    def obter_pagina(self, chave: Hashable) -> Pagina[Sala] | None:
+        return self.paginas.obter(chave)
+
+    def guardar_pagina(
+        self, chave: Hashable, pagina: Pagina[Sala], geracao: int
+    ) -> None:
+        pagina.items = [self.guardar(sala, geracao) for sala in pagina.items]
+        if geracao == self.geracao:
+            self.paginas.guardar(chave, pagina)
+
+    def invalidar(self, id_sala: int | None) -> None:
+        self.geracao += 1
+        if id_sala is not None:
+            self.por_id.invalidar(id_sala)
+        self.paginas.limpar()
+
+    def estatisticas(self) -> dict[str, dict[str, float]]:
+        return {
+            "por_id": self.por_id.estatisticas(),
+            "paginas": self.paginas.estatisticas(),
+        }
+
+
+cache_salas = CacheSalas(SALA_CACHE_TAMANHO, SALA_CACHE_TTL)
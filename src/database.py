@@ -1,18 +1,360 @@
-from collections.abc import Generator
+import time
+from collections.abc import AsyncGenerator, Generator, Iterable
+from typing import Any
 
 from environs import env
-from sqlmodel import Session, create_engine
+from sqlalchemy import Table, event, func, insert, select, update
+from sqlalchemy.engine import Connection, ExceptionContext, make_url
+from sqlalchemy.engine.default import DefaultDialect
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import ConnectionPoolEntry, Pool, QueuePool
+from sqlalchemy.sql.dml import Delete, Update, UpdateBase
+from sqlmodel import Session, col, create_engine
 from sqlmodel import SQLModel as SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-import models as models
+from src import models as models
+from src.diagnostico import DIAGNOSTICO_SQL, diagnosticar_consulta
+from src.metricas import (
+    METRICAS_HABILITADAS,
+    registrar_consulta,
+    registrar_espera_pool,
+)
 
 env.read_env(".env")
 
 DATABASE_URI = env.str("DATABASE_URI")
 
-engine = create_engine(DATABASE_URI)
+# Tabelas cujas escritas incrementam ContadorAlteracoes
+TABELAS_CONTADAS = {
+    "sala",
+    "reserva",
+    "reservahistorico",
+    "seriereserva",
+    "excecaoserie",
+    "usuario",
+}
+
+DRIVERS_ASSINCRONOS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def obter_uri_assincrona(uri: str) -> str:
+    url = make_url(uri)
+    driver = DRIVERS_ASSINCRONOS.get(url.drivername, url.drivername)
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URI = env.str(
+    "ASYNC_DATABASE_URI", obter_uri_assincrona(DATABASE_URI)
+)
+
+# Tamanho, excedente e espera so valem para pools do tipo QueuePool
+POOL_TAMANHO = env.int("DATABASE_POOL_TAMANHO", 5)
+POOL_EXCEDENTE = env.int("DATABASE_POOL_EXCEDENTE", 10)
+POOL_TIMEOUT = env.float("DATABASE_POOL_TIMEOUT", 30)
+POOL_RECICLAR = env.int("DATABASE_POOL_RECICLAR", 1800)
+POOL_PRE_PING = env.bool("DATABASE_POOL_PRE_PING", False)
+CACHE_COMANDOS = env.int("DATABASE_CACHE_COMANDOS", 1000)
+
+SQLITE_WAL = env.bool("SQLITE_WAL", True)
+SQLITE_SYNCHRONOUS = env.str(
+    "SQLITE_SYNCHRONOUS",
+    "NORMAL",
+    validate=lambda valor: valor.upper() in {"OFF", "NORMAL", "FULL", "EXTRA"},
+)
+SQLITE_BUSY_TIMEOUT_MS = env.int("SQLITE_BUSY_TIMEOUT_MS", 10000)
+SQLITE_MMAP_BYTES = env.int("SQLITE_MMAP_BYTES", 256 * 1024 * 1024)
+SQLITE_CACHE_KB = env.int("SQLITE_CACHE_KB", 64 * 1024)
+
+# Primeira chave do pg_advisory_xact_lock nas travas por sala, para nao
+# colidir com outras travas consultivas no mesmo banco
+TRAVA_SALAS = env.int("DATABASE_TRAVA_SALAS", 0x5A1A)
+
+
+class PoolMedido(Pool):
+    """Mede quanto tempo cada checkout espera por uma conexao."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        comeco = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            registrar_espera_pool(time.perf_counter() - comeco)
+
+
+def classe_pool(uri: str) -> type[Pool]:
+    # Mantem o pool que o SQLAlchemy escolheria para o dialeto
+    url = make_url(uri)
+    dialeto = url.get_dialect()
+    padrao = (
+        dialeto.get_pool_class(url)
+        if issubclass(dialeto, DefaultDialect)
+        else QueuePool
+    )
+    if not METRICAS_HABILITADAS:
+        return padrao
+    return type(f"{padrao.__name__}Medido", (PoolMedido, padrao), {})
+
+
+def opcoes_engine(uri: str) -> dict[str, Any]:
+    poolclass = classe_pool(uri)
+    opcoes: dict[str, Any] = {
+        "poolclass": poolclass,
+        "pool_recycle": POOL_RECICLAR,
+        "pool_pre_ping": POOL_PRE_PING,
+        "query_cache_size": CACHE_COMANDOS,
+    }
+    if issubclass(poolclass, QueuePool):
+        opcoes |= {
+            "pool_size": POOL_TAMANHO,
+            "max_overflow": POOL_EXCEDENTE,
+            "pool_timeout": POOL_TIMEOUT,
+        }
+    return opcoes
+
+
+# Usado pelo starlette_admin e pelo Alembic, que nao suportam sessoes async
+engine = create_engine(DATABASE_URI, **opcoes_engine(DATABASE_URI))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URI, **opcoes_engine(ASYNC_DATABASE_URI)
+)
+
+
+def _configurar_sqlite(dbapi_connection: Any, _connection_record: Any) -> None:
+    """
+    Ajusta cada conexao nova do SQLite.
+
+    Com WAL os leitores nao esperam pelas escritas, e o synchronous NORMAL
+    so sincroniza o disco nos checkpoints. O busy_timeout faz uma escrita
+    esperar a outra em vez de falhar com "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        if SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS:d}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES:d}")
+        # Negativo indica o tamanho em KiB em vez de paginas
+        cursor.execute(f"PRAGMA cache_size={-SQLITE_CACHE_KB:d}")
+    finally:
+        cursor.close()
+
+
+for _motor in (engine, async_engine.sync_engine):
+    if _motor.dialect.name == "sqlite":
+        event.listen(_motor, "connect", _configurar_sqlite)
+
+if async_engine.dialect.name == "sqlite":
+    # O pysqlite so abre a transacao no primeiro INSERT/UPDATE, o que impede
+    # usar BEGIN IMMEDIATE. Desligamos esse comportamento e emitimos o BEGIN
+    # manualmente, conforme a documentacao do SQLAlchemy.
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _desativar_begin_implicito(
+        dbapi_connection: Any, _connection_record: Any
+    ) -> None:
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _iniciar_transacao(conexao: Connection) -> None:
+        if conexao.get_execution_options().get("sqlite_immediate"):
+            conexao.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            conexao.exec_driver_sql("BEGIN")
+
+
+@event.listens_for(Session, "before_flush")
+def _incrementar_versoes(
+    session: Session, _contexto: Any, _instancias: Any
+) -> None:
+    for objeto in session.dirty:
+        if isinstance(
+            objeto, models.Sala | models.Reserva
+        ) and session.is_modified(objeto):
+            objeto.versao += 1
+
+
+def _altera_email(clausula: UpdateBase, multiparams: Any, params: Any) -> bool:
+    # O flush do ORM manda as colunas nos parametros, o Core nos values
+    colunas = set(params or ())
+    for parametros in multiparams or ():
+        if isinstance(parametros, dict):
+            colunas.update(parametros)
+    if not colunas:
+        colunas = set(clausula.compile().params)
+    return "email" in colunas
+
+
+def _anotar_alteracao(
+    conexao: Connection,
+    clausula: Any,
+    multiparams: Any,
+    params: Any,
+    *_argumentos: Any,
+) -> None:
+    """
+    Anota as tabelas contadas que cada INSERT, UPDATE ou DELETE alterou.
+
+    Pega tanto o flush do ORM quanto os comandos do Core. Da tabela usuario
+    so contam as remocoes e as trocas de email, que aparecem na listagem de
+    reservas; cadastros e senhas nao mudam nenhuma resposta com ETag.
+    """
+    alteradas = conexao.info.get("tabelas_alteradas")
+    if alteradas is None or not isinstance(clausula, UpdateBase):
+        return
+
+    tabela = clausula.table
+    if not isinstance(tabela, Table) or tabela.name not in TABELAS_CONTADAS:
+        return
+
+    if tabela.name == "usuario" and not (
+        isinstance(clausula, Delete)
+        or (
+            isinstance(clausula, Update)
+            and _altera_email(clausula, multiparams, params)
+        )
+    ):
+        return
+
+    alteradas.add(tabela.name)
+
+
+def _soltar_conexao(conexao: Connection) -> None:
+    conexao.info.pop("tabelas_alteradas", None)
+
+
+@event.listens_for(Session, "after_begin")
+def _acompanhar_conexao(
+    session: Session, _transacao: Any, conexao: Connection
+) -> None:
+    # A conexao e a sessao dividem o mesmo conjunto ate o fim da transacao
+    conexao.info["tabelas_alteradas"] = session.info.setdefault(
+        "tabelas_alteradas", set()
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_alteracoes(session: Session) -> None:
+    session.info.pop("tabelas_alteradas", None)
+
+
+@event.listens_for(Session, "before_commit")
+def _contar_alteracoes(session: Session) -> None:
+    """
+    Incrementa ContadorAlteracoes das tabelas alteradas pela transacao.
+
+    Roda na conexao da sessao, dentro da propria transacao, entao o ETag
+    muda junto com os dados. Fica para o fim, depois do ultimo flush, para
+    a linha do contador ficar travada so ate o commit.
+    """
+    session.flush()
+    alteradas = session.info.get("tabelas_alteradas")
+    if not alteradas:
+        return
+
+    contador = models.ContadorAlteracoes
+    conexao = session.connection()
+    for tabela in sorted(alteradas):
+        resultado = conexao.execute(
+            update(contador)
+            .where(col(contador.tabela) == tabela)
+            .values(alteracoes=col(contador.alteracoes) + 1)
+        )
+        if not resultado.rowcount:
+            conexao.execute(
+                insert(contador).values(tabela=tabela, alteracoes=1)
+            )
+    # Um savepoint confirmado nao encerra a transacao, e o que vier depois
+    # dele deve ser contado de novo
+    alteradas.clear()
+
+
+def _iniciar_consulta(conexao: Connection, *_argumentos: Any) -> None:
+    conexao.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+
+def _medir_consulta(
+    conexao: Connection,
+    _cursor: Any,
+    sql: str,
+    parametros: Any,
+    _contexto: Any,
+    executemany: bool,
+) -> None:
+    duracao = time.perf_counter() - conexao.info["inicio_consultas"].pop()
+
+    if METRICAS_HABILITADAS:
+        registrar_consulta(duracao)
+    if DIAGNOSTICO_SQL:
+        diagnosticar_consulta(conexao, sql, parametros, executemany, duracao)
+
+
+def _descartar_consulta(contexto: ExceptionContext) -> None:
+    # Uma consulta que falhou nao chega ao after_cursor_execute, e o inicio
+    # dela ficaria para sempre na lista da conexao
+    if (
+        contexto.connection is not None
+        and contexto.execution_context is not None
+    ):
+        inicios = contexto.connection.info.get("inicio_consultas")
+        if inicios:
+            inicios.pop()
+
+
+for _motor in (engine, async_engine.sync_engine):
+    event.listen(_motor, "after_execute", _anotar_alteracao)
+    event.listen(_motor, "commit", _soltar_conexao)
+    event.listen(_motor, "rollback", _soltar_conexao)
+
+    if METRICAS_HABILITADAS or DIAGNOSTICO_SQL:
+        event.listen(_motor, "before_cursor_execute", _iniciar_consulta)
+        event.listen(_motor, "after_cursor_execute", _medir_consulta)
+        event.listen(_motor, "handle_error", _descartar_consulta)
 
 
 def get_session() -> Generator[Session]:
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def bloquear_escrita(session: AsyncSession) -> None:
+    """
+    Abre a transacao da sessao reservando o banco para escrita.
+
+    No SQLite isso emite BEGIN IMMEDIATE, serializando quem verifica e grava
+    no mesmo periodo. Tambem evita o "database is locked" de uma transacao
+    que leu e depois tenta escrever: essa falha na hora, sem esperar o
+    busy_timeout. Precisa ser chamada antes de qualquer consulta.
+    """
+    await session.connection(execution_options={"sqlite_immediate": True})
+
+
+async def bloquear_salas(session: AsyncSession, salas: Iterable[int]) -> None:
+    """
+    No Postgres, trava as salas ate o fim da transacao da sessao.
+
+    Ali bloquear_escrita nao serializa nada e a restricao de exclusao so
+    cobre a tabela reserva, entao quem verifica conflitos e grava numa sala
+    espera por quem ja esta fazendo o mesmo nela, inclusive com series. As
+    travas sao pegas em ordem para duas transacoes nao se esperarem em
+    ciclo. No SQLite o BEGIN IMMEDIATE ja serializa as escritas.
+    """
+    conexao = await session.connection()
+    if conexao.dialect.name != "postgresql":
+        return
+
+    for sala in sorted(set(salas)):
+        await conexao.execute(
+            select(func.pg_advisory_xact_lock(TRAVA_SALAS, sala))
+        )
@@ -0,0 +1,137 @@
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any
+
+from environs import env
+from sqlalchemy.engine import Connection
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+env.read_env(".env")
+
+# Modo de depuracao, desligado por padrao por causa do custo de guardar os
+# comandos de cada requisicao e dos EXPLAINs
+DIAGNOSTICO_SQL = env.bool("DIAGNOSTICO_SQL", False)
+CONSULTA_LENTA_MS = env.float("DIAGNOSTICO_CONSULTA_LENTA_MS", 100)
+MAXIMO_CONSULTAS = env.int("DIAGNOSTICO_MAXIMO_CONSULTAS", 20)
+MAXIMO_REPETICOES = env.int("DIAGNOSTICO_MAXIMO_REPETICOES", 5)
+EXPLAIN = env.bool("DIAGNOSTICO_EXPLAIN", False)
+TAMANHO_PARAMETROS = 500
+
+logger = logging.getLogger(__name__)
+
+
+class ConsultasRequisicao:
+    def __init__(self, scope: Scope) -> None:
+        self.scope = scope
+        self.comandos: Counter[str] = Counter()
+
+    def rota(self) -> str:
+        rota = getattr(self.scope.get("route"), "path", self.scope["path"])
+        return f"{self.scope['method']} {rota}"
+
+
+consultas_requisicao: ContextVar[ConsultasRequisicao | None] = ContextVar(
+    "consultas_requisicao", default=None
+)
+
+
+def explicar(conexao: Connection, sql: str, parametros: Any) -> str:
+    prefixo = (
+        "EXPLAIN QUERY PLAN" if conexao.dialect.name == "sqlite" else "EXPLAIN"
+    )
+    conexao.info["explicando"] = True
+    try:
+        linhas = conexao.exec_driver_sql(f"{prefixo} {sql}", parametros).all()
+    finally:
+        conexao.info["explicando"] = False
+
+    return "\n".join(
+        " ".join(str(valor) for valor in linha) for linha in linhas
+    )
+
+
+def diagnosticar_consulta(
+    conexao: Connection,
+    sql: str,
+    parametros: Any,
+    executemany: bool,
+    duracao: float,
+) -> None:
+    """
+    Conta o comando na requisicao atual e registra se ele foi lento.
+
+    Com DIAGNOSTICO_EXPLAIN o plano dos SELECTs lentos vai junto no log,
+    obtido na mesma conexao e com os mesmos parametros.
+    """
+    if conexao.info.get("explicando"):
+        return
+
+    requisicao = consultas_requisicao.get()
+    if requisicao is not None:
+        requisicao.comandos[sql] += 1
+
+    if duracao * 1000 < CONSULTA_LENTA_MS:
+        return
+
+    rota = requisicao.rota() if requisicao is not None else "fora de requisicao"
+    mensagem = "Consulta lenta (%.1f ms) em %s:\n%s\nParametros: %s"
+    argumentos: list[Any] = [
+        duracao * 1000,
+        rota,
+        sql,
+        repr(parametros)[:TAMANHO_PARAMETROS],
+    ]
+
+    if (
+        EXPLAIN
+        and not executemany
+        and sql.lstrip().upper().startswith("SELECT")
+    ):
+        try:
+            argumentos.append(explicar(conexao, sql, parametros))
+            mensagem += "\nPlano:\n%s"
+        except Exception:
+            logger.exception("Falha ao obter o plano da consulta")
+
+    logger.warning(mensagem, *argumentos)
+
+
+def verificar_requisicao(requisicao: ConsultasRequisicao) -> None:
+    total = sum(requisicao.comandos.values())
+    if not total:
+        return
+
+    comando, repeticoes = requisicao.comandos.most_common(1)[0]
+
+    if total > MAXIMO_CONSULTAS or repeticoes > MAXIMO_REPETICOES:
+        logger.warning(
+            "Possivel N+1 em %s: %d consultas, a mais repetida %d vezes:\n%s",
+            requisicao.rota(),
+            total,
+            repeticoes,
+            comando,
+        )
+
+
+class MiddlewareDiagnostico:
+    """Acompanha os comandos SQL de cada requisicao HTTP."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requisicao = ConsultasRequisicao(scope)
+        token = consultas_requisicao.set(requisicao)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            consultas_requisicao.reset(token)
+            verificar_requisicao(requisicao)
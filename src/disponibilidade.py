@@ -0,0 +1,470 @@
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timedelta
+
+from environs import env
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.database import engine
+from src.models import Reserva
+
+env.read_env(".env")
+
+INDICE_HABILITADO = env.bool("INDICE_DISPONIBILIDADE", True)
+# O indice e um cache de cada processo. Com mais de um worker, ou com
+# escritas direto no banco, ele so enxerga as outras escritas na proxima
+# verificacao, entao esse intervalo limita o tempo de divergencia
+INTERVALO_VERIFICACAO = env.int("INDICE_DISPONIBILIDADE_VERIFICACAO", 300)
+# Confirma no banco as salas e horarios que o indice da como livres. Liga
+# sozinho quando o uvicorn ou o gunicorn sobem mais de um worker
+INDICE_CONFIRMAR = env.bool(
+    "INDICE_DISPONIBILIDADE_CONFIRMAR", env.int("WEB_CONCURRENCY", 1) > 1
+)
+# Tamanho dos slots da grade de ocupacao, 0 desliga a grade
+GRADE_MINUTOS = env.int(
+    "GRADE_MINUTOS",
+    15,
+    validate=lambda minutos: minutos >= 0 and 24 * 60 % (minutos or 1) == 0,
+)
+
+logger = logging.getLogger(__name__)
+
+Intervalo = tuple[int, int, datetime, datetime]
+
+
+class IntervalosSala:
+    """
+    Reservas de uma sala ordenadas pela data inicial.
+
+    Guarda, para cada posicao, a maior data final ate ali. Assim basta uma
+    busca binaria para saber se algum intervalo que comeca antes do fim da
+    janela termina depois do seu inicio.
+    """
+
+    def __init__(self) -> None:
+        self.chaves: list[tuple[datetime, int]] = []
+        self.fins: list[datetime] = []
+        self.maior_fim: list[datetime] = []
+
+    def __len__(self) -> int:
+        return len(self.chaves)
+
+    def adicionar(
+        self, id_reserva: int, inicio: datetime, fim: datetime
+    ) -> None:
+        posicao = bisect_left(self.chaves, (inicio, id_reserva))
+        self.chaves.insert(posicao, (inicio, id_reserva))
+        self.fins.insert(posicao, fim)
+        self.maior_fim.insert(posicao, fim)
+        self._recalcular(posicao)
+
+    def remover(self, id_reserva: int, inicio: datetime) -> None:
+        posicao = bisect_left(self.chaves, (inicio, id_reserva))
+        if posicao == len(self.chaves) or self.chaves[posicao][1] != id_reserva:
+            return
+
+        del self.chaves[posicao]
+        del self.fins[posicao]
+        del self.maior_fim[posicao]
+        self._recalcular(posicao)
+
+    def livre(self, inicio: datetime, fim: datetime) -> bool:
+        posicao = bisect_left(self.chaves, (fim,))
+        return posicao == 0 or self.maior_fim[posicao - 1] <= inicio
+
+    def conflitos(
+        self, inicio: datetime, fim: datetime, ignorar: int | None = None
+    ) -> list[int]:
+        encontrados = []
+        posicao = bisect_left(self.chaves, (fim,)) - 1
+
+        while posicao >= 0 and self.maior_fim[posicao] > inicio:
+            id_reserva = self.chaves[posicao][1]
+            if self.fins[posicao] > inicio and id_reserva != ignorar:
+                encontrados.append(id_reserva)
+            posicao -= 1
+
+        return encontrados
+
+    def periodos(
+        self, inicio: datetime, fim: datetime
+    ) -> Iterator[tuple[datetime, datetime]]:
+        """Reservas que sobrepoem a janela, pela data inicial."""
+        # maior_fim nao diminui, entao a busca acha a primeira posicao com
+        # algum intervalo terminando depois do inicio
+        posicao = bisect_right(self.maior_fim, inicio)
+
+        while posicao < len(self.chaves) and self.chaves[posicao][0] < fim:
+            if self.fins[posicao] > inicio:
+                yield self.chaves[posicao][0], self.fins[posicao]
+            posicao += 1
+
+    def _recalcular(self, posicao: int) -> None:
+        for i in range(posicao, len(self.chaves)):
+            fim = self.fins[i]
+            if i > 0 and self.maior_fim[i - 1] > fim:
+                fim = self.maior_fim[i - 1]
+            if i > posicao and self.maior_fim[i] == fim:
+                break
+            self.maior_fim[i] = fim
+
+
+def meia_noite(instante: datetime) -> datetime:
+    return instante.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class GradeSalas:
+    """
+    Ocupacao de cada sala em slots de tamanho fixo, um inteiro por dia.
+
+    O bit i de um dia esta ligado se alguma reserva toca o slot i. Para uma
+    janela alinhada na grade, a sala esta livre se nenhum bit dos slots da
+    janela estiver ligado, o que custa um AND por dia em vez de uma busca.
+
+    Com slots de 15 minutos cada dia tem 96 bits, 12 bytes de dados ou
+    4,4 KB por sala-ano. Em Python cada dia guardado ocupa uns 115 bytes
+    (o int, a data e a entrada no dict), perto de 42 KB por sala-ano, e so
+    dias com alguma reserva sao guardados.
+    """
+
+    def __init__(self, minutos: int) -> None:
+        self.passo = timedelta(minutes=minutos)
+        self.slots = 24 * 60 // minutos
+        self.dias: dict[int, dict[date, int]] = {}
+
+    def alinhado(self, instante: datetime) -> bool:
+        return not (instante - meia_noite(instante)) % self.passo
+
+    def mascaras(
+        self, inicio: datetime, fim: datetime
+    ) -> Iterator[tuple[date, int]]:
+        """Cada dia que o periodo toca, com os bits dos slots tocados."""
+        comeco_dia = meia_noite(inicio)
+
+        while comeco_dia < fim:
+            primeiro = max(0, (inicio - comeco_dia) // self.passo)
+            ultimo = min(self.slots, -((comeco_dia - fim) // self.passo))
+            yield comeco_dia.date(), (1 << ultimo) - (1 << primeiro)
+
+            comeco_dia += timedelta(days=1)
+
+    def marcar(self, id_sala: int, inicio: datetime, fim: datetime) -> None:
+        dias = self.dias.setdefault(id_sala, {})
+        for dia, mascara in self.mascaras(inicio, fim):
+            dias[dia] = dias.get(dia, 0) | mascara
+
+    def recalcular(
+        self,
+        id_sala: int,
+        inicio: datetime,
+        fim: datetime,
+        intervalos: IntervalosSala,
+    ) -> None:
+        """
+        Refaz os dias tocados pelo periodo a partir das reservas da sala.
+
+        Duas reservas podem dividir um slot, entao tirar uma delas nao
+        permite simplesmente desligar os bits.
+        """
+        dias = self.dias.setdefault(id_sala, {})
+        for dia, _ in self.mascaras(inicio, fim):
+            dias.pop(dia, None)
+
+        janela = (meia_noite(inicio), meia_noite(fim) + timedelta(days=1))
+        for comeco, termino in intervalos.periodos(*janela):
+            for dia, mascara in self.mascaras(
+                max(comeco, janela[0]), min(termino, janela[1])
+            ):
+                dias[dia] = dias.get(dia, 0) | mascara
+
+    def livre(self, id_sala: int, inicio: datetime, fim: datetime) -> bool:
+        dias = self.dias.get(id_sala)
+        return not dias or not any(
+            dias.get(dia, 0) & mascara
+            for dia, mascara in self.mascaras(inicio, fim)
+        )
+
+
+class IndiceDisponibilidade:
+    """
+    Indice em memoria das reservas de cada sala.
+
+    Enquanto nao estiver pronto (antes da carga inicial ou se ela falhar) as
+    rotas devem cair para a consulta SQL. As rotas, o admin, a importacao e
+    o arquivamento atualizam o indice do proprio processo. O que outros
+    processos gravam so aparece na proxima recarga, por isso as respostas
+    podem ser confirmadas no banco com INDICE_CONFIRMAR.
+    """
+
+    def __init__(self) -> None:
+        self.salas: dict[int, IntervalosSala] = {}
+        self.reservas: dict[int, tuple[int, datetime, datetime]] = {}
+        self.grade = GradeSalas(GRADE_MINUTOS) if GRADE_MINUTOS else None
+        self.pronto = False
+        self._carregando = False
+        self._pendentes: list[Intervalo | int] = []
+        self._recarga: asyncio.Task[int] | None = None
+
+    async def carregar(self) -> int:
+        """
+        Reconstroi o indice a partir do banco.
+
+        Chamadas simultaneas esperam a mesma reconstrucao. Retorna quantas
+        reservas divergiam do indice anterior.
+        """
+        return await asyncio.shield(self.agendar_recarga())
+
+    def agendar_recarga(self) -> asyncio.Task[int]:
+        """Inicia uma reconstrucao, se nenhuma estiver em andamento."""
+        if self._recarga is None:
+            self._recarga = asyncio.create_task(self._recarregar())
+            self._recarga.add_done_callback(self._recarga_terminada)
+        return self._recarga
+
+    def _recarga_terminada(self, recarga: asyncio.Task[int]) -> None:
+        if self._recarga is recarga:
+            self._recarga = None
+        # Quem espera pela recarga registra a falha. Uma recarga agendada sem
+        # ninguem esperando so falha de novo, e e registrada, na verificacao
+        # periodica
+        if not recarga.cancelled():
+            recarga.exception()
+
+    async def _recarregar(self) -> int:
+        """
+        Le o banco e monta o indice novo numa thread, fora do event loop.
+
+        Enquanto isso o indice atual continua respondendo, e as escritas
+        feitas nele sao guardadas e reaplicadas no novo antes da troca, que
+        acontece de uma vez, sem await no meio.
+        """
+        anteriores = dict(self.reservas) if self.pronto else None
+        self._carregando = True
+        self._pendentes = []
+
+        try:
+            novo, divergentes = await asyncio.to_thread(
+                construir_indice, anteriores
+            )
+
+            for operacao in self._pendentes:
+                if isinstance(operacao, int):
+                    divergentes.discard(operacao)
+                    novo._remover(operacao)
+                else:
+                    divergentes.discard(operacao[0])
+                    novo._registrar(*operacao)
+
+            self.salas = novo.salas
+            self.reservas = novo.reservas
+            self.grade = novo.grade
+            self.pronto = True
+        finally:
+            self._carregando = False
+            self._pendentes = []
+
+        return len(divergentes)
+
+    def registrar(self, reserva: Reserva) -> None:
+        if reserva.id is None:
+            return
+
+        self.registrar_intervalo(
+            reserva.id,
+            reserva.sala_reservada,
+            reserva.data_inicial,
+            reserva.data_final,
+        )
+
+    def registrar_intervalo(
+        self, id_reserva: int, id_sala: int, inicio: datetime, fim: datetime
+    ) -> None:
+        if self._carregando:
+            self._pendentes.append((id_reserva, id_sala, inicio, fim))
+        self._registrar(id_reserva, id_sala, inicio, fim)
+
+    def remover(self, id_reserva: int) -> None:
+        if self._carregando:
+            self._pendentes.append(id_reserva)
+        self._remover(id_reserva)
+
+    def livre(self, id_sala: int, inicio: datetime, fim: datetime) -> bool:
+        # A grade so responde exatamente para janelas alinhadas nos slots
+        if (
+            self.grade is not None
+            and self.grade.alinhado(inicio)
+            and self.grade.alinhado(fim)
+        ):
+            return self.grade.livre(id_sala, inicio, fim)
+
+        intervalos = self.salas.get(id_sala)
+        return intervalos is None or intervalos.livre(inicio, fim)
+
+    def salas_livres(
+        self, ids_salas: Iterable[int], inicio: datetime, fim: datetime
+    ) -> list[int]:
+        return [
+            id_sala for id_sala in ids_salas if self.livre(id_sala, inicio, fim)
+        ]
+
+    def periodos(
+        self, id_sala: int, inicio: datetime, fim: datetime
+    ) -> Iterator[tuple[datetime, datetime]]:
+        intervalos = self.salas.get(id_sala)
+        if intervalos is None:
+            return iter(())
+        return intervalos.periodos(inicio, fim)
+
+    def _registrar(
+        self, id_reserva: int, id_sala: int, inicio: datetime, fim: datetime
+    ) -> None:
+        self._remover(id_reserva)
+        self.reservas[id_reserva] = (id_sala, inicio, fim)
+        self.salas.setdefault(id_sala, IntervalosSala()).adicionar(
+            id_reserva, inicio, fim
+        )
+        if self.grade is not None:
+            self.grade.marcar(id_sala, inicio, fim)
+
+    def _remover(self, id_reserva: int) -> None:
+        anterior = self.reservas.pop(id_reserva, None)
+        if anterior is None:
+            return
+
+        id_sala, inicio, fim = anterior
+        self.salas[id_sala].remover(id_reserva, inicio)
+        if self.grade is not None:
+            self.grade.recalcular(id_sala, inicio, fim, self.salas[id_sala])
+
+
+def construir_indice(
+    anteriores: dict[int, tuple[int, datetime, datetime]] | None,
+) -> tuple[IndiceDisponibilidade, set[int]]:
+    """
+    Monta um indice com as reservas do banco, pelo engine sincrono.
+
+    Roda numa thread, entao so mexe no indice novo. Tambem devolve os ids
+    das reservas que estavam diferentes em anteriores.
+    """
+    novo = IndiceDisponibilidade()
+
+    with engine.connect() as conexao:
+        linhas = conexao.execution_options(yield_per=10_000).execute(
+            select(
+                Reserva.id,
+                Reserva.sala_reservada,
+                Reserva.data_inicial,
+                Reserva.data_final,
+            ).order_by(
+                col(Reserva.sala_reservada),
+                col(Reserva.data_inicial),
+                col(Reserva.id),
+            )
+        )
+        for id_reserva, id_sala, inicio, fim in linhas:
+            novo._registrar(id_reserva, id_sala, inicio, fim)
+
+    divergentes: set[int] = set()
+    if anteriores is not None:
+        divergentes = novo.reservas.keys() ^ anteriores.keys()
+        divergentes.update(
+            id_reserva
+            for id_reserva, intervalo in novo.reservas.items()
+            if anteriores.get(id_reserva, intervalo) != intervalo
+        )
+
+    return novo, divergentes
+
+
+indice = IndiceDisponibilidade()
+
+
+async def iniciar_indice() -> None:
+    if not INDICE_HABILITADO:
+        return
+
+    try:
+        await indice.carregar()
+    except Exception:
+        logger.exception(
+            "Falha ao carregar o indice de disponibilidade, usando o banco"
+        )
+
+
+async def verificar_consistencia() -> int:
+    divergencias = await indice.carregar()
+
+    if divergencias:
+        logger.warning(
+            "Indice de disponibilidade divergia do banco em %d reservas",
+            divergencias,
+        )
+
+    return divergencias
+
+
+async def verificar_periodicamente() -> None:
+    while INDICE_HABILITADO and INTERVALO_VERIFICACAO > 0:
+        await asyncio.sleep(INTERVALO_VERIFICACAO)
+        try:
+            await verificar_consistencia()
+        except Exception:
+            logger.exception("Falha ao verificar o indice de disponibilidade")
+
+
+async def buscar_conflito(
+    session: AsyncSession,
+    id_sala: int,
+    inicio: datetime,
+    fim: datetime,
+    ignorar: int | None = None,
+) -> int | None:
+    """Id da primeira reserva da sala que sobrepoe o periodo, se houver."""
+    consulta = select(Reserva.id).where(
+        Reserva.sala_reservada == id_sala,
+        Reserva.data_final > inicio,
+        Reserva.data_inicial < fim,
+    )
+    if ignorar is not None:
+        consulta = consulta.where(Reserva.id != ignorar)
+
+    return (await session.exec(consulta.limit(1))).first()
+
+
+async def confirmar_livres(
+    session: AsyncSession, ids_salas: list[int], inicio: datetime, fim: datetime
+) -> list[int]:
+    """
+    Das salas que o indice deu como livres, as que tambem estao no banco.
+
+    Se alguma estiver ocupada o indice estava desatualizado e e recarregado
+    em segundo plano.
+    """
+    if not ids_salas:
+        return ids_salas
+
+    ocupadas = set(
+        (
+            await session.exec(
+                select(Reserva.sala_reservada)
+                .where(
+                    col(Reserva.sala_reservada).in_(ids_salas),
+                    col(Reserva.data_final) > inicio,
+                    col(Reserva.data_inicial) < fim,
+                )
+                .distinct()
+            )
+        ).all()
+    )
+
+    if ocupadas:
+        logger.warning(
+            "Indice de disponibilidade desatualizado nas salas %s",
+            sorted(ocupadas),
+        )
+        indice.agendar_recarga()
+
+    return [id_sala for id_sala in ids_salas if id_sala not in ocupadas]
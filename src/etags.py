@@ -0,0 +1,57 @@
+import hashlib
+from collections.abc import Sequence
+
+from fastapi import HTTPException, Request, Response, status
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.models import ContadorAlteracoes
+
+
+def etag_versoes(*versoes: int | None) -> str:
+    return '"' + ".".join(str(versao) for versao in versoes) + '"'
+
+
+async def etag_colecao(
+    session: AsyncSession, request: Request, tabelas: Sequence[str]
+) -> str:
+    """
+    ETag de uma listagem a partir dos contadores das tabelas que ela le.
+
+    Nao depende do resultado, entao pode ser comparado antes da consulta. A
+    query string entra no hash porque filtros e cursor mudam a pagina.
+    """
+    contadores = dict(
+        (
+            await session.exec(
+                select(
+                    ContadorAlteracoes.tabela, ContadorAlteracoes.alteracoes
+                ).where(col(ContadorAlteracoes.tabela).in_(tabelas))
+            )
+        ).all()
+    )
+    conteudo = "|".join(
+        [
+            request.url.path,
+            request.url.query,
+            *(f"{tabela}={contadores.get(tabela, 0)}" for tabela in tabelas),
+        ]
+    )
+
+    return f'"{hashlib.sha256(conteudo.encode()).hexdigest()[:32]}"'
+
+
+def verificar_etag(request: Request, response: Response, etag: str) -> None:
+    """Envia o ETag e responde 304, sem corpo, se o cliente ja tem ele."""
+    response.headers["ETag"] = etag
+
+    recebidos = request.headers.get("If-None-Match")
+    if recebidos is None:
+        return
+
+    if recebidos.strip() == "*" or etag in (
+        recebido.strip().removeprefix("W/") for recebido in recebidos.split(",")
+    ):
+        raise HTTPException(
+            status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
@@ -0,0 +1,254 @@
+import asyncio
+import importlib
+import logging
+from collections import defaultdict
+from collections.abc import AsyncIterator, Iterable
+from datetime import datetime
+from typing import Literal, Protocol
+
+from environs import env
+
+from src.models import Reserva, utc_ingenuo
+from src.schemas import EventoReserva, PeriodoReserva
+
+env.read_env(".env")
+
+# "memoria" so entrega aos assinantes do proprio processo. Com varios
+# workers, modulo:Classe aponta para uma implementacao de BackendEventos
+EVENTOS_BACKEND = env.str("EVENTOS_BACKEND", "memoria")
+EVENTOS_FILA = env.int("EVENTOS_FILA", 100)
+EVENTOS_MAXIMO_ASSINANTES = env.int("EVENTOS_MAXIMO_ASSINANTES", 1000)
+# Segundos sem eventos ate mandar um comentario para manter a conexao
+EVENTOS_KEEPALIVE = env.float("EVENTOS_KEEPALIVE", 15)
+# O servidor so termina de desligar quando as conexoes fecham, entao cada
+# transmissao acaba depois desse tempo e o cliente reconecta
+EVENTOS_DURACAO_MAXIMA = env.float("EVENTOS_DURACAO_MAXIMA", 300)
+
+logger = logging.getLogger(__name__)
+
+
+class BackendEventos(Protocol):
+    """
+    Canal entre os processos da aplicacao.
+
+    Tudo que for publicado em qualquer processo deve sair no escutar de
+    todos eles, inclusive no de quem publicou.
+    """
+
+    async def publicar(self, mensagem: str) -> None: ...
+
+    def escutar(self) -> AsyncIterator[str]: ...
+
+
+class BackendMemoria:
+    """Backend de um processo so, que tambem serve de modelo nos testes."""
+
+    def __init__(self) -> None:
+        self.ouvintes: set[asyncio.Queue[str]] = set()
+
+    async def publicar(self, mensagem: str) -> None:
+        for fila in self.ouvintes:
+            fila.put_nowait(mensagem)
+
+    async def escutar(self) -> AsyncIterator[str]:
+        fila: asyncio.Queue[str] = asyncio.Queue()
+        self.ouvintes.add(fila)
+        try:
+            while True:
+                yield await fila.get()
+        finally:
+            self.ouvintes.discard(fila)
+
+
+def carregar_backend(nome: str) -> BackendEventos:
+    if nome == "memoria":
+        return BackendMemoria()
+
+    modulo, _, classe = nome.partition(":")
+    return getattr(importlib.import_module(modulo), classe)()
+
+
+class Assinatura:
+    """
+    Salas e periodo acompanhados por um cliente.
+
+    Os eventos ficam numa fila de ate EVENTOS_FILA itens. Se o cliente nao
+    acompanhar, a fila e descartada e ele recebe so o aviso para recarregar.
+    """
+
+    def __init__(
+        self,
+        salas: Iterable[int],
+        inicio: datetime | None,
+        fim: datetime | None,
+    ) -> None:
+        self.salas = frozenset(salas)
+        # Os eventos chegam em UTC sem fuso, como as datas do banco
+        self.inicio = None if inicio is None else utc_ingenuo(inicio)
+        self.fim = None if fim is None else utc_ingenuo(fim)
+        self.fila: asyncio.Queue[EventoReserva | None] = asyncio.Queue(
+            EVENTOS_FILA
+        )
+        self.atrasada = False
+
+    def cobre(self, periodo: PeriodoReserva) -> bool:
+        if self.salas and periodo.sala_reservada not in self.salas:
+            return False
+        if self.inicio is not None and periodo.data_final <= self.inicio:
+            return False
+        return self.fim is None or periodo.data_inicial < self.fim
+
+    def interessada(self, evento: EventoReserva) -> bool:
+        return self.cobre(evento) or (
+            evento.anterior is not None and self.cobre(evento.anterior)
+        )
+
+    def entregar(self, evento: EventoReserva) -> None:
+        if self.atrasada:
+            return
+
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.ressincronizar()
+
+    def ressincronizar(self) -> None:
+        """Descarta a fila e encerra a transmissao com o aviso."""
+        self.atrasada = True
+        while not self.fila.empty():
+            self.fila.get_nowait()
+        self.fila.put_nowait(None)
+
+    async def transmitir(self) -> AsyncIterator[str]:
+        """Eventos no formato text/event-stream, por EVENTOS_DURACAO_MAXIMA."""
+        loop = asyncio.get_running_loop()
+        fim = loop.time() + EVENTOS_DURACAO_MAXIMA
+
+        yield "retry: 1000\n\n"
+        while (restante := fim - loop.time()) > 0:
+            try:
+                evento = await asyncio.wait_for(
+                    self.fila.get(), min(EVENTOS_KEEPALIVE, restante)
+                )
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if evento is None:
+                yield "event: ressincronizar\ndata: {}\n\n"
+                return
+
+            yield f"event: {evento.tipo}\ndata: {evento.model_dump_json()}\n\n"
+
+
+class Difusor:
+    """
+    Distribui os eventos de reserva aos assinantes deste processo.
+
+    As rotas publicam pelo backend, e so o que volta do escutar e
+    distribuido, entao com um backend compartilhado os assinantes de todos
+    os workers recebem os mesmos eventos. As assinaturas ficam separadas
+    por sala, e cada evento so e comparado com as da sala dele e com as
+    que acompanham todas as salas.
+    """
+
+    def __init__(self, backend: BackendEventos) -> None:
+        self.backend = backend
+        self.por_sala: defaultdict[int, set[Assinatura]] = defaultdict(set)
+        self.todas_salas: set[Assinatura] = set()
+        self.total = 0
+
+    def assinar(
+        self,
+        salas: Iterable[int],
+        inicio: datetime | None = None,
+        fim: datetime | None = None,
+    ) -> Assinatura:
+        assinatura = Assinatura(salas, inicio, fim)
+        if not assinatura.salas:
+            self.todas_salas.add(assinatura)
+        for sala in assinatura.salas:
+            self.por_sala[sala].add(assinatura)
+        self.total += 1
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura) -> None:
+        self.todas_salas.discard(assinatura)
+        for sala in assinatura.salas:
+            assinaturas = self.por_sala.get(sala)
+            if assinaturas is not None:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del self.por_sala[sala]
+        self.total -= 1
+
+    def distribuir(self, evento: EventoReserva) -> None:
+        candidatas = set(self.todas_salas)
+        candidatas.update(self.por_sala.get(evento.sala_reservada, ()))
+        if evento.anterior is not None:
+            candidatas.update(
+                self.por_sala.get(evento.anterior.sala_reservada, ())
+            )
+
+        for assinatura in candidatas:
+            if assinatura.atrasada:
+                continue
+            # Uma assinatura com problema nao pode parar a entrega as outras
+            try:
+                if assinatura.interessada(evento):
+                    assinatura.entregar(evento)
+            except Exception:
+                logger.exception(
+                    "Falha ao entregar o evento da reserva %d", evento.id
+                )
+                assinatura.ressincronizar()
+
+    async def publicar(self, evento: EventoReserva) -> None:
+        # A reserva ja foi gravada, entao uma falha aqui nao desfaz a
+        # requisicao, os clientes so deixam de ver a mudanca na hora
+        try:
+            await self.backend.publicar(evento.model_dump_json())
+        except Exception:
+            logger.exception(
+                "Falha ao publicar evento da reserva %d", evento.id
+            )
+
+    async def escutar(self) -> None:
+        while True:
+            try:
+                async for mensagem in self.backend.escutar():
+                    try:
+                        evento = EventoReserva.model_validate_json(mensagem)
+                    except ValueError:
+                        logger.exception("Evento de reserva invalido")
+                        continue
+                    self.distribuir(evento)
+            except Exception:
+                logger.exception("Falha ao receber eventos de reserva")
+            # Se o backend cair ou encerrar, assina de novo
+            await asyncio.sleep(1)
+
+
+def periodo(reserva: Reserva) -> PeriodoReserva:
+    return PeriodoReserva(
+        sala_reservada=reserva.sala_reservada,
+        data_inicial=reserva.data_inicial,
+        data_final=reserva.data_final,
+    )
+
+
+def evento_reserva(
+    tipo: Literal["criada", "editada", "removida"],
+    reserva: Reserva,
+    anterior: PeriodoReserva | None = None,
+) -> EventoReserva:
+    return EventoReserva(
+        tipo=tipo,
+        id=reserva.id or 0,
+        versao=reserva.versao,
+        anterior=anterior,
+        **periodo(reserva).model_dump(),
+    )
+
+
+difusor = Difusor(carregar_backend(EVENTOS_BACKEND))
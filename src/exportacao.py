@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from typing import Any
+
+from environs import env
+from sqlalchemy import Row, Select, select
+from sqlmodel import col
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.database import async_engine
+from src.models import Reserva, Sala, Usuario
+
+env.read_env(".env")
+
+EXPORTACAO_LOTE = env.int("EXPORTACAO_LOTE", 1000)
+
+TIPOS_EXPORTACAO = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def consulta_exportacao(
+    data_inicial: datetime | None,
+    data_final: datetime | None,
+    sala: int | None,
+) -> Select[Any]:
+    consulta = (
+        select(
+            col(Reserva.id),
+            col(Reserva.sala_reservada),
+            col(Sala.nome).label("nome_sala"),
+            col(Reserva.data_inicial),
+            col(Reserva.data_final),
+            col(Reserva.descricao),
+            col(Reserva.tipo_evento),
+            col(Reserva.quantidade_pessoas),
+            col(Reserva.items),
+            col(Reserva.reservado_por),
+            col(Usuario.email),
+        )
+        .join(Sala, col(Sala.id) == Reserva.sala_reservada)
+        .join(Usuario, col(Usuario.id) == Reserva.reservado_por)
+        .order_by(col(Reserva.data_inicial), col(Reserva.id))
+    )
+
+    if data_inicial is not None:
+        consulta = consulta.where(col(Reserva.data_final) > data_inicial)
+    if data_final is not None:
+        consulta = consulta.where(col(Reserva.data_inicial) < data_final)
+    if sala is not None:
+        consulta = consulta.where(col(Reserva.sala_reservada) == sala)
+
+    return consulta
+
+
+def serializar(linhas: Sequence[Row[Any]], formato: str) -> str:
+    if formato == "csv":
+        saida = io.StringIO()
+        csv.writer(saida).writerows(
+            [
+                valor.isoformat() if isinstance(valor, datetime) else valor
+                for valor in linha
+            ]
+            for linha in linhas
+        )
+        return saida.getvalue()
+
+    return "".join(
+        json.dumps(linha._asdict(), default=datetime.isoformat) + "\n"
+        for linha in linhas
+    )
+
+
+async def exportar(consulta: Select[Any], formato: str) -> AsyncIterator[str]:
+    """
+    Serializa o resultado em lotes de EXPORTACAO_LOTE linhas.
+
+    A sessao e aberta aqui porque a dependencia get_async_session termina
+    antes do corpo da resposta ser enviado. O cursor do lado do servidor
+    mantem so um lote em memoria.
+    """
+    if formato == "csv":
+        cabecalho = io.StringIO()
+        csv.writer(cabecalho).writerow(consulta.selected_columns.keys())
+        yield cabecalho.getvalue()
+
+    async with AsyncSession(async_engine) as session:
+        resultado = await session.stream(
+            consulta.execution_options(yield_per=EXPORTACAO_LOTE)
+        )
+        async for linhas in resultado.partitions():
+            yield serializar(linhas, formato)
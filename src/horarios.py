@@ -0,0 +1,220 @@
+import heapq
+from collections.abc import Iterable, Iterator, Sequence
+from datetime import date, datetime, time, timedelta
+from itertools import groupby, islice
+
+from sqlalchemy import and_, or_
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.disponibilidade import INDICE_CONFIRMAR, indice
+from src.models import Reserva, Sala, utc_ingenuo
+from src.schemas import HorarioLivre
+from src.series import ocorrencias
+
+Periodo = tuple[datetime, datetime]
+# Abertura em UTC sem fuso, como as datas do banco, e duracao do expediente
+Expediente = tuple[time, timedelta]
+
+
+def expediente_utc(abertura: time, fechamento: time) -> Expediente:
+    """Converte um expediente, com ou sem fuso, para o formato do banco."""
+    dia = date(2000, 1, 3)
+    abre = datetime.combine(dia, abertura)
+    return utc_ingenuo(abre).time(), datetime.combine(dia, fechamento) - abre
+
+
+def lacunas(
+    ocupados: Iterable[Periodo], inicio: datetime, fim: datetime
+) -> Iterator[Periodo]:
+    """Intervalos livres da janela, dados os ocupados pela data inicial."""
+    cursor = inicio
+
+    for comeco, termino in ocupados:
+        if comeco >= fim:
+            break
+        if comeco > cursor:
+            yield cursor, comeco
+        cursor = max(cursor, termino)
+
+    if cursor < fim:
+        yield cursor, fim
+
+
+def encaixes(
+    livres: Iterable[Periodo],
+    duracao: timedelta,
+    expediente: Expediente | None,
+) -> Iterator[datetime]:
+    """Primeiro inicio possivel em cada intervalo livre e no expediente."""
+    for comeco, termino in livres:
+        if expediente is None:
+            if termino - comeco >= duracao:
+                yield comeco
+            continue
+
+        # Em UTC o expediente pode atravessar a meia-noite, entao o do dia
+        # anterior tambem pode cobrir o comeco
+        dia = comeco.date() - timedelta(days=1)
+        while (abre := datetime.combine(dia, expediente[0])) < termino:
+            inicio = max(comeco, abre)
+            fim = min(termino, abre + expediente[1])
+            if fim - inicio >= duracao:
+                yield inicio
+            dia += timedelta(days=1)
+
+
+async def buscar_horarios(
+    session: AsyncSession,
+    salas: Sequence[Sala],
+    inicio: datetime,
+    fim: datetime,
+    duracao: timedelta,
+    expediente: Expediente | None,
+    quantidade: int,
+) -> list[HorarioLivre]:
+    """
+    Os primeiros horarios livres entre todas as salas.
+
+    Com INDICE_CONFIRMAR os horarios achados pelo indice sao conferidos no
+    banco, e se algum estiver ocupado a busca e refeita pelo banco.
+    """
+    usar_indice = indice.pronto
+    horarios = await montar_horarios(
+        session,
+        salas,
+        inicio,
+        fim,
+        duracao,
+        expediente,
+        quantidade,
+        usar_indice,
+    )
+
+    if (
+        usar_indice
+        and INDICE_CONFIRMAR
+        and await algum_ocupado(session, horarios)
+    ):
+        indice.agendar_recarga()
+        horarios = await montar_horarios(
+            session,
+            salas,
+            inicio,
+            fim,
+            duracao,
+            expediente,
+            quantidade,
+            False,
+        )
+
+    return horarios
+
+
+async def algum_ocupado(
+    session: AsyncSession, horarios: Sequence[HorarioLivre]
+) -> bool:
+    """Se alguma reserva do banco sobrepoe os horarios vindos do indice."""
+    if not horarios:
+        return False
+
+    return (
+        await session.exec(
+            select(Reserva.id)
+            .where(
+                or_(
+                    *(
+                        and_(
+                            col(Reserva.sala_reservada) == horario.sala,
+                            col(Reserva.data_final) > horario.data_inicial,
+                            col(Reserva.data_inicial) < horario.data_final,
+                        )
+                        for horario in horarios
+                    )
+                )
+            )
+            .limit(1)
+        )
+    ).first() is not None
+
+
+async def montar_horarios(
+    session: AsyncSession,
+    salas: Sequence[Sala],
+    inicio: datetime,
+    fim: datetime,
+    duracao: timedelta,
+    expediente: Expediente | None,
+    quantidade: int,
+    usar_indice: bool,
+) -> list[HorarioLivre]:
+    """
+    Cada sala gera seus horarios em ordem, varrendo uma vez as reservas e
+    ocorrencias ordenadas. O heapq.merge junta as salas e so consome de
+    cada uma o necessario para achar os primeiros.
+    """
+    ids_salas = [sala.id for sala in salas if sala.id is not None]
+    ocupados: dict[int, list[Iterable[Periodo]]] = {
+        id_sala: [] for id_sala in ids_salas
+    }
+
+    if usar_indice:
+        for id_sala in ids_salas:
+            ocupados[id_sala].append(indice.periodos(id_sala, inicio, fim))
+    else:
+        linhas = (
+            await session.exec(
+                select(
+                    Reserva.sala_reservada,
+                    Reserva.data_inicial,
+                    Reserva.data_final,
+                )
+                .where(
+                    col(Reserva.sala_reservada).in_(ids_salas),
+                    col(Reserva.data_final) > inicio,
+                    col(Reserva.data_inicial) < fim,
+                )
+                .order_by(
+                    col(Reserva.sala_reservada), col(Reserva.data_inicial)
+                )
+            )
+        ).all()
+        for id_sala, grupo in groupby(linhas, key=lambda linha: linha[0]):
+            ocupados[id_sala].append(
+                [(comeco, termino) for _, comeco, termino in grupo]
+            )
+
+    for id_sala, grupo_series in groupby(
+        sorted(
+            await ocorrencias(session, inicio, fim, ids_salas),
+            key=lambda ocorrencia: ocorrencia.sala_reservada,
+        ),
+        key=lambda ocorrencia: ocorrencia.sala_reservada,
+    ):
+        ocupados[id_sala].append(
+            [
+                (ocorrencia.data_inicial, ocorrencia.data_final)
+                for ocorrencia in grupo_series
+            ]
+        )
+
+    def horarios_da_sala(sala: Sala) -> Iterator[tuple[datetime, int, Sala]]:
+        periodos = heapq.merge(*ocupados[sala.id or 0])
+        for comeco in encaixes(
+            lacunas(periodos, inicio, fim), duracao, expediente
+        ):
+            yield comeco, sala.id or 0, sala
+
+    return [
+        HorarioLivre(
+            sala=sala.id or 0,
+            nome=sala.nome,
+            capacidade=sala.capacidade,
+            data_inicial=comeco,
+            data_final=comeco + duracao,
+        )
+        for comeco, _, sala in islice(
+            heapq.merge(*(horarios_da_sala(sala) for sala in salas)),
+            quantidade,
+        )
+    ]
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+
+from environs import env
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.cache import CacheTTL
+
+env.read_env(".env")
+
+IDEMPOTENCIA_TAMANHO = env.int("IDEMPOTENCIA_TAMANHO", 10_000)
+IDEMPOTENCIA_TTL = env.float("IDEMPOTENCIA_TTL", 24 * 60 * 60)
+# O corpo fica na memoria ate a resposta, entao tem um teto
+IDEMPOTENCIA_CORPO_MAXIMO = env.int("IDEMPOTENCIA_CORPO_MAXIMO", 1024 * 1024)
+TAMANHO_MAXIMO_CHAVE = 255
+
+ROTAS_IDEMPOTENTES = (
+    ("POST", "/api/v1/reservas/"),
+    ("POST", "/api/v1/usuarios/registrar"),
+)
+
+
+class RespostaGuardada:
+    __slots__ = ("corpo", "digest", "headers", "status")
+
+    def __init__(
+        self, digest: bytes, status: int, headers: list[tuple[bytes, bytes]]
+    ) -> None:
+        self.digest = digest
+        self.status = status
+        self.headers = headers
+        self.corpo = bytearray()
+
+
+respostas: CacheTTL[bytes, RespostaGuardada] = CacheTTL(
+    IDEMPOTENCIA_TAMANHO, IDEMPOTENCIA_TTL
+)
+em_andamento: dict[bytes, asyncio.Event] = {}
+
+
+def erro(status: int, detalhe: str) -> JSONResponse:
+    return JSONResponse({"detail": detalhe}, status_code=status)
+
+
+class MiddlewareIdempotencia:
+    """
+    Repete a resposta de um POST ja atendido com o mesmo Idempotency-Key.
+
+    A chave vale por rota e por cabecalho Authorization, e o corpo tem que
+    ser o mesmo da primeira requisicao. Sem Authorization, como no
+    registro, o corpo tambem entra na chave, para clientes anonimos que
+    escolham a mesma chave nao receberem a resposta um do outro. Respostas
+    de status abaixo de 500 ficam guardadas por IDEMPOTENCIA_TTL e sao
+    devolvidas sem passar pela validacao, pelo hash da senha ou pelo banco.
+    Uma repeticao que chega enquanto a primeira ainda esta em andamento
+    espera por ela.
+
+    As respostas ficam na memoria do processo: com varios workers, uma
+    repeticao que cai em outro worker executa de novo, e nesse caso quem
+    protege contra duplicatas sao as verificacoes das proprias rotas.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if (
+            scope["type"] != "http"
+            or (scope["method"], scope["path"]) not in ROTAS_IDEMPOTENTES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        chave_cliente = headers.get("idempotency-key")
+        if chave_cliente is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not chave_cliente or len(chave_cliente) > TAMANHO_MAXIMO_CHAVE:
+            await erro(400, "Idempotency-Key invalida")(scope, receive, send)
+            return
+
+        tamanho = headers.get("content-length", "")
+        if tamanho.isdigit() and int(tamanho) > IDEMPOTENCIA_CORPO_MAXIMO:
+            await erro(413, "Corpo maior que o tamanho maximo permitido")(
+                scope, receive, send
+            )
+            return
+
+        corpo = bytearray()
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                return
+            corpo += mensagem.get("body", b"")
+            if len(corpo) > IDEMPOTENCIA_CORPO_MAXIMO:
+                await erro(413, "Corpo maior que o tamanho maximo permitido")(
+                    scope, receive, send
+                )
+                return
+            if not mensagem.get("more_body", False):
+                break
+
+        digest = hashlib.sha256(corpo).digest()
+        autorizacao = headers.get("authorization", "")
+        chave = hashlib.sha256(
+            "\0".join(
+                (
+                    scope["method"],
+                    scope["path"],
+                    autorizacao or digest.hex(),
+                    chave_cliente,
+                )
+            ).encode()
+        ).digest()
+
+        while (andamento := em_andamento.get(chave)) is not None:
+            await andamento.wait()
+
+        guardada = respostas.obter(chave)
+        if guardada is not None:
+            if guardada.digest != digest:
+                await erro(422, "Idempotency-Key ja usada com outro corpo")(
+                    scope, receive, send
+                )
+                return
+
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": guardada.status,
+                    "headers": [
+                        *guardada.headers,
+                        (b"idempotent-replayed", b"true"),
+                    ],
+                }
+            )
+            await send(
+                {"type": "http.response.body", "body": bytes(guardada.corpo)}
+            )
+            return
+
+        entregue = False
+
+        async def receber() -> Message:
+            nonlocal entregue
+            if not entregue:
+                entregue = True
+                return {"type": "http.request", "body": bytes(corpo)}
+            return await receive()
+
+        resposta: RespostaGuardada | None = None
+
+        async def enviar(mensagem: Message) -> None:
+            nonlocal resposta
+            if mensagem["type"] == "http.response.start":
+                resposta = RespostaGuardada(
+                    digest, mensagem["status"], list(mensagem["headers"])
+                )
+            elif (
+                mensagem["type"] == "http.response.body"
+                and resposta is not None
+            ):
+                resposta.corpo += mensagem.get("body", b"")
+                # Erros do servidor podem ser passageiros, entao a proxima
+                # tentativa executa de novo
+                if not mensagem.get("more_body", False) and (
+                    resposta.status < 500
+                ):
+                    respostas.guardar(chave, resposta)
+            await send(mensagem)
+
+        andamento = em_andamento[chave] = asyncio.Event()
+        try:
+            await self.app(scope, receber, enviar)
+        finally:
+            del em_andamento[chave]
+            andamento.set()
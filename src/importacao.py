@@ -0,0 +1,356 @@
+import codecs
+import csv
+import json
+import tempfile
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime
+from typing import IO, Any
+
+from environs import env
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import and_, insert, or_
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.arquivamento import periodo_arquivado
+from src.cache import cache_salas
+from src.database import bloquear_escrita, bloquear_salas
+from src.disponibilidade import IntervalosSala, indice
+from src.models import Reserva, ReservaBase
+from src.schemas import ErroImportacao, RelatorioImportacao
+from src.series import ocorrencias
+
+env.read_env(".env")
+
+IMPORTACAO_LOTE = env.int("IMPORTACAO_LOTE", 1000)
+IMPORTACAO_LINHA_MAXIMA = env.int("IMPORTACAO_LINHA_MAXIMA", 64 * 1024)
+# Acima disso as linhas validadas vao da memoria para um arquivo temporario
+IMPORTACAO_MEMORIA = env.int("IMPORTACAO_MEMORIA", 8 * 1024 * 1024)
+IMPORTACAO_ERROS_MAXIMO = env.int("IMPORTACAO_ERROS_MAXIMO", 1000)
+
+FORMATOS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def obter_formato(content_type: str) -> str:
+    formato = FORMATOS.get(content_type.split(";")[0].strip().lower())
+
+    if formato is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Formato nao suportado, use um de: {', '.join(FORMATOS)}",
+        )
+
+    return formato
+
+
+async def ler_linhas(corpo: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Separa o corpo em linhas conforme os pedacos chegam.
+
+    So a linha incompleta fica em memoria, limitada por
+    IMPORTACAO_LINHA_MAXIMA.
+    """
+    # utf-8-sig descarta o BOM que alguns editores poem antes do cabecalho
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    resto = ""
+
+    try:
+        async for pedaco in corpo:
+            *linhas, resto = (resto + decodificador.decode(pedaco)).split("\n")
+
+            if len(resto) > IMPORTACAO_LINHA_MAXIMA:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Linha maior que o tamanho maximo permitido",
+                )
+
+            for linha in linhas:
+                yield linha.removesuffix("\r")
+
+        resto += decodificador.decode(b"", final=True)
+    except UnicodeDecodeError as erro:
+        raise HTTPException(400, "O arquivo deve estar em UTF-8") from erro
+
+    if resto:
+        yield resto.removesuffix("\r")
+
+
+class ImportadorReservas:
+    """
+    Valida o arquivo inteiro e depois grava as reservas em lotes.
+
+    As linhas validas vao para um arquivo temporario, entao o banco so e
+    reservado para escrita depois que o corpo terminou de chegar. Cada lote
+    e comparado de uma vez com as reservas do banco, numa unica consulta
+    pelas salas e periodos do lote, e com as linhas ja aceitas. Todos os
+    lotes ficam na mesma transacao, entao a importacao e gravada inteira ou
+    nao e gravada; com atomico, qualquer linha com erro tambem a desfaz.
+    """
+
+    def __init__(
+        self, session: AsyncSession, usuario: int, atomico: bool = False
+    ) -> None:
+        self.session = session
+        self.usuario = usuario
+        self.atomico = atomico
+        self.relatorio = RelatorioImportacao()
+        self.salas: set[int] = set()
+
+    def erro(self, linha: int, mensagem: str) -> None:
+        if len(self.relatorio.erros) >= IMPORTACAO_ERROS_MAXIMO:
+            self.relatorio.erros_omitidos += 1
+            return
+        self.relatorio.erros.append(ErroImportacao(linha=linha, erro=mensagem))
+
+    def falhou(self) -> bool:
+        return bool(self.relatorio.erros or self.relatorio.erros_omitidos)
+
+    async def importar(
+        self, corpo: AsyncIterator[bytes], formato: str
+    ) -> RelatorioImportacao:
+        with tempfile.SpooledTemporaryFile(
+            IMPORTACAO_MEMORIA, "w+", encoding="utf-8"
+        ) as validas:
+            await self.validar(corpo, formato, validas)
+
+            if not (self.atomico and self.falhou()):
+                validas.seek(0)
+                await self.gravar(validas)
+
+        self.relatorio.erros.sort(key=lambda erro: erro.linha)
+
+        return self.relatorio
+
+    async def validar(
+        self, corpo: AsyncIterator[bytes], formato: str, validas: IO[str]
+    ) -> None:
+        cabecalho: list[str] | None = None
+        numero = 0
+
+        async for linha in ler_linhas(corpo):
+            numero += 1
+
+            if not linha.strip():
+                continue
+
+            if formato == "csv":
+                # Campos entre aspas com quebra de linha nao sao suportados
+                valores = next(csv.reader([linha]))
+                if cabecalho is None:
+                    cabecalho = [valor.strip() for valor in valores]
+                    continue
+                if len(valores) != len(cabecalho):
+                    self.erro(
+                        numero, "Numero de colunas diferente do cabecalho"
+                    )
+                    continue
+                dados = dict(zip(cabecalho, valores, strict=True))
+            else:
+                try:
+                    dados = json.loads(linha)
+                except json.JSONDecodeError:
+                    self.erro(numero, "JSON invalido")
+                    continue
+                if not isinstance(dados, dict):
+                    self.erro(numero, "A linha deve ser um objeto JSON")
+                    continue
+
+            reserva = self.adicionar(numero, dados)
+            if reserva is not None:
+                self.salas.add(reserva.sala_reservada)
+                validas.write(f"{numero}\t{reserva.model_dump_json()}\n")
+
+    async def gravar(self, validas: IO[str]) -> None:
+        await bloquear_escrita(self.session)
+        await bloquear_salas(self.session, self.salas)
+
+        gravadas: list[tuple[int, int, datetime, datetime]] = []
+
+        for lote in lotes(validas):
+            gravadas += await self.inserir(await self.conferir_lote(lote))
+
+        if self.atomico and self.falhou():
+            await self.session.rollback()
+            return
+
+        await self.session.commit()
+        self.relatorio.inseridas = len(gravadas)
+        for intervalo in gravadas:
+            indice.registrar_intervalo(*intervalo)
+
+    def adicionar(
+        self, linha: int, dados: dict[str, Any]
+    ) -> ReservaBase | None:
+        try:
+            reserva = ReservaBase.model_validate(dados)
+        except ValidationError as erro:
+            self.erro(
+                linha,
+                "; ".join(
+                    f"{'.'.join(map(str, detalhe['loc']))}: {detalhe['msg']}"
+                    for detalhe in erro.errors()
+                ),
+            )
+            return None
+
+        if reserva.data_final <= reserva.data_inicial:
+            self.erro(linha, "A data final deve ser maior que a inicial")
+            return None
+
+        if periodo_arquivado(reserva.data_final):
+            self.erro(linha, "Periodo ja arquivado, nao aceita reservas")
+            return None
+
+        return reserva
+
+    async def conferir_lote(
+        self, lote: list[tuple[int, ReservaBase]]
+    ) -> list[tuple[int, dict[str, Any]]]:
+        """Separa as linhas do lote que nao conflitam com nada."""
+        salas = await cache_salas.obter_varias(
+            self.session, (reserva.sala_reservada for _, reserva in lote)
+        )
+
+        periodos: dict[int, tuple[datetime, datetime]] = {}
+        for _, reserva in lote:
+            id_sala = reserva.sala_reservada
+            if id_sala not in salas:
+                continue
+            inicio, fim = periodos.get(
+                id_sala, (reserva.data_inicial, reserva.data_final)
+            )
+            periodos[id_sala] = (
+                min(inicio, reserva.data_inicial),
+                max(fim, reserva.data_final),
+            )
+
+        ocupadas = {id_sala: IntervalosSala() for id_sala in periodos}
+        series = {id_sala: IntervalosSala() for id_sala in periodos}
+
+        if periodos:
+            existentes = await self.session.exec(
+                select(
+                    Reserva.id,
+                    Reserva.sala_reservada,
+                    Reserva.data_inicial,
+                    Reserva.data_final,
+                ).where(
+                    or_(
+                        *(
+                            and_(
+                                col(Reserva.sala_reservada) == id_sala,
+                                col(Reserva.data_final) > inicio,
+                                col(Reserva.data_inicial) < fim,
+                            )
+                            for id_sala, (inicio, fim) in periodos.items()
+                        )
+                    )
+                )
+            )
+            for id_reserva, id_sala, inicio, fim in existentes:
+                ocupadas[id_sala].adicionar(id_reserva or 0, inicio, fim)
+
+            for ocorrencia in await ocorrencias(
+                self.session,
+                min(inicio for inicio, _ in periodos.values()),
+                max(fim for _, fim in periodos.values()),
+                periodos.keys(),
+            ):
+                series[ocorrencia.sala_reservada].adicionar(
+                    ocorrencia.serie,
+                    ocorrencia.data_inicial,
+                    ocorrencia.data_final,
+                )
+
+        novas = []
+
+        for linha, reserva in sorted(
+            lote,
+            key=lambda item: (item[1].sala_reservada, item[1].data_inicial),
+        ):
+            id_sala = reserva.sala_reservada
+
+            if id_sala not in salas:
+                self.erro(linha, f"Sala {id_sala} nao foi encontrada")
+                continue
+
+            intervalos = ocupadas[id_sala]
+            conflitos = intervalos.conflitos(
+                reserva.data_inicial, reserva.data_final
+            )
+
+            if conflitos:
+                # Linhas aceitas do lote entram com o numero negativo como id
+                conflito = conflitos[0]
+                self.erro(
+                    linha,
+                    f"Sala já reservada nesse período pela reserva {conflito}"
+                    if conflito > 0
+                    else f"Sala já reservada nesse período pela linha {-conflito}",
+                )
+                continue
+
+            conflitos = series[id_sala].conflitos(
+                reserva.data_inicial, reserva.data_final
+            )
+
+            if conflitos:
+                self.erro(
+                    linha,
+                    f"Sala já reservada nesse período pela série {conflitos[0]}",
+                )
+                continue
+
+            intervalos.adicionar(
+                -linha, reserva.data_inicial, reserva.data_final
+            )
+            novas.append(
+                (linha, reserva.model_dump() | {"reservado_por": self.usuario})
+            )
+
+        return novas
+
+    async def inserir(
+        self, novas: list[tuple[int, dict[str, Any]]]
+    ) -> list[tuple[int, int, datetime, datetime]]:
+        """Insere as linhas e devolve os periodos gravados, para o indice."""
+        if not novas:
+            return []
+
+        conexao = await self.session.connection()
+        gravadas = await conexao.execute(
+            insert(Reserva).returning(
+                col(Reserva.id),
+                col(Reserva.sala_reservada),
+                col(Reserva.data_inicial),
+                col(Reserva.data_final),
+            ),
+            [dados for _, dados in novas],
+        )
+        return [
+            (id_reserva, id_sala, inicio, fim)
+            for id_reserva, id_sala, inicio, fim in gravadas
+            if id_reserva is not None
+        ]
+
+
+def lotes(validas: IO[str]) -> Iterator[list[tuple[int, ReservaBase]]]:
+    """Le as linhas validadas em lotes de IMPORTACAO_LOTE."""
+    lote: list[tuple[int, ReservaBase]] = []
+
+    for registro in validas:
+        linha, dados = registro.split("\t", 1)
+        lote.append((int(linha), ReservaBase.model_validate_json(dados)))
+
+        if len(lote) >= IMPORTACAO_LOTE:
+            yield lote
+            lote = []
+
+    if lote:
+        yield lote
@@ -0,0 +1,202 @@
+import logging
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Sequence
+from importlib.abc import Loader, MetaPathFinder
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Any
+
+from environs import env
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+env.read_env(".env")
+
+# Mede as importacoes desde src/__init__.py e registra no log quanto cada
+# pacote levou, quanto demorou o lifespan e quando chegou a 1a requisicao
+RELATORIO_INICIALIZACAO = env.bool("RELATORIO_INICIALIZACAO", False)
+RELATORIO_PACOTES = env.int("RELATORIO_INICIALIZACAO_PACOTES", 15)
+
+# Sem o admin o starlette_admin nem chega a ser importado
+ADMIN_HABILITADO = env.bool("ADMIN_HABILITADO", True)
+
+logger = logging.getLogger(__name__)
+
+inicio = time.perf_counter()
+
+
+def pacote(nome: str) -> str:
+    # Os modulos do projeto aparecem separados, os outros pelo pacote raiz
+    raiz = nome.partition(".")[0]
+    return nome if raiz == "src" else raiz
+
+
+class CarregadorMedido(Loader):
+    def __init__(self, carregador: Loader, medidor: "MedidorImportacoes"):
+        self.carregador = carregador
+        self.medidor = medidor
+
+    def __getattr__(self, nome: str) -> Any:
+        return getattr(self.carregador, nome)
+
+    def create_module(self, spec: ModuleSpec) -> ModuleType | None:
+        return self.carregador.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        self.medidor.comecar()
+        try:
+            self.carregador.exec_module(module)
+        finally:
+            self.medidor.terminar(module.__name__)
+            # Quem inspeciona o modulo depois ve o carregador original
+            module.__loader__ = self.carregador
+            if module.__spec__ is not None:
+                module.__spec__.loader = self.carregador
+
+
+class MedidorImportacoes(MetaPathFinder):
+    """
+    Soma o tempo proprio de cada modulo importado, como o -X importtime.
+
+    Fica na frente do sys.meta_path e so embrulha o carregador que os
+    outros finders encontrarem. O tempo dos submodulos importados durante a
+    execucao de um modulo e descontado dele.
+    """
+
+    def __init__(self) -> None:
+        self.tempos: defaultdict[str, float] = defaultdict(float)
+        self.pilha: list[list[float]] = []
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Sequence[str] | None,
+        target: ModuleType | None = None,
+    ) -> ModuleSpec | None:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = CarregadorMedido(spec.loader, self)
+        return spec
+
+    def comecar(self) -> None:
+        self.pilha.append([time.perf_counter(), 0.0])
+
+    def terminar(self, nome: str) -> None:
+        comeco, filhos = self.pilha.pop()
+        total = time.perf_counter() - comeco
+        self.tempos[pacote(nome)] += total - filhos
+        if self.pilha:
+            self.pilha[-1][1] += total
+
+    def remover(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+medidor = MedidorImportacoes()
+etapas: dict[str, float] = {}
+
+
+def instalar() -> None:
+    if RELATORIO_INICIALIZACAO and medidor not in sys.meta_path:
+        sys.meta_path.insert(0, medidor)
+
+
+def marcar(etapa: str) -> None:
+    etapas.setdefault(etapa, time.perf_counter() - inicio)
+
+
+def relatar_inicializacao() -> None:
+    """Registra no log as etapas ate aqui e os pacotes mais lentos."""
+    if not RELATORIO_INICIALIZACAO:
+        return
+
+    medidor.remover()
+    marcar("pronto")
+
+    linhas = [
+        f"  {etapa:<30} {segundos * 1000:9.1f} ms"
+        for etapa, segundos in etapas.items()
+    ]
+    mais_lentos = sorted(
+        medidor.tempos.items(), key=lambda item: item[1], reverse=True
+    )
+    linhas.append(
+        f"  importacoes medidas: {len(medidor.tempos)} pacotes, "
+        f"{sum(medidor.tempos.values()) * 1000:.1f} ms"
+    )
+    linhas.extend(
+        f"    {nome:<28} {segundos * 1000:9.1f} ms"
+        for nome, segundos in mais_lentos[:RELATORIO_PACOTES]
+    )
+
+    logger.warning("Inicializacao:\n%s", "\n".join(linhas))
+
+
+class MiddlewarePrimeiraRequisicao:
+    """Registra quanto tempo o processo levou ate responder a 1a requisicao."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.respondida = False
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if self.respondida or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.respondida = True
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            marcar("primeira requisicao")
+            logger.warning(
+                "Primeira requisicao (%s %s) respondida em %.1f ms desde o "
+                "inicio",
+                scope["method"],
+                scope["path"],
+                etapas["primeira requisicao"] * 1000,
+            )
+
+
+class AdminSobDemanda:
+    """
+    Monta o starlette_admin na primeira requisicao para /admin.
+
+    O Mount do FastAPI so consulta routes para montar urls do admin, entao
+    o pacote e as views so sao importados quando alguem usa o admin.
+    """
+
+    def __init__(self) -> None:
+        self._app: ASGIApp | None = None
+
+    def carregar(self) -> Any:
+        if self._app is None:
+            from starlette.applications import Starlette
+
+            from src.admin import admin
+
+            montagem = Starlette()
+            admin.mount_to(montagem)
+            self._app = montagem.routes[0].app  # type: ignore[attr-defined]
+        return self._app
+
+    @property
+    def routes(self) -> list[Any]:
+        return self.carregar().routes
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        await self.carregar()(scope, receive, send)
@@ -0,0 +1,284 @@
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Iterator, Sequence
+from contextvars import ContextVar
+
+from environs import env
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+env.read_env(".env")
+
+METRICAS_HABILITADAS = env.bool("METRICAS_HABILITADAS", True)
+
+PREFIXO = "reserva_salas"
+LIMITES_SEGUNDOS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Rotulos = tuple[str, ...]
+
+
+def escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrica(ABC):
+    """
+    Base das metricas, guardadas por tupla de valores dos rotulos.
+
+    Registrar um valor e so uma operacao num dict. O texto no formato do
+    Prometheus so e montado quando /metrics e consultado.
+    """
+
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = f"{PREFIXO}_{nome}"
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        metricas.append(self)
+
+    def formatar_rotulos(
+        self, valores: Rotulos, extra: tuple[str, str] | None = None
+    ) -> str:
+        pares = list(zip(self.rotulos, valores, strict=True))
+        if extra is not None:
+            pares.append(extra)
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+    def exportar(self) -> Iterator[str]:
+        yield f"# HELP {self.nome} {self.ajuda}"
+        yield f"# TYPE {self.nome} {self.tipo}"
+        yield from self.amostras()
+
+    @abstractmethod
+    def amostras(self) -> Iterator[str]: ...
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self.valores: dict[Rotulos, float] = {}
+
+    def incrementar(self, rotulos: Rotulos = (), valor: float = 1) -> None:
+        self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+    def definir(self, rotulos: Rotulos, valor: float) -> None:
+        self.valores[rotulos] = valor
+
+    def amostras(self) -> Iterator[str]:
+        for rotulos, valor in list(self.valores.items()):
+            yield f"{self.nome}{self.formatar_rotulos(rotulos)} {valor}"
+
+
+class Medidor(Contador):
+    tipo = "gauge"
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: Sequence[str] = (),
+        limites: Sequence[float] = LIMITES_SEGUNDOS,
+    ):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(limites)
+        # Contagem de cada faixa (a ultima e a +Inf) seguida da soma
+        self.series: dict[Rotulos, list[float]] = {}
+
+    def observar(self, rotulos: Rotulos, valor: float) -> None:
+        serie = self.series.get(rotulos)
+        if serie is None:
+            serie = self.series[rotulos] = [0] * (len(self.limites) + 2)
+        serie[bisect_left(self.limites, valor)] += 1
+        serie[-1] += valor
+
+    def amostras(self) -> Iterator[str]:
+        for rotulos, serie in list(self.series.items()):
+            acumulado = 0.0
+            for limite, quantidade in zip(
+                (*self.limites, "+Inf"), serie[:-1], strict=True
+            ):
+                acumulado += quantidade
+                faixa = self.formatar_rotulos(rotulos, ("le", str(limite)))
+                yield f"{self.nome}_bucket{faixa} {acumulado}"
+
+            yield f"{self.nome}_sum{self.formatar_rotulos(rotulos)} {serie[-1]}"
+            yield f"{self.nome}_count{self.formatar_rotulos(rotulos)} {acumulado}"
+
+
+metricas: list[Metrica] = []
+
+requisicoes = Contador(
+    "http_requisicoes_total",
+    "Requisicoes HTTP respondidas",
+    ("metodo", "rota", "status"),
+)
+duracao_requisicoes = Histograma(
+    "http_requisicao_duracao_segundos",
+    "Tempo de resposta das requisicoes HTTP",
+    ("metodo", "rota"),
+)
+requisicoes_em_andamento = Medidor(
+    "http_requisicoes_em_andamento",
+    "Requisicoes HTTP sendo atendidas",
+    ("metodo",),
+)
+consultas_por_requisicao = Histograma(
+    "http_requisicao_consultas_sql",
+    "Consultas SQL feitas por requisicao",
+    ("metodo", "rota"),
+    LIMITES_CONSULTAS,
+)
+tempo_sql_por_requisicao = Histograma(
+    "http_requisicao_tempo_sql_segundos",
+    "Tempo gasto em consultas SQL por requisicao",
+    ("metodo", "rota"),
+)
+espera_pool_por_requisicao = Histograma(
+    "http_requisicao_espera_pool_segundos",
+    "Tempo esperando conexoes do pool por requisicao",
+    ("metodo", "rota"),
+)
+consultas = Contador("sql_consultas_total", "Consultas SQL executadas")
+duracao_consultas = Histograma(
+    "sql_consulta_duracao_segundos", "Tempo de cada consulta SQL"
+)
+espera_pool = Histograma(
+    "sql_pool_espera_segundos", "Tempo para obter uma conexao do pool"
+)
+
+# Copiados do estado da aplicacao quando /metrics e consultado
+conexoes_pool = Medidor(
+    "sql_pool_conexoes", "Conexoes do pool por estado", ("estado",)
+)
+consultas_cache = Contador(
+    "cache_consultas_total",
+    "Consultas aos caches de salas",
+    ("cache", "resultado"),
+)
+entradas_cache = Medidor(
+    "cache_entradas", "Entradas nos caches de salas", ("cache",)
+)
+reservas_indice = Medidor(
+    "indice_reservas", "Reservas no indice de disponibilidade"
+)
+assinaturas_eventos = Medidor(
+    "eventos_assinaturas", "Clientes acompanhando os eventos de reserva"
+)
+
+
+class EstatisticasRequisicao:
+    __slots__ = ("consultas", "espera_pool", "tempo_sql")
+
+    def __init__(self) -> None:
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.espera_pool = 0.0
+
+
+requisicao_atual: ContextVar[EstatisticasRequisicao | None] = ContextVar(
+    "requisicao_atual", default=None
+)
+
+
+def registrar_consulta(duracao: float) -> None:
+    consultas.incrementar()
+    duracao_consultas.observar((), duracao)
+
+    estatisticas = requisicao_atual.get()
+    if estatisticas is not None:
+        estatisticas.consultas += 1
+        estatisticas.tempo_sql += duracao
+
+
+def registrar_espera_pool(duracao: float) -> None:
+    espera_pool.observar((), duracao)
+
+    estatisticas = requisicao_atual.get()
+    if estatisticas is not None:
+        estatisticas.espera_pool += duracao
+
+
+def exportar() -> str:
+    return (
+        "\n".join(linha for metrica in metricas for linha in metrica.exportar())
+        + "\n"
+    )
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI puro que mede cada requisicao HTTP.
+
+    A rota usada nos rotulos e o modelo do caminho (/salas/{id_sala}), que
+    o FastAPI deixa no scope depois de escolher a rota, para que o numero
+    de series nao cresca com os ids. Tudo fica em memoria ate alguem
+    consultar /metrics.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        status = 500
+
+        async def enviar(mensagem: Message) -> None:
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        estatisticas = EstatisticasRequisicao()
+        token = requisicao_atual.set(estatisticas)
+        requisicoes_em_andamento.incrementar((metodo,))
+        comeco = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - comeco
+            requisicoes_em_andamento.incrementar((metodo,), -1)
+            requisicao_atual.reset(token)
+
+            # Aplicacoes montadas, como o admin, ficam com o prefixo da montagem
+            rota = getattr(scope.get("route"), "path", None)
+            if rota is None:
+                rota = scope.get("root_path") or "desconhecida"
+            rotulos = (metodo, rota)
+            requisicoes.incrementar((metodo, rota, str(status)))
+            duracao_requisicoes.observar(rotulos, duracao)
+            consultas_por_requisicao.observar(rotulos, estatisticas.consultas)
+            tempo_sql_por_requisicao.observar(rotulos, estatisticas.tempo_sql)
+            espera_pool_por_requisicao.observar(
+                rotulos, estatisticas.espera_pool
+            )
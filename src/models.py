@@ -1,8 +1,22 @@
-from datetime import datetime
+from datetime import UTC, datetime
+from typing import Annotated, Any, ClassVar, Self
 
+from pydantic import AfterValidator, model_validator
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
+def utc_ingenuo(valor: datetime) -> datetime:
+    """Datas com fuso viram UTC sem fuso, como sao guardadas no banco."""
+    if valor.tzinfo is None:
+        return valor
+    return valor.astimezone(UTC).replace(tzinfo=None)
+
+
+# Datas recebidas pela API, sempre comparaveis com as do banco e do indice
+DataHora = Annotated[datetime, AfterValidator(utc_ingenuo)]
+
+
 class Usuario(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     usuario: str
@@ -10,19 +24,171 @@ class Usuario(SQLModel, table=True):
     senha: str
 
 
-class Sala(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
+class SalaBase(SQLModel):
     nome: str
     capacidade: int = Field(gt=0)
 
 
-class Reserva(SQLModel, table=True):
+class Sala(SalaBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    reservado_por: int | None = Field(default=None, foreign_key="usuario.id")
+    versao: int = 1
+
+
+class Atualizacao(SQLModel):
+    """
+    Corpo de um PATCH: os campos omitidos ficam como estao.
+
+    null so e aceito nos campos de anulaveis, os outros sao colunas NOT NULL.
+    """
+
+    anulaveis: ClassVar[frozenset[str]] = frozenset()
+
+    @model_validator(mode="after")
+    def recusar_nulos(self) -> Self:
+        nulos = sorted(
+            campo
+            for campo in self.model_fields_set
+            if campo not in self.anulaveis and getattr(self, campo) is None
+        )
+        if nulos:
+            raise ValueError(f"Campos que nao aceitam null: {', '.join(nulos)}")
+        return self
+
+    def aplicar(self, registro: SQLModel) -> dict[str, Any]:
+        """
+        Copia os campos enviados para o registro e valida o resultado.
+
+        Levanta ValidationError se o registro ficar invalido, antes de
+        qualquer consulta ao banco.
+        """
+        alteracoes = self.model_dump(exclude_unset=True)
+        registro.sqlmodel_update(alteracoes)
+        type(self).model_validate(
+            registro.model_dump(include=set(type(self).model_fields))
+        )
+        return alteracoes
+
+
+class SalaAtualizacao(Atualizacao):
+    nome: str | None = None
+    capacidade: int | None = Field(default=None, gt=0)
+
+
+class ReservaBase(SQLModel):
     sala_reservada: int = Field(foreign_key="sala.id", nullable=False)
-    data_inicial: datetime
-    data_final: datetime
+    data_inicial: DataHora
+    data_final: DataHora
     descricao: str
     tipo_evento: str
     quantidade_pessoas: int
     items: str = Field(nullable=True)
+
+
+class Reserva(ReservaBase, table=True):
+    __table_args__ = (
+        Index(
+            "ix_reserva_sala_periodo",
+            "sala_reservada",
+            "data_final",
+            "data_inicial",
+        ),
+        Index("ix_reserva_data_inicial", "data_inicial", "id"),
+        Index(
+            "ix_reserva_usuario_data_inicial",
+            "reservado_por",
+            "data_inicial",
+            "id",
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    reservado_por: int | None = Field(default=None, foreign_key="usuario.id")
+    versao: int = 1
+
+
+class ReservaHistorico(ReservaBase, table=True):
+    """
+    Reserva que terminou antes do horizonte de arquivamento.
+
+    Mantem o id que tinha em Reserva, para que links e cursores continuem
+    valendo.
+    """
+
+    __table_args__ = (
+        Index("ix_reservahistorico_data_inicial", "data_inicial", "id"),
+        Index(
+            "ix_reservahistorico_usuario_data_inicial",
+            "reservado_por",
+            "data_inicial",
+            "id",
+        ),
+    )
+
+    id: int | None = Field(
+        default=None,
+        primary_key=True,
+        sa_column_kwargs={"autoincrement": False},
+    )
+    reservado_por: int | None = Field(default=None, foreign_key="usuario.id")
+    versao: int = 1
+    arquivada_em: datetime
+
+
+class ReservaAtualizacao(Atualizacao):
+    anulaveis = frozenset({"items"})
+
+    sala_reservada: int | None = None
+    data_inicial: DataHora | None = None
+    data_final: DataHora | None = None
+    descricao: str | None = None
+    tipo_evento: str | None = None
+    quantidade_pessoas: int | None = None
+    items: str | None = None
+
+
+class SerieReservaBase(ReservaBase):
+    """
+    Reserva que se repete a cada intervalo_dias.
+
+    data_inicial e data_final sao as da primeira ocorrencia e nenhuma
+    ocorrencia termina depois de repetir_ate.
+    """
+
+    intervalo_dias: int = Field(gt=0)
+    repetir_ate: DataHora
+
+
+class SerieReserva(SerieReservaBase, table=True):
+    __table_args__ = (
+        Index(
+            "ix_seriereserva_sala_periodo",
+            "sala_reservada",
+            "repetir_ate",
+            "data_inicial",
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    reservado_por: int | None = Field(default=None, foreign_key="usuario.id")
+
+
+class SerieReservaAtualizacao(ReservaAtualizacao):
+    intervalo_dias: int | None = Field(default=None, gt=0)
+    repetir_ate: DataHora | None = None
+
+
+class ExcecaoSerie(SQLModel, table=True):
+    id_serie: int = Field(foreign_key="seriereserva.id", primary_key=True)
+    data_inicial: datetime = Field(primary_key=True)
+
+
+class Ocorrencia(ReservaBase):
+    serie: int
+    reservado_por: int | None = None
+
+
+class ContadorAlteracoes(SQLModel, table=True):
+    """Quantas escritas cada tabela ja recebeu, usado nos ETags das listas."""
+
+    tabela: str = Field(primary_key=True)
+    alteracoes: int = 0
@@ -0,0 +1,258 @@
+from collections.abc import Sequence
+from datetime import datetime
+from itertools import chain
+from typing import Any
+
+import numpy as np
+from environs import env
+from fastapi import HTTPException
+from numpy.typing import NDArray
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.models import Reserva, Sala
+from src.schemas import OcupacaoSala, RelatorioOcupacao
+from src.series import ocorrencias
+
+env.read_env(".env")
+
+OCUPACAO_MAXIMO_VALORES = env.int("OCUPACAO_MAXIMO_VALORES", 500_000)
+
+PASSOS = {
+    "hora": np.timedelta64(1, "h"),
+    "dia": np.timedelta64(1, "D"),
+    "semana": np.timedelta64(7, "D"),
+}
+
+UM_SEGUNDO = np.timedelta64(1, "s")
+
+Tempos = NDArray[np.int64]
+
+
+class SegundosEpoch(FunctionElement[int]):
+    """Segundos desde 1970 de uma coluna datetime, calculados no banco."""
+
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(SegundosEpoch)
+def _segundos_epoch(
+    elemento: SegundosEpoch, compilador: SQLCompiler, **kw: Any
+) -> str:
+    coluna = compilador.process(elemento.clauses, **kw)
+    return f"CAST(EXTRACT(EPOCH FROM {coluna}) AS BIGINT)"
+
+
+@compiles(SegundosEpoch, "sqlite")
+def _segundos_epoch_sqlite(
+    elemento: SegundosEpoch, compilador: SQLCompiler, **kw: Any
+) -> str:
+    coluna = compilador.process(elemento.clauses, **kw)
+    return f"CAST(strftime('%s', {coluna}) AS INTEGER)"
+
+
+def bordas(
+    inicio: np.datetime64, fim: np.datetime64, granularidade: str
+) -> tuple[NDArray[np.datetime64], NDArray[np.datetime64]]:
+    """
+    Inicio de cada periodo, alinhado na grade, e as bordas presas na janela.
+
+    Semanas comecam na segunda-feira.
+    """
+    passo = PASSOS[granularidade]
+
+    if granularidade == "hora":
+        comeco = inicio.astype("datetime64[h]")
+    else:
+        comeco = inicio.astype("datetime64[D]")
+        if granularidade == "semana":
+            # 1970-01-01 foi uma quinta-feira
+            comeco -= (comeco.astype(np.int64) + 3) % 7
+
+    inicios = np.arange(comeco, fim, passo).astype("datetime64[s]")
+    limites = np.clip(np.append(inicios, fim), inicio, fim)
+
+    return inicios, limites
+
+
+def acumulado(
+    inicios: Tempos, fins: Tempos, pesos: Tempos, instantes: Tempos
+) -> Tempos:
+    """
+    F(t) = soma dos pesos vezes o tempo de cada intervalo ate t.
+
+    Com as somas prefixadas dos inicios e dos fins ordenados, cada F(t) sai
+    de duas buscas binarias: sum(p * (t - i)) dos que comecaram menos
+    sum(p * (t - f)) dos que terminaram. O tempo ocupado num periodo e a
+    diferenca de F entre as bordas.
+    """
+    total = np.zeros(len(instantes), dtype=np.int64)
+
+    for pontos, sinal in ((inicios, 1), (fins, -1)):
+        ordem = np.argsort(pontos)
+        pontos = pontos[ordem]
+        pesos_ordenados = pesos[ordem]
+        soma_pesos = np.concatenate(([0], np.cumsum(pesos_ordenados)))
+        soma_pontos = np.concatenate(([0], np.cumsum(pesos_ordenados * pontos)))
+        antes = np.searchsorted(pontos, instantes)
+        total += sinal * (instantes * soma_pesos[antes] - soma_pontos[antes])
+
+    return total
+
+
+def dividir(
+    numerador: NDArray[np.int64], denominador: NDArray[np.int64]
+) -> list[float]:
+    resultado = np.divide(
+        numerador,
+        denominador,
+        out=np.zeros(len(numerador)),
+        where=denominador > 0,
+    )
+    return list(np.round(resultado, 4).tolist())
+
+
+async def relatorio_ocupacao(
+    session: AsyncSession,
+    salas: Sequence[Sala],
+    data_inicial: datetime,
+    data_final: datetime,
+    granularidade: str,
+) -> RelatorioOcupacao:
+    """
+    Ocupacao (tempo reservado) e utilizacao (pessoas por capacidade) das
+    salas em cada periodo, mais o mapa de calor dia da semana x hora.
+    """
+    inicio = np.datetime64(data_inicial, "s")
+    fim = np.datetime64(data_final, "s")
+
+    periodos, limites = bordas(inicio, fim, granularidade)
+    _, limites_hora = bordas(inicio, fim, "hora")
+
+    if (len(periodos) + 7 * 24) * len(salas) > OCUPACAO_MAXIMO_VALORES:
+        raise HTTPException(
+            400, "Período longo demais para essa granularidade e salas"
+        )
+
+    ids_salas = [sala.id for sala in salas if sala.id is not None]
+
+    # As datas chegam do banco ja em segundos, sem criar um datetime por
+    # linha, e a conexao e usada direto para nao passar pelo ORM
+    conexao = await session.connection()
+    linhas = (
+        await conexao.execute(
+            select(
+                col(Reserva.sala_reservada),
+                SegundosEpoch(Reserva.data_inicial),
+                SegundosEpoch(Reserva.data_final),
+                col(Reserva.quantidade_pessoas),
+            ).where(
+                col(Reserva.sala_reservada).in_(ids_salas),
+                col(Reserva.data_final) > data_inicial,
+                col(Reserva.data_inicial) < data_final,
+            )
+        )
+    ).all()
+    dados = np.fromiter(
+        chain.from_iterable(linhas), dtype=np.int64, count=4 * len(linhas)
+    ).reshape(-1, 4)
+
+    series = [
+        (
+            ocorrencia.sala_reservada,
+            np.datetime64(ocorrencia.data_inicial, "s").astype(np.int64),
+            np.datetime64(ocorrencia.data_final, "s").astype(np.int64),
+            ocorrencia.quantidade_pessoas,
+        )
+        for ocorrencia in await ocorrencias(
+            session, data_inicial, data_final, ids_salas
+        )
+    ]
+    if series:
+        dados = np.concatenate(
+            (dados, np.array(series, dtype=np.int64).reshape(-1, 4))
+        )
+
+    # Tudo em segundos desde o inicio da janela, com os intervalos presos
+    # nela. As bordas dos periodos sao um subconjunto das bordas por hora.
+    epoch_inicio = inicio.astype(np.int64)
+    duracao = (fim - inicio) // UM_SEGUNDO
+    instantes = ((limites_hora - inicio) // UM_SEGUNDO).astype(np.int64)
+    posicoes = np.searchsorted(limites_hora, limites)
+
+    salas_reservas = dados[:, 0]
+    inicios = np.clip(dados[:, 1] - epoch_inicio, 0, duracao)
+    fins = np.clip(dados[:, 2] - epoch_inicio, 0, duracao)
+    pessoas = dados[:, 3]
+
+    disponivel = np.diff(instantes)
+    disponivel_periodo = np.diff(instantes[posicoes])
+    horas = limites_hora[:-1]
+    celulas = (
+        (horas.astype("datetime64[D]").astype(np.int64) + 3) % 7
+    ) * 24 + (horas.astype("datetime64[h]").astype(np.int64) % 24)
+    disponivel_celula = np.bincount(
+        celulas, weights=disponivel, minlength=7 * 24
+    ).astype(np.int64)
+
+    ordem = np.argsort(salas_reservas, kind="stable")
+    salas_reservas = salas_reservas[ordem]
+    inicios, fins, pessoas = inicios[ordem], fins[ordem], pessoas[ordem]
+
+    resultado = []
+
+    for sala in salas:
+        comeco, termino = np.searchsorted(
+            salas_reservas, [sala.id or 0, (sala.id or 0) + 1]
+        )
+        trecho = slice(comeco, termino)
+
+        ocupado = acumulado(
+            inicios[trecho],
+            fins[trecho],
+            np.ones(termino - comeco, dtype=np.int64),
+            instantes,
+        )
+        ocupado_pessoas = acumulado(
+            inicios[trecho], fins[trecho], pessoas[trecho], instantes
+        )
+
+        ocupado_celula = np.bincount(
+            celulas, weights=np.diff(ocupado), minlength=7 * 24
+        ).astype(np.int64)
+
+        resultado.append(
+            OcupacaoSala(
+                sala=sala.id or 0,
+                nome=sala.nome,
+                capacidade=sala.capacidade,
+                ocupacao=dividir(ocupado[-1:], np.array([duracao]))[0],
+                utilizacao=dividir(
+                    ocupado_pessoas[-1:],
+                    np.array([duracao * sala.capacidade]),
+                )[0],
+                ocupacao_por_periodo=dividir(
+                    np.diff(ocupado[posicoes]), disponivel_periodo
+                ),
+                utilizacao_por_periodo=dividir(
+                    np.diff(ocupado_pessoas[posicoes]),
+                    disponivel_periodo * sala.capacidade,
+                ),
+                mapa_calor=np.reshape(
+                    dividir(ocupado_celula, disponivel_celula), (7, 24)
+                ).tolist(),
+            )
+        )
+
+    return RelatorioOcupacao(
+        data_inicial=data_inicial,
+        data_final=data_final,
+        granularidade=granularidade,
+        periodos=periodos.tolist(),
+        salas=resultado,
+    )
@@ -0,0 +1,97 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Callable, Sequence
+from datetime import datetime
+from typing import Annotated, Any
+
+from environs import env
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Mapped
+from sqlmodel.sql.expression import Select, SelectOfScalar
+
+from src.schemas import Pagina
+
+env.read_env(".env")
+
+PAGINA_MAXIMA = env.int("PAGINA_MAXIMA", 100)
+
+ValorChave = int | datetime
+# Tamanho de pagina aceito pelas rotas paginadas
+Contagem = Annotated[int, Query(gt=0, le=PAGINA_MAXIMA)]
+
+
+def codificar_cursor(*chave: ValorChave) -> str:
+    valores = [
+        valor.isoformat() if isinstance(valor, datetime) else valor
+        for valor in chave
+    ]
+    conteudo = json.dumps(valores, separators=(",", ":")).encode()
+    return urlsafe_b64encode(conteudo).decode().rstrip("=")
+
+
+def decodificar_cursor(
+    cursor: str, *tipos: type[ValorChave]
+) -> tuple[Any, ...]:
+    try:
+        valores = json.loads(
+            urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        if not isinstance(valores, list) or len(valores) != len(tipos):
+            raise ValueError(cursor)
+
+        return tuple(
+            datetime.fromisoformat(valor) if tipo is datetime else int(valor)
+            for tipo, valor in zip(tipos, valores, strict=True)
+        )
+    except (ValueError, TypeError) as erro:
+        raise HTTPException(400, "Cursor inválido") from erro
+
+
+def paginar[C: (Select[Any], SelectOfScalar[Any])](
+    consulta: C,
+    colunas: Sequence[Mapped[Any]],
+    tipos: Sequence[type[ValorChave]],
+    cursor: str | None,
+    skip: int | None,
+    count: int,
+) -> C:
+    """
+    Ordena a consulta pela chave e busca a pagina seguinte ao cursor.
+
+    Busca um item a mais que o pedido, para montar_pagina saber se existe
+    uma proxima pagina. O skip so e usado quando nao ha cursor e existe
+    apenas por compatibilidade.
+    """
+    consulta = consulta.order_by(*colunas)
+
+    if cursor is not None:
+        chave = decodificar_cursor(cursor, *tipos)
+        consulta = consulta.where(tuple_(*colunas) > tuple_(*chave))
+    elif skip:
+        consulta = consulta.offset(skip)
+
+    return consulta.limit(count + 1)
+
+
+def montar_pagina[T](
+    linhas: Sequence[T],
+    count: int,
+    chave: Callable[[T], tuple[ValorChave, ...]],
+) -> Pagina[T]:
+    items = list(linhas[:count])
+    proximo = None
+
+    if len(linhas) > count:
+        proximo = codificar_cursor(*chave(items[-1]))
+
+    return Pagina(items=items, next_cursor=proximo)
+
+
+def itens_legados[T](pagina: Pagina[T], response: Response) -> list[T]:
+    """
+    Resposta das chamadas com skip, na lista sem envelope de antes do
+    cursor, para clientes antigos continuarem funcionando.
+    """
+    response.headers["Deprecation"] = "true"
+    return pagina.items
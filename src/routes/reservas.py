@@ -1,57 +1,439 @@
-from collections.abc import Sequence
-from typing import Annotated
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth import TokenPayload, auth
-from src.database import get_session
-from src.models import Reserva, Sala, Usuario
-from src.schemas import Resposta, mensagem
+from src.arquivamento import periodo_arquivado
+from src.auth import TokenPayload, access_token_required
+from src.cache import cache_salas
+from src.database import bloquear_escrita, bloquear_salas, get_async_session
+from src.disponibilidade import buscar_conflito, indice
+from src.etags import etag_colecao, etag_versoes, verificar_etag
+from src.eventos import (
+    EVENTOS_MAXIMO_ASSINANTES,
+    difusor,
+    evento_reserva,
+    periodo,
+)
+from src.exportacao import TIPOS_EXPORTACAO, consulta_exportacao, exportar
+from src.importacao import FORMATOS, ImportadorReservas, obter_formato
+from src.models import (
+    DataHora,
+    Ocorrencia,
+    Reserva,
+    ReservaAtualizacao,
+    ReservaBase,
+    ReservaHistorico,
+    Sala,
+    Usuario,
+)
+from src.paginacao import Contagem, decodificar_cursor, montar_pagina, paginar
+from src.schemas import (
+    ItemReserva,
+    PaginaReservas,
+    RelatorioImportacao,
+    Resposta,
+    mensagem,
+)
+from src.series import buscar_conflito_serie, ocorrencias
 
 router = APIRouter(prefix="/api/v1/reservas", tags=["Reservas"])
 
 
-@router.get("/")
+def chave_listagem(
+    item: Reserva | ReservaHistorico | Ocorrencia,
+) -> tuple[datetime, int]:
+    # Ocorrencias entram no cursor com o id da serie negativo
+    if isinstance(item, Ocorrencia):
+        return item.data_inicial, -item.serie
+    return item.data_inicial, item.id or 0
+
+
+CAMPOS_LISTAGEM = tuple(
+    campo for campo in ItemReserva.model_fields if campo not in ("id", "serie")
+)
+
+
+def item_listagem(
+    item: Reserva | ReservaHistorico | Ocorrencia,
+    email: str,
+    campos: Sequence[str],
+) -> dict[str, Any]:
+    if isinstance(item, Ocorrencia):
+        valores: dict[str, Any] = {"id": None, "serie": item.serie}
+    else:
+        valores = {"id": item.id, "serie": None}
+
+    for campo in campos:
+        valores[campo] = (
+            email if campo == "email" else getattr(item, campo, None)
+        )
+
+    return valores
+
+
+@router.get("/", response_model=PaginaReservas, response_class=ORJSONResponse)
 async def obter_reservas(
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
-    skip: int = 0,
-    count: int = 10,
-) -> Sequence[tuple[Reserva, Sala, str]]:
-    return session.exec(
-        select(Reserva, Sala, Usuario.email)
-        .join(Sala)
-        .join(Usuario)
-        .offset(skip)
-        .limit(count)
-    ).all()
+    request: Request,
+    response: Response,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    cursor: str | None = None,
+    count: Contagem = 10,
+    skip: Annotated[int | None, Query(deprecated=True, ge=0)] = None,
+    data_inicial: DataHora | None = None,
+    data_final: DataHora | None = None,
+    campos: Annotated[str | None, Query(alias="fields")] = None,
+    incluir_historico: bool = False,
+) -> ORJSONResponse:
+    """
+    Lista as reservas pela data inicial.
+
+    Com data_inicial e data_final lista so o que sobrepoe o periodo,
+    incluindo as ocorrencias das series nele. Cada sala aparece uma vez no
+    mapa salas, e fields (separados por virgula) limita os campos dos itens.
+    As reservas arquivadas so entram com incluir_historico. Com skip, que
+    esta obsoleto, responde a lista de [reserva, sala, email] de antes.
+
+    O corpo e montado direto em dicts e serializado pelo orjson, sem passar
+    pela validacao do response_model, que fica so para a documentacao.
+    """
+    selecionados = CAMPOS_LISTAGEM
+    if campos is not None:
+        selecionados = tuple(
+            campo.strip() for campo in campos.split(",") if campo.strip()
+        )
+        desconhecidos = set(selecionados) - set(CAMPOS_LISTAGEM)
+        if desconhecidos:
+            raise HTTPException(
+                400, f"Campos desconhecidos: {', '.join(sorted(desconhecidos))}"
+            )
+
+    if data_inicial is not None or data_final is not None:
+        if data_inicial is None or data_final is None:
+            raise HTTPException(400, "Informe a data inicial e a final juntas")
+        if data_final <= data_inicial:
+            raise HTTPException(
+                400, "A data final deve ser maior que a inicial"
+            )
+        if skip is not None:
+            raise HTTPException(400, "Use o cursor para filtrar por período")
+    if incluir_historico and skip is not None:
+        raise HTTPException(400, "Use o cursor para incluir o histórico")
+    inicio = decodificar_cursor(cursor, datetime, int) if cursor else None
+
+    # Os parametros sao validados antes, para um If-None-Match nao esconder
+    # um erro com um 304
+    tabelas = ["reserva", "sala", "usuario"]
+    if data_inicial is not None or data_final is not None:
+        tabelas += ["seriereserva", "excecaoserie"]
+    if incluir_historico:
+        tabelas.append("reservahistorico")
+    etag = await etag_colecao(session, request, tabelas)
+    verificar_etag(request, response, etag)
+
+    linhas: list[tuple[Reserva | ReservaHistorico | Ocorrencia, str]] = []
+
+    # Cada tabela traz a sua pagina seguinte ao cursor, e montar_pagina
+    # corta a uniao ordenada
+    for modelo in (
+        (Reserva, ReservaHistorico) if incluir_historico else (Reserva,)
+    ):
+        consulta = select(modelo, Usuario.email).join(Usuario)
+        if data_inicial is not None and data_final is not None:
+            consulta = consulta.where(
+                col(modelo.data_final) > data_inicial,
+                col(modelo.data_inicial) < data_final,
+            )
+        linhas.extend(
+            (
+                await session.exec(
+                    paginar(
+                        consulta,
+                        [col(modelo.data_inicial), col(modelo.id)],
+                        [datetime, int],
+                        cursor,
+                        skip,
+                        count,
+                    )
+                )
+            ).all()
+        )
+
+    if incluir_historico:
+        linhas.sort(key=lambda linha: chave_listagem(linha[0]))
+
+    if data_inicial is not None and data_final is not None:
+        # A expansao comeca no cursor. Antes da chave dele cada serie so tem
+        # uma ocorrencia que comeca antes e termina depois da data do cursor
+        # e uma que comeca nela, dai as duas a mais no limite
+        seguintes = [
+            ocorrencia
+            for ocorrencia in await ocorrencias(
+                session,
+                data_inicial
+                if inicio is None
+                else max(data_inicial, inicio[0]),
+                data_final,
+                limite=count + 3,
+            )
+            if inicio is None or chave_listagem(ocorrencia) > inicio
+        ]
+        seguintes.sort(key=chave_listagem)
+        del seguintes[count + 1 :]
+        emails = dict(
+            (
+                await session.exec(
+                    select(Usuario.id, Usuario.email).where(
+                        col(Usuario.id).in_(
+                            {
+                                ocorrencia.reservado_por
+                                for ocorrencia in seguintes
+                            }
+                        )
+                    )
+                )
+            ).all()
+        )
+        linhas.extend(
+            (ocorrencia, emails[ocorrencia.reservado_por])
+            for ocorrencia in seguintes
+            if ocorrencia.reservado_por in emails
+        )
+        linhas.sort(key=lambda linha: chave_listagem(linha[0]))
+
+    salas = await cache_salas.obter_varias(
+        session, (item.sala_reservada for item, _ in linhas)
+    )
+
+    pagina = montar_pagina(
+        [
+            (item, email)
+            for item, email in linhas
+            if item.sala_reservada in salas
+        ],
+        count,
+        lambda linha: chave_listagem(linha[0]),
+    )
+
+    if skip is not None and cursor is None:
+        # Formato de antes do cursor: [reserva, sala, email] por item
+        return ORJSONResponse(
+            [
+                [
+                    item.model_dump(),
+                    salas[item.sala_reservada].model_dump(),
+                    email,
+                ]
+                for item, email in pagina.items
+            ],
+            headers={"ETag": etag, "Deprecation": "true"},
+        )
+
+    return ORJSONResponse(
+        {
+            "items": [
+                item_listagem(item, email, selecionados)
+                for item, email in pagina.items
+            ],
+            "salas": {
+                id_sala: salas[id_sala].model_dump()
+                for id_sala in {item.sala_reservada for item, _ in pagina.items}
+            },
+            "next_cursor": pagina.next_cursor,
+        },
+        headers={"ETag": etag},
+    )
+
+
+@router.get(
+    "/exportar",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {tipo: {} for tipo in TIPOS_EXPORTACAO.values()}}
+    },
+)
+async def exportar_reservas(
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    formato: Literal["ndjson", "csv"] = "ndjson",
+    data_inicial: DataHora | None = None,
+    data_final: DataHora | None = None,
+    sala: int | None = None,
+) -> StreamingResponse:
+    if (
+        data_inicial is not None
+        and data_final is not None
+        and data_final <= data_inicial
+    ):
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    consulta = consulta_exportacao(data_inicial, data_final, sala)
+
+    return StreamingResponse(
+        exportar(consulta, formato),
+        media_type=TIPOS_EXPORTACAO[formato],
+        headers={
+            "Content-Disposition": f'attachment; filename="reservas.{formato}"'
+        },
+    )
+
+
+@router.get(
+    "/eventos",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def assinar_eventos(
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    salas: Annotated[list[int] | None, Query()] = None,
+    data_inicial: DataHora | None = None,
+    data_final: DataHora | None = None,
+) -> StreamingResponse:
+    """
+    Acompanha as reservas criadas, editadas e removidas nas salas e no
+    periodo pedidos, como server-sent events.
+
+    Sem salas vale para todas. A conexao e encerrada depois de
+    EVENTOS_DURACAO_MAXIMA segundos, ou com um ressincronizar quando o
+    cliente nao acompanha o ritmo dos eventos. O que mudar ate a reconexao
+    so aparece recarregando pelas listagens.
+    """
+    if (
+        data_inicial is not None
+        and data_final is not None
+        and data_final <= data_inicial
+    ):
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    if difusor.total >= EVENTOS_MAXIMO_ASSINANTES:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Limite de assinaturas atingido, tente novamente depois",
+            headers={"Retry-After": "30"},
+        )
+
+    assinatura = difusor.assinar(salas or (), data_inicial, data_final)
+
+    async def transmitir() -> AsyncIterator[str]:
+        try:
+            async for bloco in assinatura.transmitir():
+                yield bloco
+        finally:
+            difusor.cancelar(assinatura)
+
+    return StreamingResponse(
+        transmitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/{id_reserva}")
 async def obter_reserva(
     id_reserva: int,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    request: Request,
+    response: Response,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> tuple[Reserva, Sala, str]:
-    reserva = session.exec(
-        select(Reserva, Sala, Usuario.email)
-        .where(Reserva.id == id_reserva)
-        .join(Sala)
-        .join(Usuario)
+    linha = (
+        await session.exec(
+            select(Reserva, Usuario.email)
+            .where(Reserva.id == id_reserva)
+            .join(Usuario)
+        )
     ).first()
 
-    if not reserva:
+    if not linha:
         raise HTTPException(404, "Reserva nao foi encontrado")
 
-    return reserva
+    reserva, email = linha
+    sala = await cache_salas.obter(session, reserva.sala_reservada)
+
+    if sala is None:
+        raise HTTPException(404, "Reserva nao foi encontrado")
+
+    verificar_etag(
+        request,
+        response,
+        etag_versoes(reserva.id, reserva.versao, sala.versao),
+    )
+
+    return reserva, sala, email
+
+
+async def salvar_sem_conflito(session: AsyncSession, reserva: Reserva) -> None:
+    """
+    Verifica sobreposicao com outras reservas da sala e grava a reserva.
+
+    A sessao deve ter sido aberta com bloquear_escrita. No Postgres a sala
+    fica travada ate o commit, e a restricao ex_reserva_sala_periodo cobre
+    o que escapar disso; a violacao tambem vira um 409.
+    """
+    id_reserva = reserva.id
+    id_sala = reserva.sala_reservada
+    inicio = reserva.data_inicial
+    fim = reserva.data_final
+
+    if fim <= inicio:
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    if periodo_arquivado(fim):
+        raise HTTPException(400, "Periodo ja arquivado, nao aceita reservas")
+
+    await bloquear_salas(session, [id_sala])
+
+    conflito = await buscar_conflito(session, id_sala, inicio, fim, id_reserva)
+
+    if conflito is None:
+        serie = await buscar_conflito_serie(session, id_sala, inicio, fim)
+        if serie is not None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Sala já reservada nesse período pela série {serie}",
+            )
+
+        session.add(reserva)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            conflito = await buscar_conflito(
+                session, id_sala, inicio, fim, id_reserva
+            )
+            if conflito is None:
+                raise
+
+    if conflito is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Sala já reservada nesse período pela reserva {conflito}",
+        )
+
+    await session.refresh(reserva)
+    indice.registrar(reserva)
 
 
 @router.post("/")
 async def criar_reserva(
-    reserva: Reserva,
-    dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    dados: ReservaBase,
+    dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Reserva:
     usuario = int(dependencies.sub)
 
@@ -61,34 +443,93 @@ async def criar_reserva(
             detail="Você não possui autorização para realizar essa operação",
         )
 
-    reserva.reservado_por = usuario
+    reserva = Reserva.model_validate(dados, update={"reservado_por": usuario})
 
-    session.add(reserva)
-    session.commit()
-    session.refresh(reserva)
+    await bloquear_escrita(session)
+    await salvar_sem_conflito(session, reserva)
+    await difusor.publicar(evento_reserva("criada", reserva))
 
     return reserva
 
 
+@router.post(
+    "/importar",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                formato: {"schema": {"type": "string"}} for formato in FORMATOS
+            },
+        }
+    },
+)
+async def importar_reservas(
+    request: Request,
+    response: Response,
+    dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    atomico: bool = False,
+) -> RelatorioImportacao:
+    """
+    Importa reservas em CSV (com cabecalho) ou NDJSON, uma por linha.
+
+    O arquivo e validado inteiro antes de qualquer escrita. As linhas
+    validas sao gravadas em lotes numa unica transacao, e as invalidas
+    voltam no relatorio. Com atomico=true qualquer erro desfaz a importacao.
+    """
+    usuario = int(dependencies.sub)
+
+    if not usuario:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Você não possui autorização para realizar essa operação",
+        )
+
+    formato = obter_formato(request.headers.get("content-type", ""))
+
+    importador = ImportadorReservas(session, usuario, atomico)
+
+    try:
+        relatorio = await importador.importar(request.stream(), formato)
+    except IntegrityError as erro:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Reservas conflitantes gravadas durante a importação",
+        ) from erro
+
+    if atomico and importador.falhou():
+        response.status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    return relatorio
+
+
 @router.patch("/{id_reserva}")
 async def editar_reserva(
     id_reserva: int,
-    reserva: Reserva,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    dados: ReservaAtualizacao,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Reserva:
-    reserva_antiga = session.exec(
-        select(Reserva).where(Reserva.id == id_reserva)
+    await bloquear_escrita(session)
+
+    reserva = (
+        await session.exec(select(Reserva).where(Reserva.id == id_reserva))
     ).first()
 
-    if not reserva_antiga:
+    if not reserva:
         raise HTTPException(404, "Reserva nao foi encontrado")
 
-    reserva.id_reserva = reserva_antiga.id
+    anterior = periodo(reserva)
+    try:
+        dados.aplicar(reserva)
+    except ValidationError as erro:
+        raise RequestValidationError(erro.errors()) from erro
 
-    session.add(reserva)
-    session.commit()
-    session.refresh(reserva)
+    with session.no_autoflush:
+        await salvar_sem_conflito(session, reserva)
+
+    await difusor.publicar(evento_reserva("editada", reserva, anterior))
 
     return reserva
 
@@ -96,17 +537,22 @@ async def editar_reserva(
 @router.delete("/{id_reserva}")
 async def deletar_reserva(
     id_reserva: int,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Resposta:
-    reserva = session.exec(
-        select(Reserva).where(Reserva.id == id_reserva)
+    await bloquear_escrita(session)
+    reserva = (
+        await session.exec(select(Reserva).where(Reserva.id == id_reserva))
     ).first()
 
     if not reserva:
         raise HTTPException(404, "Reserva nao foi encontrada")
 
-    session.delete(reserva)
-    session.commit()
+    evento = evento_reserva("removida", reserva)
+
+    await session.delete(reserva)
+    await session.commit()
+    indice.remover(id_reserva)
+    await difusor.publicar(evento)
 
     return mensagem("reserva deletada com sucesso")
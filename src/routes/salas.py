@@ -1,83 +1,230 @@
 from collections.abc import Sequence
-from datetime import datetime
-from typing import Annotated
+from datetime import time, timedelta
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth import TokenPayload, auth
-from src.database import get_session
-from src.models import Reserva, Sala
-from src.schemas import Resposta, mensagem
+from src.auth import TokenPayload, access_token_required
+from src.cache import cache_salas
+from src.database import bloquear_escrita, get_async_session
+from src.disponibilidade import INDICE_CONFIRMAR, confirmar_livres, indice
+from src.etags import etag_versoes, verificar_etag
+from src.horarios import buscar_horarios, expediente_utc
+from src.models import DataHora, Reserva, Sala, SalaAtualizacao, SalaBase
+from src.paginacao import Contagem, itens_legados, montar_pagina, paginar
+from src.schemas import (
+    HorarioLivre,
+    Pagina,
+    RelatorioOcupacao,
+    Resposta,
+    mensagem,
+)
+from src.series import ocorrencias
 
 router = APIRouter(prefix="/api/v1/salas", tags=["Salas"])
 
 
 @router.get("/")
 async def obter_salas(
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
-    skip: int = 0,
-    count: int = 10,
-) -> Sequence[Sala]:
-    return session.exec(select(Sala).offset(skip).limit(count)).all()
+    response: Response,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    cursor: str | None = None,
+    count: Contagem = 10,
+    skip: Annotated[int | None, Query(deprecated=True, ge=0)] = None,
+) -> Pagina[Sala] | list[Sala]:
+    chave = (cursor, skip, count)
+    pagina = cache_salas.obter_pagina(chave)
+
+    if pagina is None:
+        geracao = cache_salas.geracao
+        consulta = paginar(
+            select(Sala), [col(Sala.id)], [int], cursor, skip, count
+        )
+        salas = (await session.exec(consulta)).all()
+        pagina = montar_pagina(salas, count, lambda sala: (sala.id or 0,))
+        cache_salas.guardar_pagina(chave, pagina, geracao)
+
+    if skip is not None and cursor is None:
+        return itens_legados(pagina, response)
+    return pagina
 
 
 @router.get("/disponiveis")
 async def obter_salas_disponiveis(
-    data_inicial: datetime,
-    data_final: datetime,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
-) -> Sequence[tuple[int, Sala]] | Resposta:
-    salas = session.exec(
-        select(Reserva.sala_reservada, Sala)
-        .where(
-            (
-                data_inicial < Reserva.data_final
-                and data_inicial >= Reserva.data_inicial
-            )
-            or (
-                data_final <= Reserva.data_final
-                and data_final > Reserva.data_inicial
-            )
-            or (
-                data_final >= Reserva.data_final
-                and data_inicial <= Reserva.data_inicial
+    data_inicial: DataHora,
+    data_final: DataHora,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> Sequence[Sala] | Resposta:
+    if data_final <= data_inicial:
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    salas: Sequence[Sala]
+
+    if indice.pronto:
+        salas = [
+            sala
+            for sala in await cache_salas.obter_todas(session)
+            if sala.id is not None
+            and indice.livre(sala.id, data_inicial, data_final)
+        ]
+        if INDICE_CONFIRMAR:
+            livres = set(
+                await confirmar_livres(
+                    session,
+                    [sala.id for sala in salas if sala.id is not None],
+                    data_inicial,
+                    data_final,
+                )
             )
+            salas = [sala for sala in salas if sala.id in livres]
+    else:
+        conflitos = select(Reserva.id).where(
+            Reserva.sala_reservada == Sala.id,
+            Reserva.data_inicial < data_final,
+            Reserva.data_final > data_inicial,
         )
-        .join(Sala)
-    ).all()
+        salas = (
+            await session.exec(select(Sala).where(~conflitos.exists()))
+        ).all()
 
-    if salas is None:
+    ocupadas = {
+        ocorrencia.sala_reservada
+        for ocorrencia in await ocorrencias(session, data_inicial, data_final)
+    }
+    salas = [sala for sala in salas if sala.id not in ocupadas]
+
+    if not salas:
         return mensagem("Nenhuma sala disponível")
 
     return salas
 
 
+@router.get("/horarios-livres")
+async def obter_horarios_livres(
+    data_inicial: DataHora,
+    data_final: DataHora,
+    duracao_minutos: Annotated[int, Query(gt=0)],
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    capacidade: Annotated[int, Query(ge=0)] = 0,
+    hora_inicio: time | None = None,
+    hora_fim: time | None = None,
+    quantidade: Annotated[int, Query(gt=0, le=100)] = 10,
+) -> list[HorarioLivre]:
+    """
+    Os primeiros horarios com duracao_minutos livres entre data_inicial e
+    data_final, em salas com pelo menos a capacidade pedida.
+
+    Com hora_inicio e hora_fim os horarios ficam dentro desse expediente
+    em cada dia. Horas sem fuso sao consideradas em UTC, como as datas.
+    """
+    if data_final <= data_inicial:
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    expediente = None
+    if hora_inicio is not None or hora_fim is not None:
+        if hora_inicio is None or hora_fim is None:
+            raise HTTPException(
+                400, "Informe o inicio e o fim do expediente juntos"
+            )
+        if (hora_inicio.tzinfo is None) != (hora_fim.tzinfo is None):
+            raise HTTPException(
+                400, "Informe o fuso nas duas horas do expediente ou em nenhuma"
+            )
+        if hora_fim <= hora_inicio:
+            raise HTTPException(
+                400, "O fim do expediente deve ser maior que o inicio"
+            )
+        expediente = expediente_utc(hora_inicio, hora_fim)
+
+    salas = [
+        sala
+        for sala in await cache_salas.obter_todas(session)
+        if sala.capacidade >= capacidade
+    ]
+
+    return await buscar_horarios(
+        session,
+        salas,
+        data_inicial,
+        data_final,
+        timedelta(minutes=duracao_minutos),
+        expediente,
+        quantidade,
+    )
+
+
+@router.get("/ocupacao")
+async def obter_ocupacao(
+    data_inicial: DataHora,
+    data_final: DataHora,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    granularidade: Literal["hora", "dia", "semana"] = "dia",
+    sala: int | None = None,
+) -> RelatorioOcupacao:
+    if data_final <= data_inicial:
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    salas = await cache_salas.obter_todas(session)
+
+    if sala is not None:
+        salas = [item for item in salas if item.id == sala]
+        if not salas:
+            raise HTTPException(404, "Sala nao foi encontrada")
+
+    # O numpy so e importado quando o relatorio e pedido pela primeira vez
+    from src.ocupacao import relatorio_ocupacao
+
+    return await relatorio_ocupacao(
+        session, salas, data_inicial, data_final, granularidade
+    )
+
+
+@router.get("/cache")
+async def obter_estatisticas_cache(
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+) -> dict[str, dict[str, float]]:
+    return cache_salas.estatisticas()
+
+
 @router.get("/{id_sala}")
 async def obter_sala(
     id_sala: int,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    request: Request,
+    response: Response,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Sala:
-    sala = session.exec(select(Sala).where(Sala.id == id_sala)).first()
+    sala = await cache_salas.obter(session, id_sala)
 
     if sala is None:
         raise HTTPException(404, "Sala nao foi encontrado")
 
+    verificar_etag(request, response, etag_versoes(sala.id, sala.versao))
+
     return sala
 
 
 @router.post("/")
 async def criar_sala(
-    sala: Sala,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    dados: SalaBase,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Sala:
+    sala = Sala.model_validate(dados)
+
+    await bloquear_escrita(session)
     session.add(sala)
-    session.commit()
-    session.refresh(sala)
+    await session.commit()
+    await session.refresh(sala)
+    cache_salas.invalidar(sala.id)
 
     return sala
 
@@ -85,20 +232,25 @@ async def criar_sala(
 @router.patch("/{id_sala}")
 async def editar_sala(
     id_sala: int,
-    sala: Sala,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    dados: SalaAtualizacao,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Sala:
-    sala_antiga = session.exec(select(Sala).where(Sala.id == id_sala)).first()
+    await bloquear_escrita(session)
+    sala = (await session.exec(select(Sala).where(Sala.id == id_sala))).first()
 
-    if sala_antiga is None:
+    if sala is None:
         raise HTTPException(404, "Sala nao foi encontrado")
 
-    sala.id = sala_antiga.id
+    try:
+        dados.aplicar(sala)
+    except ValidationError as erro:
+        raise RequestValidationError(erro.errors()) from erro
 
     session.add(sala)
-    session.commit()
-    session.refresh(sala)
+    await session.commit()
+    await session.refresh(sala)
+    cache_salas.invalidar(sala.id)
 
     return sala
 
@@ -106,15 +258,17 @@ async def editar_sala(
 @router.delete("/{id_sala}")
 async def deletar_sala(
     id_sala: int,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Resposta:
-    sala = session.exec(select(Sala).where(Sala.id == id_sala)).first()
+    await bloquear_escrita(session)
+    sala = (await session.exec(select(Sala).where(Sala.id == id_sala))).first()
 
     if sala is None:
         raise HTTPException(404, "Sala nao foi encontrada")
 
-    session.delete(sala)
-    session.commit()
+    await session.delete(sala)
+    await session.commit()
+    cache_salas.invalidar(id_sala)
 
     return mensagem("Sala deletada com sucesso")
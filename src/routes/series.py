@@ -0,0 +1,222 @@
+from datetime import datetime, timedelta
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy import delete
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.auth import TokenPayload, access_token_required
+from src.database import bloquear_escrita, bloquear_salas, get_async_session
+from src.models import (
+    DataHora,
+    ExcecaoSerie,
+    Ocorrencia,
+    SerieReserva,
+    SerieReservaAtualizacao,
+    SerieReservaBase,
+)
+from src.paginacao import Contagem, montar_pagina, paginar
+from src.schemas import Pagina, Resposta, mensagem
+from src.series import (
+    conflito_da_serie,
+    excecoes_da_serie,
+    expandir,
+    ocorrencias,
+)
+
+router = APIRouter(prefix="/api/v1/series", tags=["Series"])
+
+
+@router.get("/")
+async def obter_series(
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    cursor: str | None = None,
+    count: Contagem = 10,
+) -> Pagina[SerieReserva]:
+    consulta = paginar(
+        select(SerieReserva),
+        [col(SerieReserva.id)],
+        [int],
+        cursor,
+        None,
+        count,
+    )
+    series = (await session.exec(consulta)).all()
+
+    return montar_pagina(series, count, lambda serie: (serie.id or 0,))
+
+
+@router.get("/ocorrencias")
+async def obter_ocorrencias(
+    data_inicial: DataHora,
+    data_final: DataHora,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    sala: int | None = None,
+) -> list[Ocorrencia]:
+    if data_final <= data_inicial:
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    return await ocorrencias(
+        session, data_inicial, data_final, None if sala is None else [sala]
+    )
+
+
+@router.get("/{id_serie}")
+async def obter_serie(
+    id_serie: int,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> SerieReserva:
+    serie = await session.get(SerieReserva, id_serie)
+
+    if serie is None:
+        raise HTTPException(404, "Serie nao foi encontrada")
+
+    return serie
+
+
+async def salvar_serie(
+    session: AsyncSession, serie: SerieReserva, excecoes: set[datetime]
+) -> None:
+    if serie.data_final <= serie.data_inicial:
+        raise HTTPException(400, "A data final deve ser maior que a inicial")
+
+    if serie.data_final - serie.data_inicial > timedelta(
+        days=serie.intervalo_dias
+    ):
+        raise HTTPException(
+            400, "A duração da reserva deve caber no intervalo da série"
+        )
+
+    if serie.repetir_ate < serie.data_final:
+        raise HTTPException(
+            400, "A série deve terminar depois da primeira ocorrência"
+        )
+
+    await bloquear_salas(session, [serie.sala_reservada])
+    conflito = await conflito_da_serie(session, serie, excecoes)
+
+    if conflito is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=conflito
+        )
+
+    session.add(serie)
+    await session.commit()
+    await session.refresh(serie)
+
+
+@router.post("/")
+async def criar_serie(
+    dados: SerieReservaBase,
+    dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> SerieReserva:
+    usuario = int(dependencies.sub)
+
+    if not usuario:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Você não possui autorização para realizar essa operação",
+        )
+
+    serie = SerieReserva.model_validate(
+        dados, update={"reservado_por": usuario}
+    )
+
+    await bloquear_escrita(session)
+    await salvar_serie(session, serie, set())
+
+    return serie
+
+
+@router.patch("/{id_serie}")
+async def editar_serie(
+    id_serie: int,
+    dados: SerieReservaAtualizacao,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> SerieReserva:
+    await bloquear_escrita(session)
+
+    serie = await session.get(SerieReserva, id_serie)
+
+    if serie is None:
+        raise HTTPException(404, "Serie nao foi encontrada")
+
+    try:
+        alteracoes = dados.aplicar(serie)
+    except ValidationError as erro:
+        raise RequestValidationError(erro.errors()) from erro
+
+    with session.no_autoflush:
+        # Mudar o inicio ou o intervalo muda as datas das ocorrencias, entao
+        # os cancelamentos antigos deixam de fazer sentido
+        if alteracoes.keys() & {"data_inicial", "intervalo_dias"}:
+            conexao = await session.connection()
+            await conexao.execute(
+                delete(ExcecaoSerie).where(
+                    col(ExcecaoSerie.id_serie) == id_serie
+                )
+            )
+            excecoes = set()
+        else:
+            excecoes = await excecoes_da_serie(session, id_serie)
+
+        await salvar_serie(session, serie, excecoes)
+
+    return serie
+
+
+@router.delete("/{id_serie}")
+async def deletar_serie(
+    id_serie: int,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> Resposta:
+    await bloquear_escrita(session)
+    serie = await session.get(SerieReserva, id_serie)
+
+    if serie is None:
+        raise HTTPException(404, "Serie nao foi encontrada")
+
+    conexao = await session.connection()
+    await conexao.execute(
+        delete(ExcecaoSerie).where(col(ExcecaoSerie.id_serie) == id_serie)
+    )
+    await session.delete(serie)
+    await session.commit()
+
+    return mensagem("Serie deletada com sucesso")
+
+
+@router.post("/{id_serie}/excecoes")
+async def cancelar_ocorrencia(
+    id_serie: int,
+    data_inicial: DataHora,
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> Resposta:
+    await bloquear_escrita(session)
+    serie = await session.get(SerieReserva, id_serie)
+
+    if serie is None:
+        raise HTTPException(404, "Serie nao foi encontrada")
+
+    periodo = (data_inicial, data_inicial + timedelta(microseconds=1))
+    if not any(
+        comeco == data_inicial for comeco, _ in expandir(serie, *periodo)
+    ):
+        raise HTTPException(404, "Ocorrencia nao foi encontrada")
+
+    await session.merge(
+        ExcecaoSerie(id_serie=id_serie, data_inicial=data_inicial)
+    )
+    await session.commit()
+
+    return mensagem("Ocorrencia cancelada com sucesso")
@@ -1,39 +1,118 @@
-from collections.abc import Sequence
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import update
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.auth import (
     AuthXDependency,
     TokenPayload,
+    access_token_required,
     auth,
     get_hashed_password,
+    verify_and_update_password,
     verify_password,
 )
-from src.database import get_session
-from src.models import Reserva, Sala, Usuario
-from src.schemas import ChangePassword, LoginData, Resposta, mensagem
+from src.cache import cache_salas
+from src.database import bloquear_escrita, get_async_session
+from src.models import Reserva, ReservaHistorico, Sala, Usuario
+from src.paginacao import Contagem, itens_legados, montar_pagina, paginar
+from src.schemas import (
+    ChangePassword,
+    LoginData,
+    Pagina,
+    Resposta,
+    mensagem,
+)
 
 router = APIRouter(prefix="/api/v1/usuarios", tags=["Usuarios"])
 
 
 @router.get("/")
 async def obter_usuarios(
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
-) -> Sequence[Usuario]:
-    return session.exec(select(Usuario)).all()
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    cursor: str | None = None,
+    count: Contagem = 10,
+) -> Pagina[Usuario]:
+    consulta = paginar(
+        select(Usuario), [col(Usuario.id)], [int], cursor, None, count
+    )
+    usuarios = (await session.exec(consulta)).all()
+
+    return montar_pagina(usuarios, count, lambda usuario: (usuario.id or 0,))
+
+
+@router.get("/reservas")
+async def obter_reservas_por_usuario(
+    response: Response,
+    dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    cursor: str | None = None,
+    count: Contagem = 10,
+    skip: Annotated[int | None, Query(deprecated=True, ge=0)] = None,
+    incluir_historico: bool = False,
+) -> (
+    Pagina[tuple[Reserva | ReservaHistorico, Sala]]
+    | list[tuple[Reserva | ReservaHistorico, Sala]]
+):
+    usuario = int(dependencies.sub)
+
+    if usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Você não possui permissão para realizar essa operação",
+        )
+
+    if incluir_historico and skip is not None:
+        raise HTTPException(400, "Use o cursor para incluir o histórico")
+
+    reservas: list[Reserva | ReservaHistorico] = []
+    for modelo in (
+        (Reserva, ReservaHistorico) if incluir_historico else (Reserva,)
+    ):
+        consulta = paginar(
+            select(modelo).where(modelo.reservado_por == usuario),
+            [col(modelo.data_inicial), col(modelo.id)],
+            [datetime, int],
+            cursor,
+            skip,
+            count,
+        )
+        reservas.extend((await session.exec(consulta)).all())
+    if incluir_historico:
+        reservas.sort(
+            key=lambda reserva: (reserva.data_inicial, reserva.id or 0)
+        )
+    salas = await cache_salas.obter_varias(
+        session, (reserva.sala_reservada for reserva in reservas)
+    )
+
+    pagina = montar_pagina(
+        [
+            (reserva, salas[reserva.sala_reservada])
+            for reserva in reservas
+            if reserva.sala_reservada in salas
+        ],
+        count,
+        lambda linha: (linha[0].data_inicial, linha[0].id or 0),
+    )
+
+    if skip is not None and cursor is None:
+        return itens_legados(pagina, response)
+    return pagina
 
 
 @router.get("/{username}")
 async def obter_usuarios_especifico(
     username: str,
-    _dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
+    _dependencies: Annotated[TokenPayload, Depends(access_token_required)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Usuario:
-    usuario = session.exec(
-        select(Usuario).where(username == Usuario.email)
+    usuario = (
+        await session.exec(select(Usuario).where(username == Usuario.email))
     ).first()
 
     if usuario is None:
@@ -45,47 +124,58 @@ async def obter_usuarios_especifico(
     return usuario
 
 
-@router.get("/reservas")
-async def obter_reservas_por_usuario(
-    dependencies: Annotated[TokenPayload, Depends(auth.access_token_required)],
-    session: Annotated[Session, Depends(get_session)],
-    skip: int = 0,
-    count: int = 10,
-) -> Sequence[tuple[Reserva, Sala]]:
-    usuario = int(dependencies.sub)
-
-    if usuario is None:
+async def verificar_email_livre(session: AsyncSession, email: str) -> None:
+    if (
+        await session.exec(select(Usuario.id).where(Usuario.email == email))
+    ).first() is not None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Você não possui permissão para realizar essa operação",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Usuario já registrado",
         )
 
-    return session.exec(
-        select(Reserva, Sala)
-        .where(Reserva.reservado_por == usuario)
-        .join(Sala)
-        .offset(skip)
-        .limit(count)
-    ).all()
+
+async def trocar_senha(
+    session: AsyncSession, usuario: Usuario, nova: str
+) -> bool:
+    """
+    Grava o novo hash se a senha do usuario nao mudou desde a leitura.
+
+    A transacao da leitura e encerrada antes de reservar o banco, porque no
+    SQLite uma transacao que leu falha ao tentar escrever.
+    """
+    anterior = usuario.senha
+    await session.commit()
+
+    await bloquear_escrita(session)
+    conexao = await session.connection()
+    resultado = await conexao.execute(
+        update(Usuario)
+        .where(col(Usuario.id) == usuario.id, col(Usuario.senha) == anterior)
+        .values(senha=nova)
+    )
+    await session.commit()
+
+    return resultado.rowcount > 0
 
 
 @router.post("/registrar")
 async def registrar_usuario(
-    usuario: Usuario, session: Annotated[Session, Depends(get_session)]
+    usuario: Usuario,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Resposta:
-    if session.exec(
-        select(Usuario).where(Usuario.email == usuario.email)
-    ).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Usuario já registrado",
-        )
+    # Um email repetido e recusado antes de gastar o hash, e o hash e
+    # calculado sem o banco reservado, entao a verificacao se repete depois
+    await verificar_email_livre(session, usuario.email)
+    await session.commit()
 
-    usuario.senha = get_hashed_password(usuario.senha)
+    usuario.senha = await get_hashed_password(usuario.senha)
+
+    await bloquear_escrita(session)
+    await verificar_email_livre(session, usuario.email)
 
     session.add(usuario)
-    session.commit()
-    session.refresh(usuario)
+    await session.commit()
+    await session.refresh(usuario)
 
     return mensagem("Usuario registrado com sucesso!")
 
@@ -94,10 +184,10 @@ async def registrar_usuario(
 async def login(
     data: LoginData,
     deps: Annotated[AuthXDependency, Depends(auth.get_dependency)],
-    session: Annotated[Session, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Resposta:
-    usuario = session.exec(
-        select(Usuario).where(Usuario.email == data.email)
+    usuario = (
+        await session.exec(select(Usuario).where(Usuario.email == data.email))
     ).first()
 
     if usuario is None:
@@ -105,11 +195,19 @@ async def login(
             status_code=status.HTTP_404_NOT_FOUND, detail="Email errado"
         )
 
-    if not verify_password(data.senha, usuario.senha):
+    valida, novo_hash = await verify_and_update_password(
+        data.senha, usuario.senha
+    )
+
+    if not valida:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Senha errada"
         )
 
+    if novo_hash is not None:
+        # Se a senha mudou no meio tempo o hash antigo fica como esta
+        await trocar_senha(session, usuario, novo_hash)
+
     token = deps.create_access_token(str(usuario.id))
     deps.set_access_cookies(token)
     return mensagem("Login bem sucedido")
@@ -125,10 +223,13 @@ async def logout(
 
 @router.post("/alterar-senha")
 async def alterar_senha(
-    request: ChangePassword, session: Annotated[Session, Depends(get_session)]
+    request: ChangePassword,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
 ) -> Resposta:
-    user = session.exec(
-        select(Usuario).where(Usuario.email == request.email)
+    user = (
+        await session.exec(
+            select(Usuario).where(Usuario.email == request.email)
+        )
     ).first()
 
     if user is None:
@@ -136,14 +237,18 @@ async def alterar_senha(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User not found"
         )
 
-    if not verify_password(request.senha_antiga, user.senha):
+    if not await verify_password(request.senha_antiga, user.senha):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid old password",
         )
 
-    encrypted_password = get_hashed_password(request.senha_nova)
-    user.senha = encrypted_password
-    session.commit()
+    encrypted_password = await get_hashed_password(request.senha_nova)
+
+    if not await trocar_senha(session, user, encrypted_password):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A senha foi alterada por outra requisição",
+        )
 
     return mensagem("Senha alterada com sucesso!")
@@ -1,5 +1,10 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel
 
+from src.models import DataHora
+
 
 class Resposta(BaseModel):
     label: str
@@ -19,3 +24,102 @@ class ChangePassword(BaseModel):
 
 def mensagem(conteudo: str | bytes) -> Resposta:
     return Resposta(label="mensagem", payload=conteudo)
+
+
+class Pagina[T](BaseModel):
+    items: list[T]
+    next_cursor: str | None = None
+
+
+class ErroImportacao(BaseModel):
+    linha: int
+    erro: str
+
+
+class RelatorioImportacao(BaseModel):
+    inseridas: int = 0
+    erros: list[ErroImportacao] = []
+    # Erros alem de IMPORTACAO_ERROS_MAXIMO so entram na contagem
+    erros_omitidos: int = 0
+
+
+class OcupacaoSala(BaseModel):
+    sala: int
+    nome: str
+    capacidade: int
+    ocupacao: float
+    utilizacao: float
+    ocupacao_por_periodo: list[float]
+    utilizacao_por_periodo: list[float]
+    mapa_calor: list[list[float]]
+
+
+class RelatorioOcupacao(BaseModel):
+    data_inicial: datetime
+    data_final: datetime
+    granularidade: str
+    periodos: list[datetime]
+    salas: list[OcupacaoSala]
+
+
+class HorarioLivre(BaseModel):
+    sala: int
+    nome: str
+    capacidade: int
+    data_inicial: datetime
+    data_final: datetime
+
+
+class SalaResumo(BaseModel):
+    id: int
+    nome: str
+    capacidade: int
+    versao: int
+
+
+class ItemReserva(BaseModel):
+    """
+    Reserva ou ocorrencia de serie numa listagem.
+
+    A sala vem no mapa salas da pagina. Os campos alem de id e serie podem
+    ser escolhidos com o parametro fields.
+    """
+
+    id: int | None = None
+    serie: int | None = None
+    sala_reservada: int | None = None
+    data_inicial: datetime | None = None
+    data_final: datetime | None = None
+    descricao: str | None = None
+    tipo_evento: str | None = None
+    quantidade_pessoas: int | None = None
+    items: str | None = None
+    reservado_por: int | None = None
+    email: str | None = None
+    versao: int | None = None
+
+
+class PaginaReservas(BaseModel):
+    items: list[ItemReserva]
+    salas: dict[int, SalaResumo]
+    next_cursor: str | None = None
+
+
+class PeriodoReserva(BaseModel):
+    sala_reservada: int
+    data_inicial: DataHora
+    data_final: DataHora
+
+
+class EventoReserva(PeriodoReserva):
+    """
+    Mudanca numa reserva, enviada a quem assina a sala ou o periodo.
+
+    Nas edicoes anterior traz a sala e o periodo de antes, para que quem so
+    acompanhava o lugar antigo tambem saiba que a reserva saiu de la.
+    """
+
+    tipo: Literal["criada", "editada", "removida"]
+    id: int
+    versao: int | None = None
+    anterior: PeriodoReserva | None = None
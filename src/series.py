@@ -0,0 +1,189 @@
+from collections.abc import Collection, Iterator
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.disponibilidade import IntervalosSala
+from src.models import (
+    ExcecaoSerie,
+    Ocorrencia,
+    Reserva,
+    SerieReserva,
+    SerieReservaBase,
+)
+
+
+def expandir(
+    serie: SerieReservaBase, inicio: datetime, fim: datetime
+) -> Iterator[tuple[datetime, datetime]]:
+    """
+    Periodos das ocorrencias da serie que sobrepoem a janela.
+
+    Os indices da primeira e da ultima ocorrencia sao calculados direto,
+    entao o custo depende so de quantas ocorrencias caem na janela.
+    """
+    periodo = timedelta(days=serie.intervalo_dias)
+    duracao = serie.data_final - serie.data_inicial
+
+    primeira = max(0, (inicio - serie.data_inicial - duracao) // periodo + 1)
+    ultima = min(
+        -((serie.data_inicial - fim) // periodo) - 1,
+        (serie.repetir_ate - serie.data_inicial - duracao) // periodo,
+    )
+
+    for indice in range(primeira, ultima + 1):
+        comeco = serie.data_inicial + indice * periodo
+        yield comeco, comeco + duracao
+
+
+async def excecoes_da_serie(
+    session: AsyncSession, id_serie: int
+) -> set[datetime]:
+    return set(
+        (
+            await session.exec(
+                select(ExcecaoSerie.data_inicial).where(
+                    ExcecaoSerie.id_serie == id_serie
+                )
+            )
+        ).all()
+    )
+
+
+async def ocorrencias(
+    session: AsyncSession,
+    inicio: datetime,
+    fim: datetime,
+    salas: Collection[int] | None = None,
+    ignorar: int | None = None,
+    limite: int | None = None,
+) -> list[Ocorrencia]:
+    """
+    Ocorrencias nao canceladas que sobrepoem a janela, por data inicial.
+
+    Com limite, so as primeiras ocorrencias de cada serie sao expandidas.
+    """
+    consulta = select(SerieReserva).where(
+        col(SerieReserva.repetir_ate) > inicio,
+        col(SerieReserva.data_inicial) < fim,
+    )
+    if salas is not None:
+        consulta = consulta.where(col(SerieReserva.sala_reservada).in_(salas))
+    if ignorar is not None:
+        consulta = consulta.where(SerieReserva.id != ignorar)
+
+    series = (await session.exec(consulta)).all()
+
+    if not series:
+        return []
+
+    canceladas = set(
+        (
+            await session.exec(
+                select(ExcecaoSerie.id_serie, ExcecaoSerie.data_inicial).where(
+                    col(ExcecaoSerie.id_serie).in_(
+                        [serie.id for serie in series]
+                    ),
+                    col(ExcecaoSerie.data_inicial) < fim,
+                    col(ExcecaoSerie.data_inicial)
+                    > min(
+                        inicio - (serie.data_final - serie.data_inicial)
+                        for serie in series
+                    ),
+                )
+            )
+        ).all()
+    )
+
+    encontradas = [
+        Ocorrencia.model_validate(
+            serie,
+            update={
+                "serie": serie.id,
+                "data_inicial": comeco,
+                "data_final": termino,
+            },
+        )
+        for serie in series
+        for comeco, termino in islice(
+            (
+                periodo
+                for periodo in expandir(serie, inicio, fim)
+                if (serie.id, periodo[0]) not in canceladas
+            ),
+            limite,
+        )
+    ]
+    encontradas.sort(key=lambda ocorrencia: ocorrencia.data_inicial)
+
+    return encontradas
+
+
+async def buscar_conflito_serie(
+    session: AsyncSession,
+    id_sala: int,
+    inicio: datetime,
+    fim: datetime,
+    ignorar: int | None = None,
+) -> int | None:
+    """Id da primeira serie com ocorrencia na sala que sobrepoe o periodo."""
+    for ocorrencia in await ocorrencias(
+        session, inicio, fim, [id_sala], ignorar
+    ):
+        return ocorrencia.serie
+
+    return None
+
+
+async def conflito_da_serie(
+    session: AsyncSession, serie: SerieReserva, excecoes: set[datetime]
+) -> str | None:
+    """
+    Mensagem descrevendo o primeiro conflito de alguma ocorrencia da serie.
+
+    Compara as ocorrencias com as reservas e as outras series da sala no
+    periodo inteiro da serie, com uma consulta para cada.
+    """
+    inicio = serie.data_inicial
+    fim = serie.repetir_ate
+    proprias = [
+        periodo
+        for periodo in expandir(serie, inicio, fim)
+        if periodo[0] not in excecoes
+    ]
+
+    reservas = IntervalosSala()
+    for id_reserva, comeco, termino in (
+        await session.exec(
+            select(Reserva.id, Reserva.data_inicial, Reserva.data_final).where(
+                Reserva.sala_reservada == serie.sala_reservada,
+                col(Reserva.data_final) > inicio,
+                col(Reserva.data_inicial) < fim,
+            )
+        )
+    ).all():
+        reservas.adicionar(id_reserva or 0, comeco, termino)
+
+    for comeco, termino in proprias:
+        conflitos = reservas.conflitos(comeco, termino)
+        if conflitos:
+            return (
+                f"Sala já reservada nesse período pela reserva {conflitos[0]}"
+            )
+
+    outras = IntervalosSala()
+    for ocorrencia in await ocorrencias(
+        session, inicio, fim, [serie.sala_reservada], serie.id
+    ):
+        outras.adicionar(
+            ocorrencia.serie, ocorrencia.data_inicial, ocorrencia.data_final
+        )
+
+    for comeco, termino in proprias:
+        conflitos = outras.conflitos(comeco, termino)
+        if conflitos:
+            return f"Sala já reservada nesse período pela série {conflitos[0]}"
+
+    return None
@@ -0,0 +1,107 @@
+import os
+import tempfile
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+# As configuracoes sao lidas na importacao de src, entao vem antes dela
+_pasta = tempfile.mkdtemp(prefix="reserva_salas_")
+os.environ["DATABASE_URI"] = f"sqlite:///{Path(_pasta) / 'testes.db'}"
+os.environ.pop("ASYNC_DATABASE_URI", None)
+os.environ.setdefault("JWT_SECRET_KEY", "testes")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from fastapi.testclient import TestClient
+
+from src.app import app
+from src.auth import auth
+from src.cache import cache_salas
+from src.database import SQLModel, engine
+from src.disponibilidade import indice
+from src.idempotencia import em_andamento, respostas
+
+SQLModel.metadata.create_all(engine)
+
+
+@pytest.fixture(scope="session")
+def aplicacao() -> Iterator[TestClient]:
+    with TestClient(app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def cliente(aplicacao: TestClient) -> TestClient:
+    """Cliente com o banco, os caches e o indice vazios."""
+    with engine.begin() as conexao:
+        for tabela in reversed(SQLModel.metadata.sorted_tables):
+            conexao.execute(tabela.delete())
+
+    cache_salas.invalidar(None)
+    respostas.limpar()
+    em_andamento.clear()
+    assert aplicacao.portal is not None
+    aplicacao.portal.call(indice.carregar)
+
+    return aplicacao
+
+
+@pytest.fixture
+def cabecalhos(cliente: TestClient) -> dict[str, str]:
+    resposta = cliente.post(
+        "/api/v1/usuarios/registrar",
+        json={"usuario": "ana", "email": "ana@exemplo.com", "senha": "x"},
+    )
+    assert resposta.status_code == 200
+
+    token = auth.create_access_token(uid="1")
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def sala(cliente: TestClient, cabecalhos: dict[str, str]) -> int:
+    resposta = cliente.post(
+        "/api/v1/salas/",
+        json={"nome": "Auditorio", "capacidade": 10},
+        headers=cabecalhos,
+    )
+    assert resposta.status_code == 200
+    id_sala: int = resposta.json()["id"]
+    return id_sala
+
+
+@pytest.fixture
+def nova_reserva(sala: int) -> Callable[..., dict[str, Any]]:
+    """Corpo de uma reserva na sala, com as datas e campos informados."""
+
+    def montar(
+        data_inicial: str, data_final: str, **campos: Any
+    ) -> dict[str, Any]:
+        return {
+            "sala_reservada": sala,
+            "data_inicial": data_inicial,
+            "data_final": data_final,
+            "descricao": "Reuniao",
+            "tipo_evento": "interno",
+            "quantidade_pessoas": 4,
+            "items": "",
+        } | campos
+
+    return montar
+
+
+@pytest.fixture
+def reserva(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: Callable[..., dict[str, Any]],
+) -> dict[str, Any]:
+    resposta = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-02T10:00:00", "2030-01-02T11:00:00"),
+        headers=cabecalhos,
+    )
+    assert resposta.status_code == 200
+    dados: dict[str, Any] = resposta.json()
+    return dados
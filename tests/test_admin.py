@@ -0,0 +1,71 @@
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+
+def ids_da_pagina(cliente: TestClient, rota: str, **params: Any) -> list[int]:
+    resposta = cliente.get(rota, params=params)
+    assert resposta.status_code == 200
+    return [item["id"] for item in resposta.json()["items"]]
+
+
+def test_paginas_acompanham_insercoes_e_remocoes(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    ids = [
+        cliente.post(
+            "/api/v1/salas/",
+            json={"nome": f"Sala {numero}", "capacidade": 5},
+            headers=cabecalhos,
+        ).json()["id"]
+        for numero in range(5)
+    ]
+
+    assert ids_da_pagina(cliente, "/admin/api/sala", skip=0, limit=2) == [
+        ids[4],
+        ids[3],
+    ]
+    assert ids_da_pagina(cliente, "/admin/api/sala", skip=2, limit=2) == [
+        ids[2],
+        ids[1],
+    ]
+
+    cliente.delete(f"/api/v1/salas/{ids[4]}", headers=cabecalhos)
+
+    assert ids_da_pagina(cliente, "/admin/api/sala", skip=2, limit=2) == [
+        ids[1],
+        ids[0],
+    ]
+
+    nova = cliente.post(
+        "/api/v1/salas/",
+        json={"nome": "Sala nova", "capacidade": 5},
+        headers=cabecalhos,
+    ).json()["id"]
+
+    assert ids_da_pagina(cliente, "/admin/api/sala", skip=2, limit=2) == [
+        ids[2],
+        ids[1],
+    ]
+    assert ids_da_pagina(cliente, "/admin/api/sala", skip=0, limit=1) == [nova]
+
+
+def test_pagina_com_busca_e_ordem_crescente(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    for numero in range(4):
+        cliente.post(
+            "/api/v1/salas/",
+            json={"nome": f"Sala {numero % 2}", "capacidade": 5},
+            headers=cabecalhos,
+        )
+
+    assert ids_da_pagina(
+        cliente,
+        "/admin/api/sala",
+        skip=1,
+        limit=5,
+        where="Sala 1",
+        order_by="id asc",
+    ) == [4]
+    assert ids_da_pagina(cliente, "/admin/api/sala", skip=9, limit=2) == []
@@ -0,0 +1,83 @@
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from src.disponibilidade import IndiceDisponibilidade, indice
+
+FabricaReserva = Callable[..., dict[str, Any]]
+
+
+def test_indice_registra_e_remove() -> None:
+    indice_salas = IndiceDisponibilidade()
+    inicio = datetime(2030, 1, 2, 10)
+    fim = datetime(2030, 1, 2, 11)
+
+    indice_salas.registrar_intervalo(1, 7, inicio, fim)
+
+    assert not indice_salas.livre(7, inicio, fim)
+    assert not indice_salas.livre(7, datetime(2030, 1, 2, 10, 30), fim)
+    assert indice_salas.livre(7, fim, datetime(2030, 1, 2, 12))
+    assert indice_salas.livre(8, inicio, fim)
+
+    indice_salas.remover(1)
+
+    assert indice_salas.livre(7, inicio, fim)
+
+
+def test_indice_move_reserva_registrada_de_novo() -> None:
+    indice_salas = IndiceDisponibilidade()
+    indice_salas.registrar_intervalo(
+        1, 7, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11)
+    )
+    indice_salas.registrar_intervalo(
+        1, 7, datetime(2030, 1, 2, 14), datetime(2030, 1, 2, 15)
+    )
+
+    assert indice_salas.livre(
+        7, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11)
+    )
+    assert not indice_salas.livre(
+        7, datetime(2030, 1, 2, 14), datetime(2030, 1, 2, 15)
+    )
+
+
+def test_disponiveis_acompanha_reservas_da_api(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+) -> None:
+    resposta = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-02T10:00:00Z", "2030-01-02T11:00:00Z"),
+        headers=cabecalhos,
+    )
+    assert resposta.status_code == 200
+    id_reserva = resposta.json()["id"]
+    assert id_reserva in indice.reservas
+
+    # Com fuso, 07:30-03:00 e 10:30 em UTC, dentro da reserva
+    ocupada = cliente.get(
+        "/api/v1/salas/disponiveis",
+        params={
+            "data_inicial": "2030-01-02T07:30:00-03:00",
+            "data_final": "2030-01-02T08:30:00-03:00",
+        },
+        headers=cabecalhos,
+    )
+    assert ocupada.status_code == 200
+    assert ocupada.json()["payload"] == "Nenhuma sala disponível"
+
+    cliente.delete(f"/api/v1/reservas/{id_reserva}", headers=cabecalhos)
+    assert id_reserva not in indice.reservas
+
+    livre = cliente.get(
+        "/api/v1/salas/disponiveis",
+        params={
+            "data_inicial": "2030-01-02T07:30:00-03:00",
+            "data_final": "2030-01-02T08:30:00-03:00",
+        },
+        headers=cabecalhos,
+    )
+    assert [sala["nome"] for sala in livre.json()] == ["Auditorio"]
@@ -0,0 +1,106 @@
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from src.database import engine
+from src.models import ContadorAlteracoes, Sala
+
+
+def test_listagem_responde_304_com_o_mesmo_etag(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    primeira = cliente.get("/api/v1/reservas/", headers=cabecalhos)
+    etag = primeira.headers["ETag"]
+
+    repetida = cliente.get(
+        "/api/v1/reservas/", headers=cabecalhos | {"If-None-Match": etag}
+    )
+
+    assert repetida.status_code == 304
+    assert repetida.headers["ETag"] == etag
+    assert repetida.content == b""
+
+
+def test_etag_muda_depois_de_uma_escrita(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    etag = cliente.get("/api/v1/reservas/", headers=cabecalhos).headers["ETag"]
+
+    cliente.patch(
+        f"/api/v1/reservas/{reserva['id']}",
+        json={"descricao": "Planejamento"},
+        headers=cabecalhos,
+    )
+    resposta = cliente.get(
+        "/api/v1/reservas/", headers=cabecalhos | {"If-None-Match": etag}
+    )
+
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] != etag
+    assert resposta.json()["items"][0]["descricao"] == "Planejamento"
+
+
+def test_etag_nao_muda_com_cadastro_de_usuario(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    etag = cliente.get("/api/v1/reservas/", headers=cabecalhos).headers["ETag"]
+
+    cliente.post(
+        "/api/v1/usuarios/registrar",
+        json={"usuario": "bia", "email": "bia@exemplo.com", "senha": "x"},
+    )
+    resposta = cliente.get(
+        "/api/v1/reservas/", headers=cabecalhos | {"If-None-Match": etag}
+    )
+
+    assert resposta.status_code == 304
+
+
+def test_etag_da_sala(
+    cliente: TestClient, cabecalhos: dict[str, str], sala: int
+) -> None:
+    etag = cliente.get(f"/api/v1/salas/{sala}", headers=cabecalhos).headers[
+        "ETag"
+    ]
+
+    resposta = cliente.get(
+        f"/api/v1/salas/{sala}", headers=cabecalhos | {"If-None-Match": etag}
+    )
+
+    assert resposta.status_code == 304
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"data_inicial": "2030-01-02T10:00:00"},
+        {"cursor": "nao-e-cursor"},
+        {"fields": "senha"},
+    ],
+)
+def test_parametros_invalidos_nao_respondem_304(
+    cliente: TestClient, cabecalhos: dict[str, str], params: dict[str, str]
+) -> None:
+    resposta = cliente.get(
+        "/api/v1/reservas/",
+        params=params,
+        headers=cabecalhos | {"If-None-Match": "*"},
+    )
+
+    assert resposta.status_code == 400
+
+
+def test_contador_muda_no_commit_da_escrita(cliente: TestClient) -> None:
+    with Session(engine) as session:
+        session.add(Sala(nome="Sala 1", capacidade=5))
+        session.commit()
+
+        contador = session.exec(
+            select(ContadorAlteracoes.alteracoes).where(
+                ContadorAlteracoes.tabela == "sala"
+            )
+        ).one()
+
+    assert contador == 1
@@ -0,0 +1,136 @@
+from datetime import UTC, datetime, timedelta, timezone
+
+import pytest
+
+from src import eventos
+from src.eventos import Assinatura, BackendMemoria, Difusor
+from src.schemas import EventoReserva, PeriodoReserva
+
+
+def evento(
+    sala: int,
+    inicio: datetime,
+    fim: datetime,
+    anterior: PeriodoReserva | None = None,
+) -> EventoReserva:
+    return EventoReserva(
+        tipo="editada" if anterior else "criada",
+        id=1,
+        sala_reservada=sala,
+        data_inicial=inicio,
+        data_final=fim,
+        anterior=anterior,
+    )
+
+
+@pytest.fixture
+def difusor() -> Difusor:
+    return Difusor(BackendMemoria())
+
+
+def test_filtra_por_sala_e_periodo(difusor: Difusor) -> None:
+    da_sala = difusor.assinar([1])
+    do_periodo = difusor.assinar(
+        [], datetime(2030, 1, 2, 9), datetime(2030, 1, 2, 12)
+    )
+    outra_sala = difusor.assinar([2])
+
+    difusor.distribuir(
+        evento(1, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11))
+    )
+    difusor.distribuir(
+        evento(1, datetime(2030, 1, 2, 12), datetime(2030, 1, 2, 13))
+    )
+
+    assert da_sala.fila.qsize() == 2
+    assert do_periodo.fila.qsize() == 1
+    assert outra_sala.fila.empty()
+
+
+def test_edicao_avisa_quem_acompanhava_o_lugar_antigo(
+    difusor: Difusor,
+) -> None:
+    antiga = difusor.assinar([2])
+    anterior = PeriodoReserva(
+        sala_reservada=2,
+        data_inicial=datetime(2030, 1, 2, 10),
+        data_final=datetime(2030, 1, 2, 11),
+    )
+
+    difusor.distribuir(
+        evento(1, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11), anterior)
+    )
+
+    assert antiga.fila.qsize() == 1
+
+
+def test_janela_com_fuso_e_comparada_em_utc(difusor: Difusor) -> None:
+    fuso = timezone(timedelta(hours=-3))
+    assinatura = difusor.assinar(
+        [],
+        datetime(2030, 1, 2, 7, tzinfo=fuso),
+        datetime(2030, 1, 2, 8, tzinfo=fuso),
+    )
+
+    difusor.distribuir(
+        evento(1, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11))
+    )
+    difusor.distribuir(
+        evento(
+            1,
+            datetime(2030, 1, 2, 7, tzinfo=UTC),
+            datetime(2030, 1, 2, 8, tzinfo=UTC),
+        )
+    )
+
+    assert assinatura.fila.qsize() == 1
+    assert assinatura.fila.get_nowait() == evento(
+        1, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11)
+    )
+
+
+def test_fila_cheia_pede_ressincronizacao(
+    difusor: Difusor, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(eventos, "EVENTOS_FILA", 2)
+    assinatura = difusor.assinar([])
+
+    for hora in range(3):
+        difusor.distribuir(
+            evento(
+                1, datetime(2030, 1, 2, hora), datetime(2030, 1, 2, hora + 1)
+            )
+        )
+
+    assert assinatura.atrasada
+    assert assinatura.fila.qsize() == 1
+    assert assinatura.fila.get_nowait() is None
+
+
+def test_falha_numa_assinatura_nao_afeta_as_outras(
+    difusor: Difusor,
+) -> None:
+    class Quebrada(Assinatura):
+        def interessada(self, evento: EventoReserva) -> bool:
+            raise RuntimeError("falha")
+
+    quebrada = Quebrada([], None, None)
+    difusor.todas_salas.add(quebrada)
+    saudavel = difusor.assinar([])
+
+    difusor.distribuir(
+        evento(1, datetime(2030, 1, 2, 10), datetime(2030, 1, 2, 11))
+    )
+
+    assert saudavel.fila.qsize() == 1
+    assert quebrada.atrasada
+    assert quebrada.fila.get_nowait() is None
+
+
+def test_cancelar_remove_a_assinatura(difusor: Difusor) -> None:
+    assinatura = difusor.assinar([1, 2])
+
+    difusor.cancelar(assinatura)
+
+    assert difusor.total == 0
+    assert not difusor.por_sala
@@ -0,0 +1,117 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import idempotencia
+
+FabricaReserva = Callable[..., dict[str, Any]]
+
+
+def test_repete_a_resposta_da_primeira_requisicao(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+) -> None:
+    corpo = nova_reserva("2030-01-02T10:00:00", "2030-01-02T11:00:00")
+    chave = cabecalhos | {"Idempotency-Key": "reserva-1"}
+
+    primeira = cliente.post("/api/v1/reservas/", json=corpo, headers=chave)
+    repetida = cliente.post("/api/v1/reservas/", json=corpo, headers=chave)
+
+    assert primeira.status_code == 200
+    assert repetida.status_code == 200
+    assert repetida.json() == primeira.json()
+    assert repetida.headers["Idempotent-Replayed"] == "true"
+    listagem = cliente.get("/api/v1/reservas/", headers=cabecalhos).json()
+    assert len(listagem["items"]) == 1
+
+
+def test_sem_chave_executa_de_novo(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+) -> None:
+    corpo = nova_reserva("2030-01-02T10:00:00", "2030-01-02T11:00:00")
+
+    cliente.post("/api/v1/reservas/", json=corpo, headers=cabecalhos)
+    repetida = cliente.post("/api/v1/reservas/", json=corpo, headers=cabecalhos)
+
+    assert repetida.status_code == 409
+
+
+def test_mesma_chave_com_outro_corpo(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+) -> None:
+    chave = cabecalhos | {"Idempotency-Key": "reserva-1"}
+    cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-02T10:00:00", "2030-01-02T11:00:00"),
+        headers=chave,
+    )
+
+    resposta = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-03T10:00:00", "2030-01-03T11:00:00"),
+        headers=chave,
+    )
+
+    assert resposta.status_code == 422
+
+
+def test_chave_de_anonimos_depende_do_corpo(cliente: TestClient) -> None:
+    chave = {"Idempotency-Key": "cadastro"}
+
+    primeira = cliente.post(
+        "/api/v1/usuarios/registrar",
+        json={"usuario": "ana", "email": "ana@exemplo.com", "senha": "x"},
+        headers=chave,
+    )
+    outra = cliente.post(
+        "/api/v1/usuarios/registrar",
+        json={"usuario": "bia", "email": "bia@exemplo.com", "senha": "y"},
+        headers=chave,
+    )
+
+    assert primeira.status_code == 200
+    assert outra.status_code == 200
+    assert "Idempotent-Replayed" not in outra.headers
+    usuarios = cliente.post(
+        "/api/v1/usuarios/registrar",
+        json={"usuario": "bia", "email": "bia@exemplo.com", "senha": "y"},
+    )
+    assert usuarios.status_code == 400
+
+
+def test_corpo_maior_que_o_maximo(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(idempotencia, "IDEMPOTENCIA_CORPO_MAXIMO", 100)
+
+    resposta = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-02T10:00:00", "2030-01-02T11:00:00"),
+        headers=cabecalhos | {"Idempotency-Key": "grande"},
+    )
+
+    assert resposta.status_code == 413
+
+
+def test_chave_invalida(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+) -> None:
+    resposta = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-02T10:00:00", "2030-01-02T11:00:00"),
+        headers=cabecalhos | {"Idempotency-Key": "x" * 256},
+    )
+
+    assert resposta.status_code == 400
@@ -0,0 +1,135 @@
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError
+
+from src import importacao
+from src.importacao import ImportadorReservas
+
+CABECALHO_CSV = (
+    "sala_reservada,data_inicial,data_final,descricao,tipo_evento,"
+    "quantidade_pessoas,items\n"
+)
+
+
+def importar(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    conteudo: str,
+    **params: Any,
+) -> Any:
+    return cliente.post(
+        "/api/v1/reservas/importar",
+        content=conteudo.encode(),
+        params=params,
+        headers=cabecalhos | {"Content-Type": "text/csv"},
+    )
+
+
+def test_importacao_relata_as_linhas_com_erro(
+    cliente: TestClient, cabecalhos: dict[str, str], sala: int
+) -> None:
+    conteudo = (
+        "\ufeff"
+        + CABECALHO_CSV
+        + f"{sala},2030-01-02T10:00:00Z,2030-01-02T11:00:00Z,a,b,1,\n"
+        + f"{sala},2030-01-02T10:30:00,2030-01-02T11:30:00,a,b,1,\n"
+        + f"{sala},2030-01-03T10:00:00,2030-01-03T09:00:00,a,b,1,\n"
+        + "1,2\n"
+        + f"{sala},ontem,hoje,a,b,1,\n"
+        + "999,2030-01-04T10:00:00,2030-01-04T11:00:00,a,b,1,\n"
+    )
+
+    resposta = importar(cliente, cabecalhos, conteudo)
+
+    assert resposta.status_code == 200
+    relatorio = resposta.json()
+    assert relatorio["inseridas"] == 1
+    assert [erro["linha"] for erro in relatorio["erros"]] == [3, 4, 5, 6, 7]
+    assert "linha 2" in relatorio["erros"][0]["erro"]
+    assert relatorio["erros_omitidos"] == 0
+
+
+def test_importacao_atomica_nao_grava_nada(
+    cliente: TestClient, cabecalhos: dict[str, str], sala: int
+) -> None:
+    conteudo = (
+        CABECALHO_CSV
+        + f"{sala},2030-01-02T10:00:00,2030-01-02T11:00:00,a,b,1,\n"
+        + f"{sala},2030-01-02T10:30:00,2030-01-02T11:30:00,a,b,1,\n"
+    )
+
+    resposta = importar(cliente, cabecalhos, conteudo, atomico=True)
+
+    assert resposta.status_code == 422
+    assert resposta.json()["inseridas"] == 0
+    listagem = cliente.get("/api/v1/reservas/", headers=cabecalhos).json()
+    assert listagem["items"] == []
+
+
+def test_importacao_limita_os_erros(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    sala: int,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(importacao, "IMPORTACAO_ERROS_MAXIMO", 2)
+    conteudo = CABECALHO_CSV + "1,2\n" * 5
+
+    relatorio = importar(cliente, cabecalhos, conteudo).json()
+
+    assert len(relatorio["erros"]) == 2
+    assert relatorio["erros_omitidos"] == 3
+
+
+def test_importacao_em_lotes(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    sala: int,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(importacao, "IMPORTACAO_LOTE", 2)
+    linhas = [
+        f"{sala},2030-01-0{dia}T10:00:00,2030-01-0{dia}T11:00:00,a,b,1,\n"
+        for dia in range(1, 6)
+    ]
+    # Conflita com uma linha gravada num lote anterior
+    linhas.append(f"{sala},2030-01-01T10:30:00,2030-01-01T11:30:00,a,b,1,\n")
+
+    relatorio = importar(cliente, cabecalhos, CABECALHO_CSV + "".join(linhas))
+
+    assert relatorio.json()["inseridas"] == 5
+    assert [erro["linha"] for erro in relatorio.json()["erros"]] == [7]
+
+
+def test_importacao_em_uma_transacao(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    sala: int,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(importacao, "IMPORTACAO_LOTE", 2)
+    inserir = ImportadorReservas.inserir
+    chamadas = 0
+
+    async def falhar_no_segundo_lote(
+        importador: ImportadorReservas, novas: list[tuple[int, dict[str, Any]]]
+    ) -> Any:
+        nonlocal chamadas
+        chamadas += 1
+        if chamadas == 2:
+            raise IntegrityError("INSERT", {}, Exception("conflito"))
+        return await inserir(importador, novas)
+
+    monkeypatch.setattr(ImportadorReservas, "inserir", falhar_no_segundo_lote)
+    linhas = [
+        f"{sala},2030-01-0{dia}T10:00:00,2030-01-0{dia}T11:00:00,a,b,1,\n"
+        for dia in range(1, 5)
+    ]
+
+    resposta = importar(cliente, cabecalhos, CABECALHO_CSV + "".join(linhas))
+
+    assert resposta.status_code == 409
+    listagem = cliente.get("/api/v1/reservas/", headers=cabecalhos).json()
+    assert listagem["items"] == []
@@ -0,0 +1,148 @@
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.paginacao import PAGINA_MAXIMA
+
+ROTAS_PAGINADAS = [
+    "/api/v1/reservas/",
+    "/api/v1/salas/",
+    "/api/v1/series/",
+    "/api/v1/usuarios/",
+    "/api/v1/usuarios/reservas",
+]
+
+
+@pytest.mark.parametrize("rota", ROTAS_PAGINADAS)
+@pytest.mark.parametrize("count", [0, -1, PAGINA_MAXIMA + 1])
+def test_count_fora_dos_limites(
+    cliente: TestClient, cabecalhos: dict[str, str], rota: str, count: int
+) -> None:
+    resposta = cliente.get(rota, params={"count": count}, headers=cabecalhos)
+
+    assert resposta.status_code == 422
+
+
+@pytest.mark.parametrize("rota", ROTAS_PAGINADAS)
+def test_count_maximo(
+    cliente: TestClient, cabecalhos: dict[str, str], rota: str
+) -> None:
+    resposta = cliente.get(
+        rota, params={"count": PAGINA_MAXIMA}, headers=cabecalhos
+    )
+
+    assert resposta.status_code == 200
+
+
+def test_skip_negativo(cliente: TestClient, cabecalhos: dict[str, str]) -> None:
+    resposta = cliente.get(
+        "/api/v1/salas/", params={"skip": -1}, headers=cabecalhos
+    )
+
+    assert resposta.status_code == 422
+
+
+def test_cursor_percorre_todas_as_paginas(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    for numero in range(7):
+        cliente.post(
+            "/api/v1/salas/",
+            json={"nome": f"Sala {numero}", "capacidade": 5},
+            headers=cabecalhos,
+        )
+
+    nomes = []
+    paginas = 0
+    params: dict[str, str | int] = {"count": 3}
+    while True:
+        pagina = cliente.get(
+            "/api/v1/salas/", params=params, headers=cabecalhos
+        ).json()
+        paginas += 1
+        nomes += [sala["nome"] for sala in pagina["items"]]
+        if pagina["next_cursor"] is None:
+            break
+        params["cursor"] = pagina["next_cursor"]
+
+    assert nomes == [f"Sala {numero}" for numero in range(7)]
+    assert paginas == 3
+
+
+def test_ultima_pagina_completa_nao_tem_cursor(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    for numero in range(3):
+        cliente.post(
+            "/api/v1/salas/",
+            json={"nome": f"Sala {numero}", "capacidade": 5},
+            headers=cabecalhos,
+        )
+
+    pagina = cliente.get(
+        "/api/v1/salas/", params={"count": 3}, headers=cabecalhos
+    ).json()
+
+    assert len(pagina["items"]) == 3
+    assert pagina["next_cursor"] is None
+
+
+def test_pagina_vazia(cliente: TestClient, cabecalhos: dict[str, str]) -> None:
+    pagina = cliente.get("/api/v1/series/", headers=cabecalhos).json()
+
+    assert pagina == {"items": [], "next_cursor": None}
+
+
+def test_cursor_invalido(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    resposta = cliente.get(
+        "/api/v1/salas/", params={"cursor": "nao-e-cursor"}, headers=cabecalhos
+    )
+
+    assert resposta.status_code == 400
+
+
+def test_skip_responde_a_lista_antiga(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    for numero in range(3):
+        cliente.post(
+            "/api/v1/salas/",
+            json={"nome": f"Sala {numero}", "capacidade": 5},
+            headers=cabecalhos,
+        )
+
+    resposta = cliente.get(
+        "/api/v1/salas/", params={"skip": 1, "count": 5}, headers=cabecalhos
+    )
+
+    assert resposta.status_code == 200
+    assert resposta.headers["Deprecation"] == "true"
+    assert [sala["nome"] for sala in resposta.json()] == ["Sala 1", "Sala 2"]
+
+
+def test_skip_nas_reservas_responde_a_lista_antiga(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    for rota, tamanho in (
+        ("/api/v1/reservas/", 3),
+        ("/api/v1/usuarios/reservas", 2),
+    ):
+        resposta = cliente.get(rota, params={"skip": 0}, headers=cabecalhos)
+
+        assert resposta.headers["Deprecation"] == "true"
+        [linha] = resposta.json()
+        assert len(linha) == tamanho
+        assert linha[0]["id"] == reserva["id"]
+        assert linha[1]["id"] == reserva["sala_reservada"]
+
+
+def test_cursor_nao_envia_deprecation(
+    cliente: TestClient, cabecalhos: dict[str, str]
+) -> None:
+    resposta = cliente.get("/api/v1/salas/", headers=cabecalhos)
+
+    assert "Deprecation" not in resposta.headers
+    assert resposta.json() == {"items": [], "next_cursor": None}
@@ -0,0 +1,175 @@
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.disponibilidade import indice
+
+FabricaReserva = Callable[..., dict[str, Any]]
+
+
+def test_patch_altera_so_os_campos_enviados(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    resposta = cliente.patch(
+        f"/api/v1/reservas/{reserva['id']}",
+        json={"descricao": "Planejamento"},
+        headers=cabecalhos,
+    )
+
+    assert resposta.status_code == 200
+    assert resposta.json() == reserva | {
+        "descricao": "Planejamento",
+        "versao": reserva["versao"] + 1,
+    }
+
+
+def test_patch_aceita_null_em_items(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    resposta = cliente.patch(
+        f"/api/v1/reservas/{reserva['id']}",
+        json={"items": None},
+        headers=cabecalhos,
+    )
+
+    assert resposta.status_code == 200
+    assert resposta.json()["items"] is None
+
+
+@pytest.mark.parametrize(
+    "campo", ["data_inicial", "data_final", "sala_reservada", "descricao"]
+)
+def test_patch_recusa_null(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    reserva: dict[str, Any],
+    campo: str,
+) -> None:
+    resposta = cliente.patch(
+        f"/api/v1/reservas/{reserva['id']}",
+        json={campo: None},
+        headers=cabecalhos,
+    )
+
+    assert resposta.status_code == 422
+    assert campo in resposta.json()["detail"][0]["msg"]
+
+
+def test_patch_valida_periodo_mesclado(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    resposta = cliente.patch(
+        f"/api/v1/reservas/{reserva['id']}",
+        json={"data_final": "2030-01-02T09:00:00"},
+        headers=cabecalhos,
+    )
+
+    assert resposta.status_code == 400
+
+
+def test_patch_com_conflito(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+    reserva: dict[str, Any],
+) -> None:
+    outra = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva("2030-01-02T12:00:00", "2030-01-02T13:00:00"),
+        headers=cabecalhos,
+    ).json()
+
+    resposta = cliente.patch(
+        f"/api/v1/reservas/{outra['id']}",
+        json={"data_inicial": "2030-01-02T10:30:00"},
+        headers=cabecalhos,
+    )
+
+    assert resposta.status_code == 409
+
+
+def formulario_admin(sala: int, inicio: str, fim: str) -> dict[str, Any]:
+    return {
+        "sala_reservada": sala,
+        "data_inicial": inicio,
+        "data_final": fim,
+        "descricao": "Reuniao",
+        "tipo_evento": "interno",
+        "quantidade_pessoas": 4,
+        "items": "",
+        "reservado_por": 1,
+    }
+
+
+def test_admin_recusa_reserva_com_conflito(
+    cliente: TestClient, reserva: dict[str, Any]
+) -> None:
+    resposta = cliente.post(
+        "/admin/reserva/create",
+        data=formulario_admin(
+            reserva["sala_reservada"],
+            "2030-01-02T10:30:00",
+            "2030-01-02T11:30:00",
+        ),
+        follow_redirects=False,
+    )
+
+    assert resposta.status_code == 422
+    assert f"pela reserva {reserva['id']}" in resposta.text
+
+
+def test_admin_edita_pela_verificacao_de_conflitos(
+    cliente: TestClient, cabecalhos: dict[str, str], reserva: dict[str, Any]
+) -> None:
+    formulario = formulario_admin(
+        reserva["sala_reservada"], "2030-01-02T12:00:00", "2030-01-02T13:00:00"
+    )
+    criada = cliente.post(
+        "/admin/reserva/create", data=formulario, follow_redirects=False
+    )
+    assert criada.status_code == 303
+    outra = cliente.get("/api/v1/reservas/", headers=cabecalhos).json()[
+        "items"
+    ][-1]
+    assert outra["id"] in indice.reservas
+
+    conflito = cliente.post(
+        f"/admin/reserva/edit/{outra['id']}",
+        data=formulario | {"data_inicial": "2030-01-02T10:45:00"},
+        follow_redirects=False,
+    )
+    editada = cliente.post(
+        f"/admin/reserva/edit/{outra['id']}",
+        data=formulario
+        | {"data_inicial": "2030-01-02T13:00:00"}
+        | {"data_final": "2030-01-02T14:00:00"},
+        follow_redirects=False,
+    )
+
+    assert conflito.status_code == 422
+    assert editada.status_code == 303
+    assert indice.reservas[outra["id"]][1] == datetime(2030, 1, 2, 13)
+
+
+def test_reserva_com_fuso_e_gravada_em_utc(
+    cliente: TestClient,
+    cabecalhos: dict[str, str],
+    nova_reserva: FabricaReserva,
+) -> None:
+    resposta = cliente.post(
+        "/api/v1/reservas/",
+        json=nova_reserva(
+            "2030-01-02T10:00:00+02:00", "2030-01-02T11:00:00+02:00"
+        ),
+        headers=cabecalhos,
+    )
+
+    assert resposta.status_code == 200
+    assert resposta.json()["data_inicial"] == "2030-01-02T08:00:00"
+    assert indice.reservas[resposta.json()["id"]][1:] == (
+        datetime(2030, 1, 2, 8),
+        datetime(2030, 1, 2, 9),
+    )
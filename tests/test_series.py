@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+
+from src.paginacao import PAGINA_MAXIMA
+
+
+def test_cursor_na_listagem_por_periodo_com_series(
+    cliente: TestClient, cabecalhos: dict[str, str], sala: int
+) -> None:
+    comum = {
+        "sala_reservada": sala,
+        "descricao": "Reuniao",
+        "tipo_evento": "interno",
+        "quantidade_pessoas": 4,
+        "items": "",
+    }
+    cliente.post(
+        "/api/v1/series/",
+        json=comum
+        | {
+            "data_inicial": "2030-01-01T10:00:00",
+            "data_final": "2030-01-01T11:00:00",
+            "intervalo_dias": 1,
+            "repetir_ate": "2030-02-01T00:00:00",
+        },
+        headers=cabecalhos,
+    )
+    for dia in range(1, 10, 2):
+        cliente.post(
+            "/api/v1/reservas/",
+            json=comum
+            | {
+                "data_inicial": f"2030-01-{dia:02}T14:00:00",
+                "data_final": f"2030-01-{dia:02}T15:00:00",
+            },
+            headers=cabecalhos,
+        )
+    periodo = {
+        "data_inicial": "2030-01-03T00:00:00",
+        "data_final": "2030-01-10T00:00:00",
+        "fields": "data_inicial",
+    }
+
+    completa = cliente.get(
+        "/api/v1/reservas/",
+        params=periodo | {"count": PAGINA_MAXIMA},
+        headers=cabecalhos,
+    ).json()["items"]
+
+    vistos = []
+    params: dict[str, str | int] = periodo | {"count": 2}
+    while True:
+        pagina = cliente.get(
+            "/api/v1/reservas/", params=params, headers=cabecalhos
+        ).json()
+        vistos += pagina["items"]
+        if pagina["next_cursor"] is None:
+            break
+        params["cursor"] = pagina["next_cursor"]
+
+    # Sete ocorrencias da serie e as reservas dos dias 3, 5, 7 e 9
+    assert len(completa) == 11
+    assert vistos == completa